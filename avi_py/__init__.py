@@ -1,13 +1,22 @@
 """avi_py."""
 __version__ = "0.3"
 __author__ = "Benjamin Barber (bbarber@bpl.org)"
-#pylint: disable=wrong-import-position
 import logging
-import dill as pickle
+from typing import TYPE_CHECKING
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-from .entry_points import convert_jp2_main, ffmpeg_thumbnail_main, ffmpeg_mp3_main, tesseract_ocr_main
+if TYPE_CHECKING:
+    from .entry_points import convert_jp2_main, jp2_preflight_main, ffmpeg_thumbnail_main, ffmpeg_contact_sheet_main, ffmpeg_mp3_main, tesseract_ocr_main, avi_service_main, avi_client_main
 
-__all__ = ['convert_jp2_main', 'ffmpeg_thumbnail_main', 'ffmpeg_mp3_main', 'tesseract_ocr_main']
-#pylint: enable=wrong-import-position
+__all__ = ['convert_jp2_main', 'jp2_preflight_main', 'ffmpeg_thumbnail_main', 'ffmpeg_contact_sheet_main', 'ffmpeg_mp3_main', 'tesseract_ocr_main', 'avi_service_main', 'avi_client_main']
+
+def __getattr__(name: str):
+    # Entry points are looked up on first use so importing avi_py doesn't import entry_points and the processors
+    if name in __all__:
+        from . import entry_points #pylint: disable=import-outside-toplevel
+        return getattr(entry_points, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -12,9 +12,11 @@ class AviAudioData(AviFFProbeData):
     Class for storing all low level video data for functions that are used for
     creating video deriavtives with FFMpeg
     """
-    def __init__(self, audio_src_path: Union[str, Path]) -> None:
+    def __init__(self, audio_src_path: Union[str, Path],
+                       use_cache: bool=avi_const.FFPROBE_CACHE_ENABLED,
+                       lazy: bool=False) -> None:
         self.audio_src_path = audio_src_path
-        super().__init__(audio_src_path)
+        super().__init__(audio_src_path, use_cache, lazy)
 
     @property
     def audio_src_path(self) -> Path:
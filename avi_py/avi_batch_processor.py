@@ -0,0 +1,166 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import errno
+import logging
+from pathlib import Path
+from typing import Union, List, Tuple, Optional, Iterator, Callable
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from . import constants as avi_const
+from .avi_memory_budget import AviMemoryBudget
+
+#pylint: disable=missing-class-docstring
+class AviBatchProcessorError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+# Jobs waiting to be admitted for each worker, estimated ahead of the ones running
+REQUEST_WINDOW = 2
+
+def read_manifest(manifest_path: Union[str, Path], valid_extensions: List[str]) -> List[Tuple[Path, Optional[Path]]]:
+    """
+    Reads a batch manifest. If manifest_path is a directory every file in it with one of the valid_extensions,
+    in any case, is returned. Otherwise every non blank line that does not start with # is a source path optionally followed
+    by a tab and a destination path.
+    """
+    if not isinstance(manifest_path, Path):
+        manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), str(manifest_path))
+    if manifest_path.is_dir():
+        return [(src_path, None) for src_path in sorted(manifest_path.iterdir())
+                if src_path.is_file() and src_path.suffix.lower() in valid_extensions]
+
+    entries = []
+    with open(manifest_path, 'r', encoding='utf-8') as manifest:
+        for line in manifest:
+            line = line.rstrip('\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            src_path, _, dest_path = line.partition('\t')
+            entries.append((Path(src_path.strip()), Path(dest_path.strip()) if dest_path.strip() else None))
+    return entries
+
+def threads_per_worker(pool_size: int) -> int:
+    """
+    Threads each of pool_size concurrent workers should use so together they don't oversubscribe the cpus
+    """
+    return max(1, os.cpu_count() // max(1, pool_size))
+
+class AviBatchProcessor:
+    """
+    Base class that runs one of the avi_py processors over many source files on a single, bounded process pool
+    and streams back one result dict per file as each one finishes. Jobs are only started while their estimated
+    memory fits in memory_budget, see :class:`~avi_py.avi_memory_budget.AviMemoryBudget`
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, jobs: List[Tuple[Path, Optional[Path]]], max_workers: int=avi_const.MAX_CONCURRENCY,
+                       memory_budget: int=avi_const.MEMORY_BUDGET_BYTES) -> None:
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget
+        self.success_count = 0
+        self.failure_count = 0
+
+    @property
+    def jobs(self) -> List[Tuple[Path, Optional[Path]]]:
+        return self.__jobs
+
+    @jobs.setter
+    def jobs(self, jobs: List[Tuple[Path, Optional[Path]]]) -> None:
+        self.__jobs = list(jobs)
+
+    @property
+    def max_workers(self) -> int:
+        return self.__max_workers
+
+    @max_workers.setter
+    def max_workers(self, max_workers: int) -> None:
+        if max_workers < 1:
+            raise AviBatchProcessorError(f'max_workers must be at least 1 not {max_workers}')
+        self.__max_workers = max(1, min(max_workers, len(self.jobs)))
+
+    @property
+    def memory_budget(self) -> int:
+        return self.__memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, memory_budget: int) -> None:
+        if memory_budget < 0:
+            raise AviBatchProcessorError(f'memory_budget must not be negative not {memory_budget}')
+        self.__memory_budget = memory_budget
+
+    @property
+    def success(self) -> bool:
+        return self.failure_count == 0
+
+    @property
+    def result(self) -> dict:
+        return { 'success': self.success, 'message': self.result_message }
+
+    @property
+    def result_message(self) -> str:
+        total = self.success_count + self.failure_count
+        return f'{self.success_count} of {total} files processed successfully'
+
+    def iter_results(self) -> Iterator[dict]:
+        """
+        Runs every job and yields each result as soon as its worker returns. Results are not in manifest order.
+        A job is only submitted once a worker is free and its estimated memory fits in the budget. Jobs are estimated
+        as they come up, REQUEST_WINDOW per worker ahead of the running ones, so the pool starts without waiting on all of them
+        """
+        budget = AviMemoryBudget(self.memory_budget, max_running=self.max_workers)
+        next_index = 0
+        initializer, initargs = self._worker_initializer()
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=initializer, initargs=initargs) as executor:
+            futures = {}
+            while futures or budget.waiting_count or next_index < len(self.jobs):
+                while next_index < len(self.jobs) and budget.waiting_count < self.max_workers * REQUEST_WINDOW:
+                    budget.request(next_index, self._job_memory(self.jobs[next_index][0]))
+                    next_index += 1
+                for job_index in budget.admit():
+                    futures[executor.submit(*self._job_args(*self.jobs[job_index]))] = job_index
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_index = futures.pop(future)
+                    budget.release(job_index)
+                    yield self.__count_result(future, self.jobs[job_index][0])
+
+    def __count_result(self, future, src_path: Path) -> dict:
+        try:
+            result = future.result()
+        except Exception as ex: #pylint: disable=broad-except
+            result = { 'success': False, 'message': f'{ex.__class__.__name__} {ex}', 'src_file_path': str(src_path) }
+        if result.get('success'):
+            self.success_count += 1
+        else:
+            self.failure_count += 1
+        return result
+
+    def process_all(self) -> List[dict]:
+        return list(self.iter_results())
+
+    def _job_args(self, src_path: Path, dest_path: Optional[Path]) -> tuple:
+        """
+        Returns the picklable (function, *args) tuple that is submitted to the pool for a single job
+        """
+        raise NotImplementedError
+
+    def _job_memory(self, src_path: Path) -> int: #pylint: disable=unused-argument
+        """
+        Estimated peak memory in bytes of the job for src_path, read in this process before the job is submitted
+        """
+        return avi_const.JOB_BASE_MEMORY_BYTES
+
+    def _worker_initializer(self) -> Tuple[Optional[Callable], tuple]:
+        """
+        Returns the picklable (initializer, initargs) run once in each pool worker when it starts
+        """
+        return None, ()
+
+__all__ = ['AviBatchProcessor', 'AviBatchProcessorError', 'read_manifest', 'threads_per_worker']
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import Union, Optional
+
+from . import constants as avi_const
+
+SIDECAR_VERSION = 1
+
+@lru_cache(maxsize=None)
+def tool_version(*version_cmd: str) -> str:
+    """
+    The first line mentioning a version in the output of version_cmd (eg. ffmpeg -version). Cached per process.
+    Returns unknown if the tool can't be run so a missing tool never matches a recorded version
+    """
+    try:
+        version_run = subprocess.run(list(version_cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60, check=False)
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+    lines = [line.strip() for line in version_run.stdout.decode('utf-8', errors='replace').splitlines() if line.strip()]
+    return next((line for line in lines if 'version' in line.lower()), lines[0] if lines else 'unknown')
+
+def file_digest(file_path: Union[str, Path], chunk_size: int=avi_const.INCREMENTAL_HASH_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AviDerivativeSidecar:
+    """
+    Small json record kept next to a derivative (.<derivative name>.avi.json) describing what it was built from:
+    the source size, mtime and sha256, the encoder settings and the tool versions. A derivative is current while all
+    of those still match and the derivative itself hasn't been replaced. A source whose mtime changed but whose content
+    hash didn't (eg. after a copy) is still current and its record is refreshed
+    """
+    def __init__(self, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], settings: dict, tools: dict,
+                       hash_source: bool=avi_const.INCREMENTAL_HASH_SOURCE) -> None:
+        self.src_file_path = Path(src_file_path)
+        self.dest_file_path = Path(dest_file_path)
+        # round trip through json so tuples etc. compare equal to what is read back
+        self.settings = json.loads(json.dumps(settings))
+        self.tools = json.loads(json.dumps(tools))
+        self.hash_source = hash_source
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.dest_file_path.parent / f'.{self.dest_file_path.name}{avi_const.SIDECAR_SUFFIX}'
+
+    def read(self) -> Optional[dict]:
+        try:
+            with open(self.sidecar_path, 'r', encoding='utf-8') as sidecar_file:
+                return json.load(sidecar_file)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self) -> bool:
+        record = self.read()
+        if record is None or record.get('version') != SIDECAR_VERSION:
+            return False
+        if record.get('settings') != self.settings or record.get('tools') != self.tools:
+            return False
+        if not self.src_file_path.is_file() or not self.dest_file_path.is_file():
+            return False
+        return record.get('derivative') == self.__stat_record(self.dest_file_path) and self.__source_matches(record)
+
+    def write(self, details: Optional[dict]=None, source_sha256: Optional[str]=None) -> None:
+        """
+        Records the derivative as built from the current source. details is stored as is and returned by read
+        """
+        src_record = self.__stat_record(self.src_file_path)
+        if self.hash_source:
+            src_record['sha256'] = source_sha256 if source_sha256 is not None else file_digest(self.src_file_path)
+        record = {
+            'version': SIDECAR_VERSION,
+            'source': src_record,
+            'settings': self.settings,
+            'tools': self.tools,
+            'derivative': self.__stat_record(self.dest_file_path),
+            'created': time.time(),
+        }
+        if details:
+            record['details'] = details
+        # write then rename so an interrupted run never leaves a half written record
+        with tempfile.NamedTemporaryFile('w', dir=str(self.sidecar_path.parent), prefix=self.sidecar_path.name,
+                                         suffix='.tmp', delete=False, encoding='utf-8') as temp_sidecar:
+            json.dump(record, temp_sidecar)
+        os.replace(temp_sidecar.name, self.sidecar_path)
+
+    def remove(self) -> None:
+        if self.sidecar_path.exists():
+            self.sidecar_path.unlink()
+
+    def __source_matches(self, record: dict) -> bool:
+        src_record = self.__stat_record(self.src_file_path)
+        recorded_src = record.get('source', {})
+        if {key: recorded_src.get(key) for key in src_record} == src_record:
+            return True
+        if not self.hash_source or recorded_src.get('size') != src_record['size'] or 'sha256' not in recorded_src:
+            return False
+        if file_digest(self.src_file_path) != recorded_src['sha256']:
+            return False
+        self.write(record.get('details'), source_sha256=recorded_src['sha256'])
+        return True
+
+    @staticmethod
+    def __stat_record(file_path: Path) -> dict:
+        file_stat = file_path.stat()
+        return { 'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns }
+
+__all__ = ['AviDerivativeSidecar', 'tool_version', 'file_digest']
@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import time
+import select
+import logging
+import threading
+import subprocess
+import multiprocessing.util
+from typing import Optional
+
+from . import constants as avi_const
+
+#pylint: disable=missing-class-docstring
+class AviExiftoolError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+class AviExiftool:
+    """
+    A long lived exiftool -stay_open True -@ - process. Each execute writes the arguments one per line followed by
+    -executeN and reads the output up to exiftool's {readyN} marker, so Perl and exiftool are only loaded once.
+    stderr is merged into stdout and a command fails if exiftool printed an Error line, like a non zero exit status
+    from a one off exiftool. A process that times out, dies or can't be written to is killed and started again on the
+    next execute
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, exiftool_path: str='exiftool', timeout: float=avi_const.EXIFTOOL_TIMEOUT) -> None:
+        self.exiftool_path = exiftool_path
+        self.timeout = timeout
+        self._process = None
+        self._command_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self.running else None
+
+    def execute(self, *args: str) -> str:
+        """
+        Runs one exiftool command and returns its output. Raises AviExiftoolError if it reported an error
+        """
+        with self._lock:
+            if not self.running:
+                self.__start()
+            self._command_count += 1
+            marker = f'{{ready{self._command_count}}}'.encode('utf-8')
+            command = '\n'.join(list(args) + [f'-execute{self._command_count}']) + '\n'
+            try:
+                self._process.stdin.write(command.encode('utf-8'))
+                self._process.stdin.flush()
+                output = self.__read_until(marker).decode('utf-8', errors='replace')
+            except (OSError, AviExiftoolError) as ex:
+                self.__kill()
+                raise AviExiftoolError(f'exiftool process failed running {" ".join(args)}: {ex}') from ex
+        errors = [line.strip() for line in output.splitlines() if line.strip().startswith('Error')]
+        if errors:
+            raise AviExiftoolError('\n'.join(errors))
+        return output
+
+    def close(self) -> None:
+        """
+        Asks exiftool to exit, killing it if it doesn't within timeout
+        """
+        with self._lock:
+            if not self.running:
+                self._process = None
+                return
+            try:
+                self._process.stdin.write(b'-stay_open\nFalse\n')
+                self._process.stdin.flush()
+                self._process.stdin.close()
+                self._process.wait(timeout=self.timeout)
+                self._process.stdout.close()
+                self._process = None
+            except (OSError, subprocess.TimeoutExpired):
+                self.__kill()
+
+    def __start(self) -> None:
+        self.logger.debug('Starting persistent exiftool process {}'.format(self.exiftool_path))
+        self._process = subprocess.Popen([self.exiftool_path, '-stay_open', 'True', '-@', '-'], #pylint: disable=consider-using-with
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self._command_count = 0
+
+    def __read_until(self, marker: bytes) -> bytes:
+        stdout_fd = self._process.stdout.fileno()
+        deadline = time.monotonic() + self.timeout
+        output = b''
+        while not output.rstrip().endswith(marker):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AviExiftoolError(f'no response after {self.timeout} seconds')
+            readable, _, _ = select.select([stdout_fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(stdout_fd, 65536)
+            if not chunk:
+                raise AviExiftoolError(f'exiftool exited with {self._process.wait()}')
+            output += chunk
+        return output.rstrip()[:-len(marker)]
+
+    def __kill(self) -> None:
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            for pipe in [self._process.stdin, self._process.stdout]:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+        self._process = None
+
+_shared_exiftools = {}
+
+def _close_shared_exiftools() -> None:
+    for exiftool in _shared_exiftools.values():
+        exiftool.close()
+    _shared_exiftools.clear()
+
+def shared_exiftool(exiftool_path: str='exiftool') -> AviExiftool:
+    """
+    The persistent exiftool for this process. Forked workers start their own instead of sharing the parent's pipes.
+    It is closed when the process exits, including pool workers which skip regular atexit handlers
+    """
+    key = (os.getpid(), exiftool_path)
+    exiftool: Optional[AviExiftool] = _shared_exiftools.get(key)
+    if exiftool is None:
+        if not any(shared_key[0] == os.getpid() for shared_key in _shared_exiftools):
+            # inherited entries belong to the parent, drop them without touching its processes
+            _shared_exiftools.clear()
+            multiprocessing.util.Finalize(None, _close_shared_exiftools, exitpriority=10)
+        exiftool = _shared_exiftools[key] = AviExiftool(exiftool_path)
+    return exiftool
+
+__all__ = ['AviExiftool', 'AviExiftoolError', 'shared_exiftool']
@@ -2,17 +2,20 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import annotations
 
+import io
 import json
-import tempfile
 import logging
-from typing import Union
+from typing import Union, Dict, Tuple, Optional
 from pathlib import Path
 
 import ffmpeg
 
+import PIL
 from PIL import Image
 
 from . import constants as avi_const
+from .avi_derivative_sidecar import AviDerivativeSidecar, tool_version
+from .avi_metrics import AviStageTimer, file_size, record_prometheus_metrics
 from .avi_video_data import AviVideoData
 from .avi_audio_data import AviAudioData
 
@@ -21,34 +24,96 @@ class AviFFMpegProcessorError(Exception):
     pass
 #pylint: enable=missing-class-docstring
 
+# Settings recorded in each derivative type's sidecar for incremental runs
+_DERIVATIVE_SETTINGS = {
+    'thumbnail': {'size': avi_const.FFMPEG_THUMBNAIL_SIZE},
+    'contact_sheet': {},
+    'mp3': {'audio_args': avi_const.FFMPEG_AUDIO_ARGS},
+    'waveform': {'size': avi_const.FFMPEG_WAVEFORM_SIZE},
+}
+
+def _derivative_outputs(src_path: str, derivative_paths: Dict[str, str], ss_time: Optional[float]=None,
+                        keyframe_seek: bool=False) -> ffmpeg.nodes.OutputStream:
+    """
+    The merged ffmpeg outputs of every derivative in derivative_paths. The thumbnail reads its own input of src_path
+    seeked to ss_time, so ffmpeg seeks there instead of decoding every frame before it, while the audio outputs read
+    the source from the start. Input side seeking is frame exact unless keyframe_seek, which also only decodes keyframes
+    """
+    ffmpeg_outputs = []
+    if 'thumbnail' in derivative_paths:
+        thumbnail_input = ffmpeg.input(src_path, ss=ss_time, **(avi_const.FFMPEG_KEYFRAME_INPUT_ARGS if keyframe_seek else {}))
+        ffmpeg_outputs.append(thumbnail_input.video
+            .filter('scale', -1, 360, force_original_aspect_ratio='decrease')
+            .output('pipe:', vframes=1, **avi_const.FFMPEG_FRAME_PIPE_ARGS))
+    if 'mp3' in derivative_paths or 'waveform' in derivative_paths:
+        audio_input = ffmpeg.input(src_path)
+        if 'mp3' in derivative_paths:
+            ffmpeg_outputs.append(audio_input.audio.output(derivative_paths['mp3'], **avi_const.FFMPEG_AUDIO_ARGS))
+        if 'waveform' in derivative_paths:
+            ffmpeg_outputs.append(audio_input.audio
+                .filter('showwavespic', s=avi_const.FFMPEG_WAVEFORM_SIZE)
+                .output(derivative_paths['waveform'], vframes=1))
+    return ffmpeg.merge_outputs(*ffmpeg_outputs).overwrite_output()
+
 class AviFFMpegProcessor:
     """
     Class that checks and converts a source video file thumbnail derivative
     """
-    def __init__(self, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=True) -> None:
+    def __init__(self, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=True,
+                       incremental: bool=avi_const.INCREMENTAL) -> None:
+        self.timer = AviStageTimer()
         self.success = False
+        self.skipped = False
         self.result_message = ''
+        self.incremental = incremental
         self.dest_file_path = dest_file_path
+        self.derivative_paths = {}
+        self.contact_sheet_layout = {}
         if is_video:
-            self.video_data = AviVideoData(src_file_path)
+            self.video_data = AviVideoData(src_file_path, lazy=True)
             self.audio_data = None
         else:
-            self.audio_data = AviAudioData(src_file_path)
+            self.audio_data = AviAudioData(src_file_path, lazy=True)
             self.video_data = None
         self.logger = logging.getLogger('avi_py')
 
     @classmethod
-    def process_thumbnail(cls, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=True) -> AviFFMpegProcessor:
-        ffmpeg_processor = cls(src_file_path, dest_file_path, is_video)
-        ffmpeg_processor.generate_thumbnail()
+    def process_thumbnail(cls, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=True,
+                          keyframe_seek: bool=avi_const.FFMPEG_KEYFRAME_SEEK,
+                          incremental: bool=avi_const.INCREMENTAL) -> AviFFMpegProcessor:
+        ffmpeg_processor = cls(src_file_path, dest_file_path, is_video, incremental)
+        ffmpeg_processor.generate_thumbnail(keyframe_seek)
         return ffmpeg_processor
 
     @classmethod
-    def process_mp3(cls, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=False) -> AviFFMpegProcessor:
-        ffmpeg_processor = cls(src_file_path, dest_file_path, is_video)
+    def process_contact_sheet(cls, src_file_path: Union[str, Path], dest_file_path: Union[str, Path],
+                              grid: Tuple[int, int]=avi_const.FFMPEG_CONTACT_SHEET_GRID,
+                              tile_width: int=avi_const.FFMPEG_CONTACT_SHEET_TILE_WIDTH,
+                              keyframe_seek: bool=True,
+                              incremental: bool=avi_const.INCREMENTAL) -> AviFFMpegProcessor:
+        ffmpeg_processor = cls(src_file_path, dest_file_path, True, incremental)
+        ffmpeg_processor.generate_contact_sheet(grid, tile_width, keyframe_seek)
+        return ffmpeg_processor
+
+    @classmethod
+    def process_mp3(cls, src_file_path: Union[str, Path], dest_file_path: Union[str, Path], is_video: bool=False,
+                    incremental: bool=avi_const.INCREMENTAL) -> AviFFMpegProcessor:
+        ffmpeg_processor = cls(src_file_path, dest_file_path, is_video, incremental)
         ffmpeg_processor.generate_mp3()
         return ffmpeg_processor
 
+    @classmethod
+    def process_derivatives(cls, src_file_path: Union[str, Path], derivative_paths: Dict[str, Union[str, Path]], is_video: bool=True,
+                            keyframe_seek: bool=avi_const.FFMPEG_KEYFRAME_SEEK,
+                            incremental: bool=avi_const.INCREMENTAL) -> AviFFMpegProcessor:
+        """
+        Generates every derivative in derivative_paths (keys from FFMPEG_DERIVATIVE_TYPES) from a single ffmpeg run.
+        With incremental only the derivatives that aren't up to date are part of that run
+        """
+        ffmpeg_processor = cls(src_file_path, next(iter(derivative_paths.values()), ''), is_video, incremental)
+        ffmpeg_processor.generate_derivatives(derivative_paths, keyframe_seek)
+        return ffmpeg_processor
+
     @property
     def result_message(self) -> str:
         return self.__result_message
@@ -59,7 +124,28 @@ class AviFFMpegProcessor:
 
     @property
     def result(self) -> dict:
-        return { 'success': self.success, 'message': self.result_message }
+        result = { 'success': self.success, 'message': self.result_message }
+        if self.contact_sheet_layout:
+            result['contact_sheet'] = self.contact_sheet_layout
+        if self.skipped:
+            result['skipped'] = True
+        if self.timer.stopped:
+            src_path = self.video_data.video_src_path if self.video_data is not None else self.audio_data.audio_src_path
+            out_paths = list(self.derivative_paths.values()) or [self.dest_file_path]
+            result.update({
+                'timings': self.timer.timings(),
+                'input_bytes': file_size(src_path),
+                'output_bytes': sum(file_size(out_path) for out_path in out_paths) if self.success else 0,
+            })
+        return result
+
+    @property
+    def incremental(self) -> bool:
+        return self.__incremental
+
+    @incremental.setter
+    def incremental(self, incremental: bool) -> None:
+        self.__incremental = incremental
 
     @property
     def dest_file_path(self) -> str:
@@ -71,6 +157,14 @@ class AviFFMpegProcessor:
             dest_file_path = str(dest_file_path)
         self.__dest_file_path = dest_file_path
 
+    @property
+    def derivative_paths(self) -> Dict[str, str]:
+        return self.__derivative_paths
+
+    @derivative_paths.setter
+    def derivative_paths(self, derivative_paths: Dict[str, Union[str, Path]]) -> None:
+        self.__derivative_paths = {derivative_type: str(dest_path) for derivative_type, dest_path in derivative_paths.items()}
+
     def json_result(self) -> str:
         return json.dumps(self.result)
 
@@ -80,35 +174,123 @@ class AviFFMpegProcessor:
                 raise AviFFMpegProcessorError('Source Audio Data is None. Did you mean to call generate_mp3?')
             if not self.audio_data.valid_audio_ext():
                 raise AviFFMpegProcessorError('Source audio is not a .wav')
-            self._ffmpeg_mp3()
+            sidecar = self.__current_sidecar('mp3', self.dest_file_path)
+            if self.skipped:
+                return
+            with self.timer.stage('ffmpeg'):
+                self._ffmpeg_mp3()
+            self.__write_sidecar(sidecar)
             self.__set_success_result()
         except AviFFMpegProcessorError as avi_ex:
             msg = str(avi_ex)
             self.__set_error_result(msg)
             self.logger.error('Error Occured processing file for ffmpeg audio mp3 derivative!')
             self.logger.error('Check result and logs to see additional details')
+        finally:
+            self.__record_timings('mp3')
 
-    def generate_thumbnail(self) -> None:
+    def generate_thumbnail(self, keyframe_seek: bool=avi_const.FFMPEG_KEYFRAME_SEEK) -> None:
         try:
             if self.video_data is None:
                 raise AviFFMpegProcessorError('Source Video Data is None. Did you mean to call generate_mp3?')
             if not self.video_data.valid_video_ext():
                 raise AviFFMpegProcessorError('Source video is not a .mov or .mp4')
-            with tempfile.NamedTemporaryFile(prefix='avi_py-ffmpeg-thumb_', suffix='.jpg') as ffmpeg_jpeg:
-                self._ffmpeg_thumbnail(ffmpeg_jpeg.name)
+            sidecar = self.__current_sidecar('thumbnail', self.dest_file_path, keyframe_seek)
+            if self.skipped:
+                return
+            self.__probe_stage('ss_time')
+            self._ffmpeg_thumbnail(keyframe_seek)
+            self.__write_sidecar(sidecar)
             self.__set_success_result()
         except AviFFMpegProcessorError as avi_ex:
             msg = str(avi_ex)
             self.__set_error_result(msg)
             self.logger.error('Error Occured processing file for ffmpeg video thumbnail derivative!')
             self.logger.error('Check result and logs to see additional details')
+        finally:
+            self.__record_timings('thumbnail')
 
-    def _ffmpeg_thumbnail(self, out_file_path: str) -> None:
+    def generate_contact_sheet(self, grid: Tuple[int, int]=avi_const.FFMPEG_CONTACT_SHEET_GRID,
+                               tile_width: int=avi_const.FFMPEG_CONTACT_SHEET_TILE_WIDTH,
+                               keyframe_seek: bool=True) -> None:
         try:
-            self.__ffmpeg_downscale_screen_grab(out_file_path)
-            with Image.open(out_file_path) as ffmpeg_jpg_frame:
-                ffmpeg_jpg_frame.thumbnail(avi_const.FFMPEG_THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-                ffmpeg_jpg_frame.save(self.dest_file_path)
+            if self.video_data is None:
+                raise AviFFMpegProcessorError('Source Video Data is None. Did you mean to call generate_mp3?')
+            if not self.video_data.valid_video_ext():
+                raise AviFFMpegProcessorError('Source video is not a .mov or .mp4')
+            sidecar = self.__current_sidecar('contact_sheet', self.dest_file_path, keyframe_seek, grid=grid, tile_width=tile_width)
+            if self.skipped:
+                self.contact_sheet_layout = (sidecar.read() or {}).get('details', {})
+                return
+            self.__probe_stage('duration')
+            self._ffmpeg_contact_sheet(grid, tile_width, keyframe_seek)
+            self.__write_sidecar(sidecar, self.contact_sheet_layout)
+            self.__set_success_result()
+        except AviFFMpegProcessorError as avi_ex:
+            msg = str(avi_ex)
+            self.__set_error_result(msg)
+            self.logger.error('Error Occured processing file for ffmpeg video contact sheet derivative!')
+            self.logger.error('Check result and logs to see additional details')
+        finally:
+            self.__record_timings('contact_sheet')
+
+    def generate_derivatives(self, derivative_paths: Dict[str, Union[str, Path]], keyframe_seek: bool=avi_const.FFMPEG_KEYFRAME_SEEK) -> None:
+        try:
+            self.derivative_paths = derivative_paths
+            if not self.derivative_paths:
+                raise AviFFMpegProcessorError('No derivatives requested')
+            unknown_types = set(self.derivative_paths.keys()) - set(avi_const.FFMPEG_DERIVATIVE_TYPES)
+            if unknown_types:
+                raise AviFFMpegProcessorError(f'Unknown derivative types {sorted(unknown_types)}')
+            if self.video_data is not None and not self.video_data.valid_video_ext():
+                raise AviFFMpegProcessorError('Source video is not a .mov or .mp4')
+            if self.audio_data is not None and not self.audio_data.valid_audio_ext():
+                raise AviFFMpegProcessorError('Source audio is not a .wav')
+            if self.video_data is None and 'thumbnail' in self.derivative_paths:
+                raise AviFFMpegProcessorError('Thumbnails can only be generated from video sources')
+            sidecars = {}
+            requested_paths = ', '.join(self.derivative_paths.values())
+            if self.incremental:
+                with self.timer.stage('sidecar'):
+                    sidecars = {derivative_type: self.derivative_sidecar(derivative_type, dest_path, keyframe_seek)
+                                for derivative_type, dest_path in self.derivative_paths.items()}
+                    self.derivative_paths = {derivative_type: dest_path for derivative_type, dest_path in self.derivative_paths.items()
+                                             if not sidecars[derivative_type].is_current()}
+                if not self.derivative_paths:
+                    self.__set_skipped_result(f'ffmpeg derivatives at {requested_paths} are up to date. Skipped')
+                    return
+            if 'thumbnail' in self.derivative_paths:
+                self.__probe_stage('ss_time')
+            self._ffmpeg_derivatives(keyframe_seek)
+            for derivative_type in self.derivative_paths:
+                self.__write_sidecar(sidecars.get(derivative_type))
+            self.__set_success_result(f'Successfully created ffmpeg derivatives at {", ".join(self.derivative_paths.values())}')
+        except AviFFMpegProcessorError as avi_ex:
+            msg = str(avi_ex)
+            self.__set_error_result(msg)
+            self.logger.error('Error Occured processing file for ffmpeg derivatives!')
+            self.logger.error('Check result and logs to see additional details')
+        finally:
+            self.__record_timings('ffmpeg_derivatives')
+
+    def derivative_sidecar(self, derivative_type: str, dest_file_path: Union[str, Path], keyframe_seek: bool=False,
+                           **settings) -> AviDerivativeSidecar:
+        """
+        Sidecar recording the settings and the ffmpeg and pillow versions a derivative_type output is built with
+        """
+        src_path = self.video_data.video_src_path if self.video_data is not None else self.audio_data.audio_src_path
+        settings = {'type': derivative_type, **_DERIVATIVE_SETTINGS.get(derivative_type, {}), **settings}
+        if derivative_type in ('thumbnail', 'contact_sheet'):
+            settings['keyframe_seek'] = keyframe_seek
+        tools = {'ffmpeg': tool_version('ffmpeg', '-version'), 'pillow': PIL.__version__}
+        return AviDerivativeSidecar(src_path, dest_file_path, settings, tools)
+
+    def _ffmpeg_thumbnail(self, keyframe_seek: bool=False) -> None:
+        try:
+            with self.timer.stage('ffmpeg'):
+                frame_ppm = self.__ffmpeg_downscale_screen_grab(keyframe_seek)
+            with self.timer.stage('pillow'):
+                self.__save_thumbnail(frame_ppm, self.dest_file_path)
         except ffmpeg.Error as ff_ex:
             msg = 'Ffmpeg Error! {}'.format(ff_ex.stderr.decode())
             raise AviFFMpegProcessorError(msg) from ff_ex
@@ -130,18 +312,119 @@ class AviFFMpegProcessor:
             msg = f'{ex.__class__.__name__} {ex}'
             raise AviFFMpegProcessorError(msg) from ex
 
+    def _ffmpeg_contact_sheet(self, grid: Tuple[int, int], tile_width: int, keyframe_seek: bool) -> None:
+        """
+        Extracts columns * rows evenly spaced frames in a single ffmpeg pass and tiles them into one image.
+        With keyframe_seek only keyframes are decoded and the fps filter picks the nearest one for each slot
+        """
+        try:
+            columns, rows = grid
+            duration = self.video_data.duration()
+            if not duration:
+                raise AviFFMpegProcessorError('Could not determine the video duration for the contact sheet')
+            interval = duration / (columns * rows)
+            with self.timer.stage('ffmpeg'):
+                sheet_ppm, _ = ffmpeg \
+                    .input(str(self.video_data.video_src_path), ss=interval / 2,
+                           **(avi_const.FFMPEG_KEYFRAME_INPUT_ARGS if keyframe_seek else {})) \
+                    .filter('fps', fps=1 / interval) \
+                    .filter('scale', tile_width, -2) \
+                    .filter('tile', f'{columns}x{rows}') \
+                    .output('pipe:', vframes=1, **avi_const.FFMPEG_FRAME_PIPE_ARGS) \
+                    .run(capture_stdout=True, capture_stderr=True)
+            with self.timer.stage('pillow'), Image.open(io.BytesIO(sheet_ppm)) as contact_sheet:
+                contact_sheet.save(self.dest_file_path)
+                tile_height = contact_sheet.height // rows
+            self.contact_sheet_layout = {
+                'columns': columns, 'rows': rows, 'tile_width': tile_width, 'tile_height': tile_height,
+                'interval': round(interval, 3), 'offset': round(interval / 2, 3)
+            }
+        except AviFFMpegProcessorError as avi_ex:
+            raise avi_ex
+        except ffmpeg.Error as ff_ex:
+            msg = 'Ffmpeg Error! {}'.format(ff_ex.stderr.decode())
+            raise AviFFMpegProcessorError(msg) from ff_ex
+        except Exception as ex:
+            msg = f'{ex.__class__.__name__} {ex}'
+            raise AviFFMpegProcessorError(msg) from ex
 
-    def __ffmpeg_downscale_screen_grab(self, out_file_path: str) -> None:
-        ffmpeg \
-            .input(str(self.video_data.video_src_path), ss=self.video_data.ss_time()) \
+    def _ffmpeg_derivatives(self, keyframe_seek: bool=False) -> None:
+        """
+        Runs one ffmpeg command with an output per requested derivative, see _derivative_outputs.
+        The thumbnail frame is piped back over stdout
+        """
+        try:
+            if self.video_data is not None:
+                src_path = self.video_data.video_src_path
+            else:
+                src_path = self.audio_data.audio_src_path
+            ss_time = self.video_data.ss_time() if 'thumbnail' in self.derivative_paths else None
+            ffmpeg_outputs = _derivative_outputs(str(src_path), self.derivative_paths, ss_time, keyframe_seek)
+            with self.timer.stage('ffmpeg'):
+                frame_ppm, _ = ffmpeg_outputs.run(capture_stdout=True, capture_stderr=True)
+            if 'thumbnail' in self.derivative_paths:
+                with self.timer.stage('pillow'):
+                    self.__save_thumbnail(frame_ppm, self.derivative_paths['thumbnail'])
+        except ffmpeg.Error as ff_ex:
+            msg = 'Ffmpeg Error! {}'.format(ff_ex.stderr.decode())
+            raise AviFFMpegProcessorError(msg) from ff_ex
+        except Exception as ex:
+            msg = f'{ex.__class__.__name__} {ex}'
+            raise AviFFMpegProcessorError(msg) from ex
+
+    def __ffmpeg_downscale_screen_grab(self, keyframe_seek: bool=False) -> bytes:
+        input_args = avi_const.FFMPEG_KEYFRAME_INPUT_ARGS if keyframe_seek else {}
+        frame_ppm, _ = ffmpeg \
+            .input(str(self.video_data.video_src_path), ss=self.video_data.ss_time(), **input_args) \
             .filter('scale', -1, 360, force_original_aspect_ratio='decrease') \
-            .output(out_file_path, vframes=1, vcodec='mjpeg') \
-            .overwrite_output() \
-            .run(capture_stdout=avi_const.CONSOLE_DEBUG_MODE, capture_stderr=True)
+            .output('pipe:', vframes=1, **avi_const.FFMPEG_FRAME_PIPE_ARGS) \
+            .run(capture_stdout=True, capture_stderr=True)
+        return frame_ppm
+
+    @staticmethod
+    def __save_thumbnail(frame_ppm: bytes, dest_file_path: str) -> None:
+        with Image.open(io.BytesIO(frame_ppm)) as ffmpeg_frame:
+            ffmpeg_frame.thumbnail(avi_const.FFMPEG_THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            ffmpeg_frame.save(dest_file_path)
+
+    def __set_success_result(self, msg: str=None) -> None:
+        if msg is None:
+            msg = f'Successfully created ffmpeg derivative at {self.dest_file_path}'
+        self.success = True
+        self.result_message = msg
+
+    def __current_sidecar(self, derivative_type: str, dest_file_path: str, keyframe_seek: bool=False, **settings) -> Optional[AviDerivativeSidecar]:
+        """
+        The sidecar for an incremental run, None otherwise. Sets the skipped result if the derivative is up to date
+        """
+        if not self.incremental:
+            return None
+        with self.timer.stage('sidecar'):
+            sidecar = self.derivative_sidecar(derivative_type, dest_file_path, keyframe_seek, **settings)
+            if sidecar.is_current():
+                self.__set_skipped_result()
+        return sidecar
+
+    def __write_sidecar(self, sidecar: Optional[AviDerivativeSidecar], details: Optional[dict]=None) -> None:
+        if sidecar is not None:
+            with self.timer.stage('sidecar'):
+                sidecar.write(details)
+
+    def __probe_stage(self, probe_method: str) -> None:
+        # the probe is cached on the data object, running it up front keeps it out of the ffmpeg stage
+        with self.timer.stage('ffprobe'):
+            getattr(self.video_data, probe_method)()
+
+    def __record_timings(self, derivative_type: str) -> None:
+        self.timer.stop()
+        record_prometheus_metrics(derivative_type, self.result)
 
-    def __set_success_result(self) -> None:
+    def __set_skipped_result(self, msg: str=None) -> None:
+        if msg is None:
+            msg = f'ffmpeg derivative at {self.dest_file_path} is up to date. Skipped'
         self.success = True
-        self.result_message = f'Successfully created ffmpeg derivative at {self.dest_file_path}'
+        self.skipped = True
+        self.result_message = msg
 
     def __set_error_result(self, error_msg: str='') -> None:
         self.success = False
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import os
+import copy
+import json
+import time
+import errno
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union, Callable, Optional, Tuple
+
+import ffmpeg
+
+from . import constants as avi_const
+
+_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ffprobe_entries (
+    path TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probe TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (path, variant)
+)
+"""
+
+class AviFFProbeCache:
+    """
+    Two level cache of ffprobe results. An in memory LRU sits in front of an optional sqlite database on disk.
+    Entries are keyed on the resolved source path and probe variant (the full probe or a set of -show_entries) and
+    are only returned while the source size and mtime are unchanged.
+    The database is trimmed to max_bytes of stored probe json, least recently used first
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, db_path: Union[None, str, Path]=avi_const.FFPROBE_CACHE_PATH,
+                       max_bytes: int=avi_const.FFPROBE_CACHE_MAX_BYTES,
+                       memory_entries: int=avi_const.FFPROBE_CACHE_MEMORY_ENTRIES) -> None:
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def db_path(self) -> Union[None, Path]:
+        return self.__db_path
+
+    @db_path.setter
+    def db_path(self, db_path: Union[None, str, Path]) -> None:
+        if db_path is not None and not isinstance(db_path, Path):
+            db_path = Path(db_path)
+        self.__db_path = db_path
+
+    @property
+    def stats(self) -> dict:
+        return { 'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self._memory) }
+
+    def probe(self, src_file_path: Union[str, Path], probe_func: Callable[[str], dict]=ffmpeg.probe, variant: str='full') -> dict:
+        """
+        Returns the cached probe for src_file_path, running probe_func and storing the result on a miss
+        """
+        path, key = self.__cache_key(src_file_path, variant)
+        with self._lock:
+            cached = self.__memory_get(path, key)
+            if cached is None:
+                cached = self.__disk_get(path, key)
+                if cached is not None:
+                    self.__memory_put(path, key, cached)
+            if cached is not None:
+                self.hits += 1
+                return copy.deepcopy(cached)
+            self.misses += 1
+        ffprobe = probe_func(path[0])
+        with self._lock:
+            self.__memory_put(path, key, ffprobe)
+            self.__disk_put(path, key, ffprobe)
+        return copy.deepcopy(ffprobe)
+
+    def invalidate(self, src_file_path: Union[str, Path]) -> None:
+        path = str(Path(src_file_path).resolve())
+        with self._lock:
+            for memory_key in [memory_key for memory_key in self._memory if memory_key[0] == path]:
+                del self._memory[memory_key]
+            connection = self.__connection()
+            if connection is not None:
+                with connection:
+                    connection.execute('DELETE FROM ffprobe_entries WHERE path = ?', (path,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+            connection = self.__connection()
+            if connection is not None:
+                with connection:
+                    connection.execute('DELETE FROM ffprobe_entries')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def __cache_key(self, src_file_path: Union[str, Path], variant: str) -> Tuple[Tuple[str, str], Tuple[int, int]]:
+        path = Path(src_file_path).resolve()
+        try:
+            src_stat = path.stat()
+        except FileNotFoundError as f_ex:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(src_file_path)) from f_ex
+        return (str(path), variant), (src_stat.st_size, src_stat.st_mtime_ns)
+
+    def __memory_get(self, path: Tuple[str, str], key: Tuple[int, int]) -> Optional[dict]:
+        entry = self._memory.get(path)
+        if entry is None or entry[0] != key:
+            return None
+        self._memory.move_to_end(path)
+        return entry[1]
+
+    def __memory_put(self, path: Tuple[str, str], key: Tuple[int, int], ffprobe: dict) -> None:
+        self._memory[path] = (key, ffprobe)
+        self._memory.move_to_end(path)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def __connection(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        # sqlite connections can't be shared with forked children so each process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+                with connection:
+                    connection.execute(_CACHE_SCHEMA)
+            except (OSError, sqlite3.Error) as db_ex:
+                # an unwritable or odd cache location must not break probing, the cache stays in memory instead
+                self.logger.warning('ffprobe cache db {} can not be opened, caching in memory only: {}'.format(self.db_path, db_ex))
+                self.db_path = None
+                return None
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def __disk_get(self, path: Tuple[str, str], key: Tuple[int, int]) -> Optional[dict]:
+        try:
+            connection = self.__connection()
+            if connection is None:
+                return None
+            row = connection.execute('SELECT size, mtime_ns, probe FROM ffprobe_entries WHERE path = ? AND variant = ?', path).fetchone()
+            if row is None or (row[0], row[1]) != key:
+                return None
+            with connection:
+                connection.execute('UPDATE ffprobe_entries SET last_access = ? WHERE path = ? AND variant = ?', (time.time(),) + path)
+            return json.loads(row[2])
+        except sqlite3.Error as sql_ex:
+            self.logger.warning('ffprobe cache read failed for {}: {}'.format(path[0], sql_ex))
+            return None
+
+    def __disk_put(self, path: Tuple[str, str], key: Tuple[int, int], ffprobe: dict) -> None:
+        try:
+            connection = self.__connection()
+            if connection is None:
+                return
+            probe_json = json.dumps(ffprobe)
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO ffprobe_entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   path + (key[0], key[1], probe_json, len(probe_json), time.time()))
+                self.__evict(connection)
+        except sqlite3.Error as sql_ex:
+            self.logger.warning('ffprobe cache write failed for {}: {}'.format(path[0], sql_ex))
+
+    def __evict(self, connection: sqlite3.Connection) -> None:
+        total_bytes = connection.execute('SELECT COALESCE(SUM(nbytes), 0) FROM ffprobe_entries').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        evicted = []
+        for path, variant, nbytes in connection.execute('SELECT path, variant, nbytes FROM ffprobe_entries ORDER BY last_access ASC').fetchall():
+            if total_bytes <= self.max_bytes:
+                break
+            evicted.append((path, variant))
+            total_bytes -= nbytes
+        connection.executemany('DELETE FROM ffprobe_entries WHERE path = ? AND variant = ?', evicted)
+
+_default_cache = {}
+
+def get_ffprobe_cache() -> AviFFProbeCache:
+    """
+    Returns the process wide cache configured from the AVI_FFPROBE_CACHE* environment variables
+    """
+    if 'cache' not in _default_cache:
+        _default_cache['cache'] = AviFFProbeCache()
+    return _default_cache['cache']
+
+__all__ = ['AviFFProbeCache', 'get_ffprobe_cache']
@@ -1,34 +1,72 @@
+import json
+import subprocess
 from pathlib import Path
 from typing import Union, List
 
 import ffmpeg
 
+from . import constants as avi_const
+from .avi_ffprobe_cache import get_ffprobe_cache
+
+def probe_entries(src_file_path: Union[str, Path], show_entries: str=avi_const.FFPROBE_LAZY_ENTRIES, cmd: str='ffprobe') -> dict:
+    """
+    Like ffmpeg.probe but only asks ffprobe for show_entries (eg. format=duration:stream=codec_type)
+    """
+    args = [cmd, '-v', 'error', '-of', 'json', '-show_entries', show_entries, str(src_file_path)]
+    #pylint: disable=subprocess-run-check
+    ffprobe_run = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    #pylint: enable=subprocess-run-check
+    if ffprobe_run.returncode != 0:
+        raise ffmpeg.Error('ffprobe', ffprobe_run.stdout, ffprobe_run.stderr)
+    return json.loads(ffprobe_run.stdout.decode('utf-8'))
+
 class AviFFProbeData:
     """
     Base Class for storing all low level audio/video data for functions that are used for
-    creating audio/video deriavtives with ffprobe
+    creating audio/video deriavtives with ffprobe. In lazy mode nothing is probed until a property is read, stream and
+    format properties only request FFPROBE_LAZY_ENTRIES, and the full probe only runs if ffmpeg_probe itself is read
     """
-    def __init__(self, src_file_path: Union[str, Path]) -> None:
-        self.ffmpeg_probe = ffmpeg.probe(src_file_path)
+    def __init__(self, src_file_path: Union[str, Path],
+                       use_cache: bool=avi_const.FFPROBE_CACHE_ENABLED,
+                       lazy: bool=False) -> None:
+        self.__src_file_path = src_file_path
+        self.__use_cache = use_cache
+        self.__ffmpeg_probe = None
+        self.__ffprobe_entries = None
+        if not lazy:
+            self.ffmpeg_probe = self.__probe(ffmpeg.probe, 'full')
 
     @property
     def ffmpeg_probe(self) -> dict:
+        if self.__ffmpeg_probe is None:
+            self.__ffmpeg_probe = self.__probe(ffmpeg.probe, 'full')
         return self.__ffmpeg_probe
 
     @ffmpeg_probe.setter
     def ffmpeg_probe(self, ffprobe: dict) -> None:
         self.__ffmpeg_probe = ffprobe
 
+    @property
+    def ffprobe_entries(self) -> dict:
+        """
+        The full probe if it has already been run, otherwise the selective FFPROBE_LAZY_ENTRIES probe
+        """
+        if self.__ffmpeg_probe is not None:
+            return self.__ffmpeg_probe
+        if self.__ffprobe_entries is None:
+            self.__ffprobe_entries = self.__probe(probe_entries, avi_const.FFPROBE_LAZY_ENTRIES)
+        return self.__ffprobe_entries
+
     @property
     def ffprobe_streams(self) -> List[dict]:
-        if 'streams' in self.ffmpeg_probe.keys():
-            return self.ffmpeg_probe['streams']
+        if 'streams' in self.ffprobe_entries.keys():
+            return self.ffprobe_entries['streams']
         return []
 
     @property
     def ffprobe_format(self) -> dict:
-        if 'format' in self.ffmpeg_probe.keys():
-            return self.ffmpeg_probe['format']
+        if 'format' in self.ffprobe_entries.keys():
+            return self.ffprobe_entries['format']
         return {}
 
     # The following two properties should be included by default in inherited classes
@@ -41,4 +79,9 @@ class AviFFProbeData:
     def audio_streams(self) -> List[dict]:
         return [stream for stream in self.ffprobe_streams if stream['codec_type'] == 'audio']
 
-__all__ = ['AviFFProbeData']
+    def __probe(self, probe_func, variant: str) -> dict:
+        if self.__use_cache:
+            return get_ffprobe_cache().probe(self.__src_file_path, probe_func=probe_func, variant=variant)
+        return probe_func(str(self.__src_file_path))
+
+__all__ = ['AviFFProbeData', 'probe_entries']
@@ -0,0 +1,260 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import io
+import bisect
+import struct
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union, List, Optional, Iterator, Iterable, Tuple
+
+from PIL import Image, ImageCms, TiffImagePlugin
+
+from . import constants as avi_const
+from .avi_image_header import AviImageHeader, TIFF_BITS_PER_SAMPLE
+
+# XResolution, YResolution and ResolutionUnit
+TIFF_RESOLUTION_TAGS = [282, 283, 296]
+TIFF_ICC_PROFILE = 34675
+_TIFF_SHORT = 3
+_TIFF_LONG = 4
+_TIFF_RATIONAL = 5
+_TIFF_UNDEFINED = 7
+_TIFF_LONG8 = 16
+_TIFF_TYPE_FORMATS = {_TIFF_SHORT: 'H', _TIFF_LONG: 'I', _TIFF_RATIONAL: 'I', _TIFF_LONG8: 'Q'}
+# Classic tiffs address at most 4GB, anything close to that is written as a BigTIFF
+_CLASSIC_TIFF_MAX_BYTES = 2 ** 32 - 2 ** 24
+
+#pylint: disable=missing-class-docstring
+class AviIccConverterError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+class AviTiffStripWriter:
+    """
+    Writes a baseline uncompressed RGB or RGBA tiff one strip at a time. Strips go straight to disk and the ifd is
+    written after the last one, so only the strip being written is held in memory. Images that don't fit in 4GB are
+    written as a BigTIFF. Use as a context manager, the file is only completed if the block exits without an exception
+    """
+    def __init__(self, out_file_path: Union[str, Path], mode: str, size: tuple, icc_profile: bytes,
+                 resolution: Optional[dict]=None, big_tiff: Optional[bool]=None) -> None:
+        self.out_file_path = Path(out_file_path)
+        self.mode = mode
+        self.size = size
+        self.icc_profile = icc_profile
+        self.resolution = resolution or {}
+        if big_tiff is None:
+            big_tiff = size[0] * size[1] * len(mode) + len(icc_profile) > _CLASSIC_TIFF_MAX_BYTES
+        self.big_tiff = big_tiff
+        self.rows_per_strip = None
+        self.__strips = []
+        self.__rows_written = 0
+        self.__out_file = None
+
+    def __enter__(self) -> AviTiffStripWriter:
+        self.__out_file = open(self.out_file_path, 'wb') #pylint: disable=consider-using-with
+        # the header's ifd offset is patched once the strips are written
+        self.__out_file.write(b'II+\x00\x08\x00\x00\x00' + struct.pack('<Q', 0) if self.big_tiff else b'II*\x00' + struct.pack('<I', 0))
+        self.__write_aligned(self.icc_profile)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.__write_ifd()
+        finally:
+            self.__out_file.close()
+
+    def write_strip(self, data: bytes, rows: int) -> None:
+        """
+        Appends the next rows of the image. Every strip but the last has to have the same number of rows
+        """
+        if self.rows_per_strip is None:
+            self.rows_per_strip = rows
+        elif self.__strips and self.__strips[-1][2] != self.rows_per_strip:
+            raise AviIccConverterError('Only the last strip can be shorter than rows_per_strip')
+        if len(data) != rows * self.size[0] * len(self.mode):
+            raise AviIccConverterError(f'Strip of {len(data)} bytes does not hold {rows} rows')
+        self.__strips.append((self.__write_aligned(data), len(data), rows))
+        self.__rows_written += rows
+
+    def __write_aligned(self, data: bytes) -> int:
+        offset = self.__out_file.tell()
+        if offset % 2:
+            self.__out_file.write(b'\x00')
+            offset += 1
+        self.__out_file.write(data)
+        return offset
+
+    def __write_ifd(self) -> None:
+        if self.__rows_written != self.size[1]:
+            raise AviIccConverterError(f'Wrote {self.__rows_written} of {self.size[1]} rows')
+        offset_format = 'Q' if self.big_tiff else 'I'
+        packed_entries = [self.__pack_entry(tag, tiff_type, values) for tag, (tiff_type, values) in sorted(self.__ifd_entries().items())]
+        ifd_offset = self.__write_aligned(struct.pack('<Q' if self.big_tiff else '<H', len(packed_entries)) +
+                                          b''.join(packed_entries) + struct.pack(f'<{offset_format}', 0))
+        self.__out_file.seek(8 if self.big_tiff else 4)
+        self.__out_file.write(struct.pack(f'<{offset_format}', ifd_offset))
+
+    def __ifd_entries(self) -> dict:
+        offset_type = _TIFF_LONG8 if self.big_tiff else _TIFF_LONG
+        entries = {
+            256: (_TIFF_LONG, [self.size[0]]),
+            257: (_TIFF_LONG, [self.size[1]]),
+            258: (_TIFF_SHORT, [8] * len(self.mode)),
+            259: (_TIFF_SHORT, [1]),
+            262: (_TIFF_SHORT, [2]),
+            273: (offset_type, [strip[0] for strip in self.__strips]),
+            277: (_TIFF_SHORT, [len(self.mode)]),
+            278: (_TIFF_LONG, [self.rows_per_strip]),
+            279: (offset_type, [strip[1] for strip in self.__strips]),
+            284: (_TIFF_SHORT, [1]),
+            TIFF_ICC_PROFILE: (_TIFF_UNDEFINED, self.icc_profile),
+        }
+        if self.mode == 'RGBA':
+            # unassociated alpha, as pillow writes it
+            entries[338] = (_TIFF_SHORT, [2])
+        for tag, value in self.resolution.items():
+            entries[tag] = (_TIFF_SHORT, [int(value)]) if tag == 296 else (_TIFF_RATIONAL, [value.numerator, value.denominator])
+        return entries
+
+    def __pack_entry(self, tag: int, tiff_type: int, values: Union[list, bytes]) -> bytes:
+        """
+        An ifd entry. Values that don't fit in the entry are written to the file first and the entry points at them
+        """
+        slot_size, slot_format = (8, 'Q') if self.big_tiff else (4, 'I')
+        if tag == TIFF_ICC_PROFILE:
+            # the profile was written right after the header
+            return struct.pack(f'<HH{slot_format}{slot_format}', tag, tiff_type, len(values), 16 if self.big_tiff else 8)
+        count = len(values) // 2 if tiff_type == _TIFF_RATIONAL else len(values)
+        data = struct.pack(f'<{len(values)}{_TIFF_TYPE_FORMATS[tiff_type]}', *values)
+        if len(data) <= slot_size:
+            value_field = data.ljust(slot_size, b'\x00')
+        else:
+            value_field = struct.pack(f'<{slot_format}', self.__write_aligned(data))
+        return struct.pack(f'<HH{slot_format}', tag, tiff_type, count) + value_field
+
+class AviStripIccConverter:
+    """
+    Converts an uncompressed 8 bit RGB or RGBA tiff to another icc profile a band of rows at a time, so memory use is
+    bounded by a few times strip_bytes per thread instead of growing with the image. The transform is the little cms
+    transform ImageCms.profileToProfile applies to the whole image, which works pixel by pixel, so the pixels are
+    identical. Bands are read in order and only the transforms are spread across threads
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, src_file_path: Union[str, Path],
+                       icc_profile_path: Union[str, Path]=avi_const.ICC_PROFILE_PATH,
+                       strip_bytes: int=avi_const.ICC_STRIP_BYTES,
+                       threads: int=avi_const.ICC_STRIP_THREADS) -> None:
+        self.src_file_path = Path(src_file_path)
+        self.icc_profile_path = Path(icc_profile_path)
+        self.strip_bytes = strip_bytes
+        self.threads = max(1, threads)
+
+    @staticmethod
+    def supports(header: AviImageHeader) -> bool:
+        """
+        Whether a source can be converted in strips. Compressed, planar and high bit depth tiffs can't
+        """
+        return header.mode in avi_const.COLOR_MODES and header.icc_profile is not None and header.compression == 'raw' \
+            and header.planar_config == 1 and all(bits == 8 for bits in header.bits_per_sample)
+
+    def convert(self, out_file_path: Union[str, Path], bands: Optional[Iterable[Tuple[bytes, int]]]=None) -> None:
+        """
+        Writes the converted image to out_file_path as an uncompressed tiff carrying the target profile. bands are
+        iter_bands, or something passing them through, eg. :meth:`~avi_py.avi_image_derivatives.AviImageDerivatives.tee`
+        """
+        with Image.open(self.src_file_path) as img:
+            resolution = {tag: img.tag_v2[tag] for tag in TIFF_RESOLUTION_TAGS if tag in getattr(img, 'tag_v2', {})}
+            mode, size = img.mode, img.size
+        with AviTiffStripWriter(out_file_path, mode, size, self.icc_profile_path.read_bytes(), resolution) as writer:
+            for data, rows in bands if bands is not None else self.iter_bands():
+                writer.write_strip(data, rows)
+
+    def iter_bands(self) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yields (pixels, rows) of each converted band top to bottom, in the packed layout of the image mode
+        """
+        with Image.open(self.src_file_path) as img:
+            if not isinstance(img, TiffImagePlugin.TiffImageFile) or not self.supports(AviImageHeader.from_image(img)) \
+                    or any(tile[0] != 'raw' for tile in img.tile):
+                raise AviIccConverterError(f'{self.src_file_path} is not an uncompressed 8 bit RGB or RGBA tiff')
+            # the same transform ImageCms.profileToProfile builds, perceptual intent and no flags
+            transform = ImageCms.buildTransform(ImageCms.ImageCmsProfile(io.BytesIO(img.info['icc_profile'])),
+                                                ImageCms.ImageCmsProfile(str(self.icc_profile_path)), img.mode, img.mode)
+            band_rows = max(1, min(img.height, self.strip_bytes // (img.width * len(img.mode))))
+            tile_rows = self.__tile_rows(img.tile)
+            self.logger.debug('Converting the icc profile of {} in bands of {} rows'.format(self.src_file_path, band_rows))
+            with open(self.src_file_path, 'rb') as src_file, ThreadPoolExecutor(max_workers=self.threads) as executor:
+                pending = deque()
+                for top in range(0, img.height, band_rows):
+                    bottom = min(top + band_rows, img.height)
+                    pending.append((executor.submit(self.__transform_band, self.__read_band(src_file, img, tile_rows, top, bottom),
+                                                    transform), bottom - top))
+                    # keep at most one band per thread in flight so memory stays bounded
+                    if len(pending) >= self.threads:
+                        yield self.__next_band(pending)
+                while pending:
+                    yield self.__next_band(pending)
+
+    def __read_band(self, src_file: io.BufferedReader, img: Image.Image, tile_rows: List[tuple], top: int, bottom: int) -> Image.Image:
+        bits_per_pixel = sum(img.tag_v2[TIFF_BITS_PER_SAMPLE])
+        tiles = self.__tiles_in_band(tile_rows, top, bottom)
+        if len(tiles) == 1 and tiles[0][1][2] - tiles[0][1][0] == img.width:
+            # a band inside one strip is read as is instead of being copied into a band image
+            return self.__read_tile(src_file, img.mode, tiles[0], top, bottom, bits_per_pixel)
+        band_img = Image.new(img.mode, (img.width, bottom - top))
+        for tile in tiles:
+            band_img.paste(self.__read_tile(src_file, img.mode, tile, top, bottom, bits_per_pixel),
+                           (tile[1][0], max(tile[1][1], top) - top))
+        return band_img
+
+    @staticmethod
+    def __next_band(pending: deque) -> Tuple[bytes, int]:
+        future, rows = pending.popleft()
+        return future.result(), rows
+
+    @staticmethod
+    def __tile_rows(tiles: List[tuple]) -> List[tuple]:
+        """
+        (top, bottom, tiles) for each row of source strips or tiles, top to bottom
+        """
+        tile_rows = {}
+        for tile in tiles:
+            tile_rows.setdefault((tile[1][1], tile[1][3]), []).append(tile)
+        return [(top, bottom, row_tiles) for (top, bottom), row_tiles in sorted(tile_rows.items())]
+
+    @staticmethod
+    def __tiles_in_band(tile_rows: List[tuple], top: int, bottom: int) -> List[tuple]:
+        first = bisect.bisect_right([tile_row[1] for tile_row in tile_rows], top)
+        tiles = []
+        for tile_top, _, row_tiles in tile_rows[first:]:
+            if tile_top >= bottom:
+                break
+            tiles.extend(row_tiles)
+        return tiles
+
+    @staticmethod
+    def __read_tile(src_file: io.BufferedReader, mode: str, tile: tuple, top: int, bottom: int, bits_per_pixel: int) -> Image.Image:
+        """
+        The rows of tile between top and bottom. The data is uncompressed so they are read straight from their offset
+        """
+        _, (tile_left, tile_top, tile_right, tile_bottom), offset, (rawmode, stride, _) = tile
+        top, bottom = max(top, tile_top), min(bottom, tile_bottom)
+        row_bytes = stride or ((tile_right - tile_left) * bits_per_pixel + 7) // 8
+        src_file.seek(offset + (top - tile_top) * row_bytes)
+        data = src_file.read(row_bytes * (bottom - top))
+        if len(data) < row_bytes * (bottom - top):
+            raise AviIccConverterError(f'Truncated tiff data at offset {offset}')
+        return Image.frombytes(mode, (tile_right - tile_left, bottom - top), data, 'raw', rawmode, stride, 1)
+
+    @staticmethod
+    def __transform_band(band_img: Image.Image, transform: ImageCms.ImageCmsTransform) -> bytes:
+        ImageCms.applyTransform(band_img, transform, inPlace=True)
+        return band_img.tobytes()
+
+__all__ = ['AviStripIccConverter', 'AviTiffStripWriter', 'AviIccConverterError']
@@ -1,13 +1,10 @@
 import os
 import errno
 from pathlib import Path
-from typing import Union
-from PIL import Image
-from image_processing import validation
+from typing import Union, Optional
 
 from . import constants as avi_const
-
-Image.MAX_IMAGE_PIXELS = None
+from .avi_image_header import AviImageHeader
 
 class AviImageData:
     """
@@ -17,15 +14,17 @@ class AviImageData:
     def __init__(self, image_src_path: Union[str, Path],
                 tile_size: int=avi_const.KDU_DEFAULT_TILE_SIZE,
                 layer_count: int=avi_const.KDU_DEFAULT_LAYER_COUNT,
-                compression_numerator: int=avi_const.IMAGE_DEFAULT_COMPRESSION) -> None:
+                compression_numerator: int=avi_const.IMAGE_DEFAULT_COMPRESSION,
+                image_header: Optional[AviImageHeader]=None,
+                target_bits_per_pixel: Optional[float]=None) -> None:
         self.image_src_path = image_src_path
         self.tile_size = tile_size
         self.layer_count = layer_count
         self.compression_numerator = compression_numerator
-        with Image.open(self.image_src_path) as image_src:
-            self.src_quality = image_src
-            self.long_dim = image_src
-            self.icc_profile = image_src
+        self.target_bits_per_pixel = target_bits_per_pixel
+        # callers that have already read the header pass it in instead of it being read twice
+        self.image_header = image_header if image_header is not None else AviImageHeader.read(self.image_src_path)
+        self.src_quality = self.image_header
 
     @property
     def image_src_path(self) -> Path:
@@ -40,6 +39,14 @@ class AviImageData:
                     errno.ENOENT, os.strerror(errno.ENOENT), str(image_src_path))
         self._image_src_path = image_src_path
 
+    @property
+    def image_header(self) -> AviImageHeader:
+        return self._image_header
+
+    @image_header.setter
+    def image_header(self, image_header: AviImageHeader) -> None:
+        self._image_header = image_header
+
     @property
     def tile_size(self) -> str:
         return f'{self._tile_size},{self._tile_size}'
@@ -50,32 +57,32 @@ class AviImageData:
 
     @property
     def icc_profile(self) -> Union[None, bytes]:
-        return self._icc_profile
-
-    @icc_profile.setter
-    def icc_profile(self, img: Image) -> None:
-        self._icc_profile = img.info.get('icc_profile')
+        return self.image_header.icc_profile
 
     @property
     def src_quality(self) -> str:
         return self._src_quality
 
     @src_quality.setter
-    def src_quality(self, img: Image) -> None:
-        if img.mode in avi_const.COLOR_MODES:
+    def src_quality(self, header: AviImageHeader) -> None:
+        if header.is_color:
             self._src_quality = 'color'
-        elif img.mode in validation.MONOTONE_COLOUR_MODES:
+        elif header.is_monotone:
             self._src_quality = 'gray'
         else:
-            raise IOError(f'Unknown Image mode {img.mode}')
+            raise IOError(f'Unknown Image mode {header.mode}')
 
     @property
     def long_dim(self) -> int:
-        return self._long_dim
+        return self.image_header.long_dim
 
-    @long_dim.setter
-    def long_dim(self, img: Image) -> None:
-        self._long_dim = max(img.width, img.height)
+    @property
+    def pixel_bytes(self) -> int:
+        """
+        Size of the decoded pixels at the source bit depth
+        """
+        header = self.image_header
+        return header.width * header.height * sum(header.bits_per_sample) // 8
 
     @property
     def layer_count(self) -> int:
@@ -93,12 +100,26 @@ class AviImageData:
     def compression_numerator(self, compression_numerator: int) -> None:
         self._compression_numerator = compression_numerator
 
+    @property
+    def target_bits_per_pixel(self) -> Optional[float]:
+        """
+        Bit rate of the top quality layer when encoding to a size budget, None to derive it from compression_numerator
+        """
+        return self._target_bits_per_pixel
+
+    @target_bits_per_pixel.setter
+    def target_bits_per_pixel(self, target_bits_per_pixel: Optional[float]) -> None:
+        self._target_bits_per_pixel = target_bits_per_pixel
+
     @property
     def image_ext(self) -> str:
         return self.image_src_path.suffix
 
     def valid_image_ext(self) -> bool:
-        return self.image_ext in avi_const.VALID_IMAGE_EXTENSIONS
+        return self.image_ext.lower() in avi_const.VALID_IMAGE_EXTENSIONS
+
+    def has_alpha(self) -> bool:
+        return self.image_header.has_alpha
 
     def jp2_space(self) -> str:
         return 'sRGB' if self.src_quality == 'color' else 'sLUM'
@@ -106,6 +127,9 @@ class AviImageData:
     def needs_icc_profile(self) -> bool:
         return self.src_quality == 'color' and self.icc_profile is None
 
+    def needs_icc_conversion(self) -> bool:
+        return self.src_quality == 'color' and self.icc_profile != avi_const.target_icc_profile()
+
     def level_count_for_size(self) -> int:
         levels = 0
         level_size = self.long_dim
@@ -116,7 +140,10 @@ class AviImageData:
 
     def layer_rates(self) -> str:
         rates = []
-        cmp = 24.0 / float(self.compression_numerator)
+        if self.target_bits_per_pixel is not None:
+            cmp = round(self.target_bits_per_pixel, 8)
+        else:
+            cmp = 24.0 / float(self.compression_numerator)
         for _ in range(self.layer_count):
             rates.append(cmp)
             cmp = round((cmp / 1.618), 8)
@@ -0,0 +1,227 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from . import constants as avi_const
+from .avi_jp2_verifier import AviJp2Structure, AviJp2VerifierError
+
+#pylint: disable=missing-class-docstring
+class AviImageDerivativesError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+# Derivatives are reduced by box filtering to at least this many times their size before the final lanczos resize,
+# as Image.thumbnail does with its reducing_gap
+REDUCING_GAP = 2
+# Modes each derivative format is saved in, anything else is converted to the first
+DERIVATIVE_FORMAT_MODES = {'JPEG': ['RGB', 'L'], 'WEBP': ['RGB', 'RGBA']}
+
+def derivative_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """
+    size scaled down to fit inside a max_side square, keeping its aspect ratio. Images are never scaled up
+    """
+    scale = min(1.0, max_side / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def reduce_factor(size: Tuple[int, int], max_side: int) -> int:
+    """
+    Largest integer factor size can be box reduced by that still leaves REDUCING_GAP times the pixels of a max_side derivative
+    """
+    return max(1, max(size) // (max(derivative_size(size, max_side)) * REDUCING_GAP))
+
+def eight_bit(img: Image.Image) -> Image.Image:
+    """
+    img with 16 bit greyscale samples scaled down to 8 bit L, convert('L') would clip them. Palette and bilevel images
+    are expanded so they can be box reduced. Anything else is returned as is
+    """
+    if img.mode in avi_const.SIXTEEN_BIT_GRAY_MODES:
+        return img.convert('I').point(lambda value: value / 256).convert('L')
+    if img.mode == 'P':
+        return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode == '1':
+        return img.convert('L')
+    return img
+
+def on_white(img: Image.Image, mode: str) -> Image.Image:
+    """
+    img, an image with an alpha band, composited onto a white background and converted to mode
+    """
+    rgba = img.convert('RGBA')
+    return Image.alpha_composite(Image.new('RGBA', img.size, (255, 255, 255, 255)), rgba).convert(mode)
+
+class AviBandDownscaler:
+    """
+    Box reduces an image by an integer factor as its bands of rows go past, so a downscaled copy is built while the
+    full size image is only ever held a band at a time. Rows that don't fill a whole box are carried over to the next band
+    """
+    def __init__(self, mode: str, size: Tuple[int, int], factor: int) -> None:
+        self.mode = mode
+        self.size = size
+        self.factor = factor
+        self.rows_added = 0
+        self.__carried = b''
+        self.__carried_rows = 0
+        # full size rows already reduced, always a whole number of boxes until the last band
+        self.__reduced_rows = 0
+        self.__reduced = Image.new(mode, (-(-size[0] // factor), -(-size[1] // factor)))
+
+    @property
+    def complete(self) -> bool:
+        return self.rows_added == self.size[1]
+
+    def add_band(self, data: bytes, rows: int) -> None:
+        """
+        Adds the next (pixels, rows) band, in the packed layout of the mode
+        """
+        if self.__carried_rows:
+            data, rows = self.__carried + data, self.__carried_rows + rows
+        self.rows_added += rows - self.__carried_rows
+        whole_rows = rows if self.complete else rows - rows % self.factor
+        if whole_rows:
+            self.__reduce(data[:whole_rows * self.__row_bytes()], whole_rows)
+        self.__carried, self.__carried_rows = data[whole_rows * self.__row_bytes():], rows - whole_rows
+
+    def image(self) -> Image.Image:
+        """
+        The reduced image. Raises AviImageDerivativesError if it hasn't seen every row
+        """
+        if not self.complete:
+            raise AviImageDerivativesError(f'Only {self.rows_added} of {self.size[1]} rows were downscaled')
+        return self.__reduced
+
+    def __reduce(self, data: bytes, rows: int) -> None:
+        band = Image.frombytes(self.mode, (self.size[0], rows), data)
+        self.__reduced.paste(band.reduce(self.factor) if self.factor > 1 else band, (0, self.__reduced_rows // self.factor))
+        self.__reduced_rows += rows
+
+    def __row_bytes(self) -> int:
+        return self.size[0] * len(self.mode)
+
+class AviImageDerivatives:
+    """
+    Writes downscaled jpeg and webp derivatives (named in IMAGE_DERIVATIVES) of one image. Bands of the full size image
+    can be passed through tee on their way to an encoder or the icc conversion, or the whole decoded image to keep.
+    Only when neither saw the source are the derivatives read from a reduced resolution level of the jp2 made from it
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, derivative_paths: Dict[str, Union[str, Path]], size: Tuple[int, int],
+                 icc_profile: Optional[bytes]=None) -> None:
+        unknown_names = set(derivative_paths) - set(avi_const.IMAGE_DERIVATIVES)
+        if unknown_names:
+            raise AviImageDerivativesError(f'Unknown image derivatives {sorted(unknown_names)}. '
+                                           f'Expected some of {", ".join(avi_const.IMAGE_DERIVATIVES)}')
+        self.derivative_paths = {name: str(dest_path) for name, dest_path in derivative_paths.items()}
+        self.size = size
+        self.icc_profile = icc_profile
+        self.__downscaler = None
+        self.__kept = None
+
+    @property
+    def max_side(self) -> int:
+        """
+        Long side of the largest derivative
+        """
+        return max(avi_const.IMAGE_DERIVATIVES[name]['max_side'] for name in self.derivative_paths)
+
+    @property
+    def has_source(self) -> bool:
+        """
+        Whether tee or keep saw the whole source, so write needs no jp2
+        """
+        return self.__kept is not None or (self.__downscaler is not None and self.__downscaler.complete)
+
+    def tee(self, bands: Iterable[Tuple[bytes, int]], mode: str) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yields bands as they are while box reducing a copy of them for the derivatives
+        """
+        self.__downscaler = AviBandDownscaler(mode, self.size, reduce_factor(self.size, self.max_side))
+        for data, rows in bands:
+            self.__downscaler.add_band(data, rows)
+            yield data, rows
+
+    def keep(self, img: Image.Image) -> None:
+        """
+        Box reduces img, the whole decoded source, for the derivatives so it doesn't have to be decoded again
+        """
+        try:
+            img = eight_bit(img)
+            factor = reduce_factor(self.size, self.max_side)
+            self.__kept = img.reduce(factor) if factor > 1 else img.copy()
+        except (OSError, ValueError) as keep_e:
+            raise AviImageDerivativesError(f'Could not reduce {img.mode} image: {keep_e.__class__.__name__} {keep_e}') from keep_e
+
+    def write(self, jp2_path: Union[str, Path, None]=None) -> Dict[str, dict]:
+        """
+        Writes every derivative from the bands tee saw or the image keep was given or, if neither saw the whole source,
+        from jp2_path. Returns {name: {'path', 'width', 'height', 'bytes'}}
+        """
+        if self.__downscaler is not None and self.__downscaler.complete:
+            return self.write_image(self.__downscaler.image())
+        if self.__kept is not None:
+            return self.write_image(self.__kept)
+        if jp2_path is None:
+            raise AviImageDerivativesError('No bands or jp2 to write derivatives from')
+        self.logger.debug('Writing derivatives from the jp2, the source was not decoded')
+        return self.write_image(self.reduced_jp2_image(jp2_path))
+
+    def reduced_jp2_image(self, jp2_path: Union[str, Path]) -> Image.Image:
+        """
+        jp2_path decoded at its smallest resolution level that still has REDUCING_GAP times the pixels of the largest
+        derivative. Only that level's share of the codestream is decoded
+        """
+        try:
+            levels = AviJp2Structure.read(jp2_path).levels
+        except AviJp2VerifierError as ver_e:
+            raise AviImageDerivativesError(str(ver_e)) from ver_e
+        reduce = min(levels, reduce_factor(self.size, self.max_side).bit_length() - 1)
+        self.logger.debug('Decoding {} at resolution level {} of {} for its derivatives'.format(jp2_path, reduce, levels))
+        with Image.open(jp2_path) as jp2:
+            jp2.reduce = reduce
+            jp2.load()
+            return jp2.copy()
+
+    def write_image(self, img: Image.Image) -> Dict[str, dict]:
+        """
+        Resizes img, the full size image or a box reduced copy of it, to each derivative and saves it
+        """
+        img = eight_bit(img)
+        results = {}
+        for name, dest_path in self.derivative_paths.items():
+            spec = avi_const.IMAGE_DERIVATIVES[name]
+            width, height = derivative_size(self.size, spec['max_side'])
+            derivative = img if img.size == (width, height) else img.resize((width, height), Image.Resampling.LANCZOS)
+            self.__save(self.__for_format(derivative, spec['format']), dest_path, spec)
+            results[name] = {'path': dest_path, 'width': width, 'height': height, 'bytes': os.path.getsize(dest_path)}
+        return results
+
+    def __save(self, img: Image.Image, dest_path: str, spec: dict) -> None:
+        save_options = {'quality': spec['quality']}
+        if self.icc_profile is not None:
+            save_options['icc_profile'] = self.icc_profile
+        try:
+            img.save(dest_path, spec['format'], **save_options)
+        except (OSError, ValueError) as save_e:
+            if os.path.exists(dest_path):
+                os.unlink(dest_path)
+            raise AviImageDerivativesError(f'Could not write {dest_path}: {save_e.__class__.__name__} {save_e}') from save_e
+
+    @staticmethod
+    def __for_format(img: Image.Image, derivative_format: str) -> Image.Image:
+        modes: List[str] = DERIVATIVE_FORMAT_MODES[derivative_format]
+        if img.mode in modes:
+            return img
+        if 'A' in img.getbands():
+            # formats without alpha get the image as it would look on a white page, not its hidden pixels
+            return img.convert('RGBA') if 'RGBA' in modes else on_white(img, 'L' if img.mode == 'LA' and 'L' in modes else modes[0])
+        return img.convert(modes[0])
+
+__all__ = ['AviImageDerivatives', 'AviBandDownscaler', 'AviImageDerivativesError', 'derivative_size', 'reduce_factor',
+           'eight_bit', 'on_white']
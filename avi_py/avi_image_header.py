@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import errno
+from pathlib import Path
+from typing import Union, NamedTuple, Optional, Tuple
+
+from PIL import Image, TiffImagePlugin
+from image_processing import validation
+from image_processing.exceptions import ValidationError
+
+from . import constants as avi_const
+
+Image.MAX_IMAGE_PIXELS = None
+
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_STRIP_OFFSETS = 273
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_ROWS_PER_STRIP = 278
+TIFF_PLANAR_CONFIG = 284
+TIFF_TILE_WIDTH = 322
+TIFF_TILE_LENGTH = 323
+TIFF_TILE_OFFSETS = 324
+MODE_BITS_PER_SAMPLE = {'1': 1, 'I;16': 16, 'I;16B': 16, 'I;16L': 16, 'I': 32, 'F': 32}
+
+class AviImageHeader(NamedTuple):
+    """
+    Immutable summary of everything the jp2 pipeline needs to know about a source image. Built from the image header
+    only, so the pixel data is never decoded
+    """
+    mode: str
+    width: int
+    height: int
+    icc_profile: Optional[bytes]
+    bits_per_sample: Tuple[int, ...]
+    samples_per_pixel: int
+    has_alpha: bool
+    compression: str
+    is_tiled: bool
+    tile_width: Optional[int]
+    tile_height: Optional[int]
+    rows_per_strip: Optional[int]
+    chunk_count: int
+    planar_config: int
+
+    @classmethod
+    def read(cls, image_src_path: Union[str, Path]) -> AviImageHeader:
+        if not os.path.isfile(image_src_path):
+            raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), str(image_src_path))
+        with Image.open(image_src_path) as img:
+            return cls.from_image(img)
+
+    @classmethod
+    def from_image(cls, img: Image.Image) -> AviImageHeader:
+        bands = img.getbands()
+        tags = img.tag_v2 if isinstance(img, TiffImagePlugin.TiffImageFile) else {}
+        bits_per_sample = tags.get(TIFF_BITS_PER_SAMPLE, (MODE_BITS_PER_SAMPLE.get(img.mode, 8),) * len(bands))
+        if isinstance(bits_per_sample, int):
+            bits_per_sample = (bits_per_sample,)
+        is_tiled = TIFF_TILE_OFFSETS in tags
+        chunk_offsets = tags.get(TIFF_TILE_OFFSETS if is_tiled else TIFF_STRIP_OFFSETS, ())
+        if isinstance(chunk_offsets, int):
+            chunk_offsets = (chunk_offsets,)
+        return cls(
+            mode=img.mode,
+            width=img.width,
+            height=img.height,
+            icc_profile=img.info.get('icc_profile'),
+            bits_per_sample=tuple(bits_per_sample),
+            samples_per_pixel=int(tags.get(TIFF_SAMPLES_PER_PIXEL, len(bands))),
+            has_alpha='A' in bands,
+            compression=str(img.info.get('compression', 'raw')),
+            is_tiled=is_tiled,
+            tile_width=tags.get(TIFF_TILE_WIDTH),
+            tile_height=tags.get(TIFF_TILE_LENGTH),
+            rows_per_strip=None if is_tiled else tags.get(TIFF_ROWS_PER_STRIP, img.height),
+            chunk_count=len(chunk_offsets),
+            planar_config=int(tags.get(TIFF_PLANAR_CONFIG, 1)),
+        )
+
+    @property
+    def long_dim(self) -> int:
+        return max(self.width, self.height)
+
+    @property
+    def pixel_count(self) -> int:
+        return self.width * self.height
+
+    @property
+    def is_color(self) -> bool:
+        return self.mode in avi_const.COLOR_MODES
+
+    @property
+    def is_monotone(self) -> bool:
+        return self.mode in validation.MONOTONE_COLOUR_MODES
+
+def check_header_suitable_for_jp2_conversion(header: AviImageHeader,
+                                             require_icc_profile_for_colour: bool=True,
+                                             require_icc_profile_for_greyscale: bool=False) -> None:
+    """
+    Header only equivalent of :func:`image_processing.validation.check_image_suitable_for_jp2_conversion`.
+    Raises a ValidationError if the image can't be converted
+    """
+    if header.is_monotone:
+        if require_icc_profile_for_greyscale and header.mode != '1' and header.icc_profile is None:
+            raise ValidationError('Greyscale image has no ICC profile attached')
+    elif header.is_color:
+        if require_icc_profile_for_colour and header.icc_profile is None:
+            raise ValidationError('Colour image has no ICC profile attached')
+    else:
+        raise ValidationError(f'Unsupported colour mode {header.mode}')
+
+__all__ = ['AviImageHeader', 'check_header_suitable_for_jp2_conversion']
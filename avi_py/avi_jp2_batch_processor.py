@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Union, List, Tuple, Optional
+
+from . import constants as avi_const
+from .avi_batch_processor import AviBatchProcessor, AviBatchProcessorError, read_manifest, threads_per_worker
+from .avi_jp2_processor import AviJp2Processor, AviJp2ProcessorError
+from .avi_image_data import AviImageData
+from .avi_memory_estimate import estimate_jp2_memory
+
+def _process_jp2_job(src_file_path: str, dest_file_path: str, kdu_num_threads: int, incremental: bool, #pylint: disable=too-many-arguments
+                     profile: str=avi_const.JP2_PROFILE, target_bytes_per_pixel: float=avi_const.JP2_TARGET_BYTES_PER_PIXEL,
+                     target_bytes: int=avi_const.JP2_TARGET_BYTES) -> dict:
+    try:
+        jp2_processor = AviJp2Processor.process_jp2(src_file_path, dest_file_path, kdu_num_threads=kdu_num_threads,
+                                                    incremental=incremental, exiftool_stay_open=True, profile=profile,
+                                                    target_bytes_per_pixel=target_bytes_per_pixel, target_bytes=target_bytes)
+        result = jp2_processor.result
+    except (FileNotFoundError, AviJp2ProcessorError) as f_ex:
+        result = { 'success': False, 'message': str(f_ex) }
+    result.update({ 'src_file_path': src_file_path, 'dest_file_path': dest_file_path })
+    return result
+
+class AviJp2BatchProcessor(AviBatchProcessor):
+    """
+    Class that converts a manifest or directory of source tiffs to jp2 derivatives on a bounded process pool
+    """
+    #pylint: disable=too-many-arguments
+    def __init__(self, jobs: List[Tuple[Path, Optional[Path]]],
+                       dest_dir: Union[None, str, Path]=None,
+                       max_workers: int=avi_const.JP2_BATCH_MAX_WORKERS,
+                       incremental: bool=avi_const.INCREMENTAL,
+                       memory_budget: int=avi_const.MEMORY_BUDGET_BYTES,
+                       profile: str=avi_const.JP2_PROFILE,
+                       target_bytes_per_pixel: float=avi_const.JP2_TARGET_BYTES_PER_PIXEL,
+                       target_bytes: int=avi_const.JP2_TARGET_BYTES) -> None:
+        self.dest_dir = dest_dir
+        self.incremental = incremental
+        self.profile = profile
+        self.target_bytes_per_pixel = target_bytes_per_pixel
+        self.target_bytes = target_bytes
+        super().__init__(jobs, max_workers, memory_budget)
+        self.__check_dest_collisions()
+
+    @classmethod
+    def from_manifest(cls, manifest_path: Union[str, Path],
+                           dest_dir: Union[None, str, Path]=None,
+                           max_workers: int=avi_const.JP2_BATCH_MAX_WORKERS,
+                           incremental: bool=avi_const.INCREMENTAL,
+                           memory_budget: int=avi_const.MEMORY_BUDGET_BYTES,
+                           profile: str=avi_const.JP2_PROFILE,
+                           target_bytes_per_pixel: float=avi_const.JP2_TARGET_BYTES_PER_PIXEL,
+                           target_bytes: int=avi_const.JP2_TARGET_BYTES) -> AviJp2BatchProcessor:
+        return cls(read_manifest(manifest_path, avi_const.JP2_BATCH_MANIFEST_EXTENSIONS), dest_dir, max_workers, incremental,
+                   memory_budget, profile, target_bytes_per_pixel, target_bytes)
+    #pylint: enable=too-many-arguments
+
+    @property
+    def dest_dir(self) -> Union[None, Path]:
+        return self.__dest_dir
+
+    @dest_dir.setter
+    def dest_dir(self, dest_dir: Union[None, str, Path]) -> None:
+        if dest_dir is not None and not isinstance(dest_dir, Path):
+            dest_dir = Path(dest_dir)
+        self.__dest_dir = dest_dir
+
+    @property
+    def profile(self) -> str:
+        return self.__profile
+
+    @profile.setter
+    def profile(self, profile: str) -> None:
+        avi_const.check_jp2_profile(profile, AviBatchProcessorError)
+        self.__profile = profile
+
+    @property
+    def target_bytes_per_pixel(self) -> float:
+        return self.__target_bytes_per_pixel
+
+    @target_bytes_per_pixel.setter
+    def target_bytes_per_pixel(self, target_bytes_per_pixel: float) -> None:
+        if target_bytes_per_pixel < 0:
+            raise AviBatchProcessorError(f'target_bytes_per_pixel must be 0 or more not {target_bytes_per_pixel}')
+        self.__target_bytes_per_pixel = target_bytes_per_pixel
+
+    @property
+    def target_bytes(self) -> int:
+        return self.__target_bytes
+
+    @target_bytes.setter
+    def target_bytes(self, target_bytes: int) -> None:
+        if target_bytes < 0:
+            raise AviBatchProcessorError(f'target_bytes must be 0 or more not {target_bytes}')
+        self.__target_bytes = target_bytes
+
+    @property
+    def kdu_num_threads(self) -> int:
+        # kdu_compress threads per conversion so max_workers concurrent conversions don't oversubscribe the cpus
+        return threads_per_worker(self.max_workers)
+
+    def dest_file_path_for(self, src_path: Path, dest_path: Optional[Path]=None) -> Path:
+        if dest_path is not None:
+            return dest_path
+        dest_dir = self.dest_dir if self.dest_dir is not None else src_path.parent
+        return dest_dir / f'{src_path.stem}.jp2'
+
+    def __check_dest_collisions(self) -> None:
+        """
+        Raises AviBatchProcessorError if two sources would be written to the same jp2, eg. a/x.tif and b/x.tif into one dest_dir
+        """
+        sources_by_dest = {}
+        for src_path, dest_path in self.jobs:
+            sources_by_dest.setdefault(self.dest_file_path_for(src_path, dest_path).resolve(), []).append(str(src_path))
+        collisions = [f'{", ".join(src_paths)} -> {dest_path}' for dest_path, src_paths in sources_by_dest.items() if len(src_paths) > 1]
+        if collisions:
+            raise AviBatchProcessorError(f'Sources would overwrite each other\'s jp2: {"; ".join(collisions)}')
+
+    def _job_memory(self, src_path: Path) -> int:
+        try:
+            return estimate_jp2_memory(AviImageData(src_path, tile_size=avi_const.JP2_PROFILES[self.profile]['tile_size']))
+        except (OSError, ValueError):
+            # the job reports why the source can't be read
+            return avi_const.JOB_BASE_MEMORY_BYTES
+
+    def _job_args(self, src_path: Path, dest_path: Optional[Path]) -> tuple:
+        return (_process_jp2_job, str(src_path), str(self.dest_file_path_for(src_path, dest_path)), self.kdu_num_threads, self.incremental,
+                self.profile, self.target_bytes_per_pixel, self.target_bytes)
+
+__all__ = ['AviJp2BatchProcessor']
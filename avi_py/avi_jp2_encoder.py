@@ -0,0 +1,259 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import logging
+from pathlib import Path
+from typing import Union, Optional, List, Iterable, Tuple, Dict, Callable
+
+import PIL
+from PIL import Image, features
+from image_processing import kakadu
+from image_processing.exceptions import KakaduError
+from image_processing.kakadu import Kakadu
+
+from . import constants as avi_const
+from .avi_derivative_sidecar import tool_version
+from .avi_image_data import AviImageData
+from .avi_image_header import AviImageHeader
+from .avi_jp2_verifier import SRGB_COLOUR_SPACE, GREYSCALE_COLOUR_SPACE
+from .avi_kdu_stream import AviKduStream, AviKduStreamError, kdu_compress_path
+
+#pylint: disable=missing-class-docstring
+class AviJp2EncoderError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+class AviJp2Encoder:
+    """
+    Base class for the encoders :class:`~avi_py.avi_jp2_processor.AviJp2Processor` writes jp2s with. Every encoder takes
+    its layer rates, resolution levels, tile size and colour space from the same AviImageData, so switching encoder
+    changes the tool and not the decisions
+    """
+    name = ''
+    # timer stage the encode is recorded under
+    stage = ''
+    # whether encode_bands can take pixels as they are produced instead of a finished tiff
+    can_stream = False
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, num_threads: Optional[int]=None, scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR,
+                 profile: str=avi_const.JP2_PROFILE) -> None:
+        avi_const.check_jp2_profile(profile, AviJp2EncoderError)
+        self.num_threads = num_threads
+        self.scratch_dir = scratch_dir
+        self.profile = profile
+
+    def settings(self, image_data: AviImageData, input_header: AviImageHeader) -> list:
+        """
+        The options that change the output, recorded in the derivative sidecar. Thread counts and log levels are left out
+        """
+        raise NotImplementedError
+
+    def tool_versions(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def expected_structure(self, image_data: AviImageData, input_header: AviImageHeader) -> dict:
+        """
+        The :class:`~avi_py.avi_jp2_verifier.AviJp2Structure` field values a jp2 encoded from input_header should have
+        """
+        tile_side = int(image_data.tile_size.split(',')[0])
+        expected = {
+            'width': input_header.width,
+            'height': input_header.height,
+            'components': input_header.samples_per_pixel,
+            'bits_per_component': tuple(input_header.bits_per_sample),
+            'tile_count': self._tile_count(image_data, input_header),
+            'levels': image_data.level_count_for_size(),
+            'layers': image_data.layer_count,
+            'colour_method': 1,
+            'colour_space': SRGB_COLOUR_SPACE if image_data.jp2_space() == 'sRGB' else GREYSCALE_COLOUR_SPACE,
+        }
+        # encoders may shrink a tile to the image when it fits in one
+        if input_header.width > tile_side:
+            expected['tile_width'] = tile_side
+        if input_header.height > tile_side:
+            expected['tile_height'] = tile_side
+        return expected
+
+    @staticmethod
+    def _tile_count(image_data: AviImageData, input_header: AviImageHeader) -> int:
+        tile_side = int(image_data.tile_size.split(',')[0])
+        return -(-input_header.width // tile_side) * -(-input_header.height // tile_side)
+
+    def encode(self, image_data: AviImageData, input_file: str, input_header: AviImageHeader,
+               dest_file_path: Union[str, Path], decoded: Optional[Callable[[Image.Image], None]]=None) -> None:
+        """
+        Writes input_file, a tiff carrying the target icc profile, to dest_file_path. Encoders that decode input_file
+        themselves pass the decoded image to decoded. Raises AviJp2EncoderError
+        """
+        raise NotImplementedError
+
+    def encode_bands(self, image_data: AviImageData, bands: Iterable[Tuple[bytes, int]], input_header: AviImageHeader,
+                     dest_file_path: Union[str, Path]) -> None:
+        """
+        Writes the (pixels, rows) bands of an image described by input_header to dest_file_path as they are produced
+        """
+        raise AviJp2EncoderError(f'The {self.name} encoder can not encode streamed pixels')
+
+class AviKakaduEncoder(AviJp2Encoder):
+    """
+    Encodes with kdu_compress from a licensed kakadu install at kakadu_base_path
+    """
+    name = 'kakadu'
+    stage = 'kdu_compress'
+    can_stream = True
+
+    def __init__(self, num_threads: Optional[int]=None, scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR,
+                 profile: str=avi_const.JP2_PROFILE, kakadu_base_path: str=avi_const.KAKADU_BASE_PATH) -> None:
+        super().__init__(num_threads, scratch_dir, profile)
+        self.kakadu = Kakadu(kakadu_base_path=kakadu_base_path)
+        self.kakadu_base_path = kakadu_base_path
+
+    def kdu_args(self, image_data: AviImageData, input_header: AviImageHeader) -> List[str]:
+        kdu_options = avi_const.KAKADU_DEFAULT_OPTIONS.copy()
+        if self.num_threads is not None:
+            kdu_options[kdu_options.index('-num_threads') + 1] = str(self.num_threads)
+        # only rgba is flagged, as before the header was shared. Greyscale with alpha is encoded without -jp2_alpha
+        if input_header.mode == 'RGBA':
+            kdu_options += [kakadu.ALPHA_OPTION]
+        return [
+            '-rate', f'{image_data.layer_rates()}',
+            '-jp2_space', f'{image_data.jp2_space()}'
+        ] + kdu_options + [
+            "Stiles={" + image_data.tile_size + "}",
+            f'Clevels={image_data.level_count_for_size()}',
+            f'Clayers={image_data.layer_count}',
+        ] + avi_const.JP2_PROFILES[self.profile]['kakadu_recipe']
+
+    def settings(self, image_data: AviImageData, input_header: AviImageHeader) -> list:
+        kdu_args = self.kdu_args(image_data, input_header)
+        return [kdu_arg for index, kdu_arg in enumerate(kdu_args)
+                if kdu_arg not in ('-quiet', '-num_threads') and (index == 0 or kdu_args[index - 1] != '-num_threads')]
+
+    def tool_versions(self) -> Dict[str, str]:
+        return { 'kdu_compress': tool_version(kdu_compress_path(self.kakadu_base_path), '-v') }
+
+    def expected_structure(self, image_data: AviImageData, input_header: AviImageHeader) -> dict:
+        recipe = dict(kdu_arg.split('=', 1) for kdu_arg in self.kdu_args(image_data, input_header) if '=' in kdu_arg)
+        # Cblk is {height,width}
+        codeblock_height, codeblock_width = (int(side) for side in recipe.get('Cblk', '{64,64}').strip('{}').split(','))
+        tile_count = self._tile_count(image_data, input_header)
+        resolutions = image_data.level_count_for_size() + 1
+        # Cprecincts are {height,width} from the highest resolution down, the last repeated for the rest
+        precincts = [tuple(int(side) for side in reversed(precinct.split(',')))
+                     for precinct in recipe['Cprecincts'].strip('{}').split('},{')] if 'Cprecincts' in recipe else []
+        expected = dict(super().expected_structure(image_data, input_header),
+                        precincts=tuple(precincts[min(index, len(precincts) - 1)]
+                                        for index in reversed(range(resolutions))) if precincts else (),
+                        codeblock_size=(codeblock_width, codeblock_height),
+                        progression=recipe.get('Corder', 'LRCP'),
+                        uses_sop=recipe.get('Cuse_sop') == 'yes',
+                        uses_eph=recipe.get('Cuse_eph') == 'yes',
+                        has_plt=recipe.get('ORGgen_plt') == 'yes')
+        # ORGtparts=R starts a tile part at every resolution, other divisions depend on the packets
+        if recipe.get('ORGtparts') == 'R':
+            expected['tile_part_count'] = tile_count * (image_data.level_count_for_size() + 1)
+        elif 'ORGtparts' not in recipe:
+            expected['tile_part_count'] = tile_count
+        return expected
+
+    def encode(self, image_data: AviImageData, input_file: str, input_header: AviImageHeader,
+               dest_file_path: Union[str, Path], decoded: Optional[Callable[[Image.Image], None]]=None) -> None:
+        # kdu_compress reads input_file itself, so there is no decoded image
+        kdu_args = self.kdu_args(image_data, input_header)
+        self.logger.debug('Kakadu args are {}'.format(kdu_args))
+        try:
+            self.kakadu.kdu_compress(input_file, str(dest_file_path), kakadu_options=kdu_args)
+        except KakaduError as kdu_e:
+            raise AviJp2EncoderError(f'{kdu_e.__class__.__name__} {kdu_e}') from kdu_e
+
+    def encode_bands(self, image_data: AviImageData, bands: Iterable[Tuple[bytes, int]], input_header: AviImageHeader,
+                     dest_file_path: Union[str, Path]) -> None:
+        try:
+            AviKduStream(input_header.mode, (input_header.width, input_header.height), kakadu_base_path=self.kakadu_base_path,
+                         scratch_dir=self.scratch_dir).compress(bands, dest_file_path, self.kdu_args(image_data, input_header))
+        except AviKduStreamError as kdu_e:
+            raise AviJp2EncoderError(f'{kdu_e.__class__.__name__} {kdu_e}') from kdu_e
+
+class AviOpenJpegEncoder(AviJp2Encoder):
+    """
+    Encodes with openjpeg through pillow, so no kakadu licence is needed. openjpeg encodes code blocks on
+    num_threads threads (OPJ_NUM_THREADS). Pillow writes the colour space from the image mode, sRGB for rgb and
+    greyscale for grey, which is what jp2_space asks kakadu for, and holds the whole image in memory while encoding
+    """
+    name = 'openjpeg'
+    stage = 'openjpeg_compress'
+
+    def save_options(self, image_data: AviImageData, input_header: AviImageHeader) -> dict:
+        """
+        Pillow JPEG2000 save options. openjpeg takes compression ratios, most compressed layer first, where kakadu takes
+        bits per pixel
+        """
+        raw_bits_per_pixel = sum(input_header.bits_per_sample)
+        rates = [float(rate) for rate in image_data.layer_rates().split(',')]
+        tile_side = int(image_data.tile_size.split(',')[0])
+        return dict(avi_const.JP2_PROFILES[self.profile]['openjpeg_options'],
+                    quality_mode='rates',
+                    quality_layers=sorted((round(raw_bits_per_pixel / rate, 4) for rate in rates), reverse=True),
+                    num_resolutions=image_data.level_count_for_size() + 1,
+                    tile_size=(tile_side, tile_side),
+                    # pillow only applies the colour transform to rgb, not to rgba
+                    mct=1 if input_header.samples_per_pixel == 3 else 0)
+
+    def settings(self, image_data: AviImageData, input_header: AviImageHeader) -> list:
+        return sorted(f'{option}={value}' for option, value in self.save_options(image_data, input_header).items())
+
+    def tool_versions(self) -> Dict[str, str]:
+        return { 'openjpeg': features.version('jpg_2000') or '', 'pillow': PIL.__version__ }
+
+    def expected_structure(self, image_data: AviImageData, input_header: AviImageHeader) -> dict:
+        save_options = self.save_options(image_data, input_header)
+        # openjpeg halves the precinct for each lower resolution
+        precinct_width, precinct_height = save_options.get('precinct_size') or (0, 0)
+        return dict(super().expected_structure(image_data, input_header),
+                    precincts=tuple((max(precinct_width >> level, 1), max(precinct_height >> level, 1))
+                                    for level in reversed(range(save_options['num_resolutions']))) if precinct_width else (),
+                    codeblock_size=tuple(save_options['codeblock_size']),
+                    progression=save_options['progression'],
+                    reversible=not save_options['irreversible'],
+                    mct=save_options['mct'],
+                    uses_sop=False,
+                    uses_eph=False,
+                    has_plt=save_options['plt'],
+                    tile_part_count=self._tile_count(image_data, input_header))
+
+    def encode(self, image_data: AviImageData, input_file: str, input_header: AviImageHeader,
+               dest_file_path: Union[str, Path], decoded: Optional[Callable[[Image.Image], None]]=None) -> None:
+        if not features.check('jpg_2000'):
+            raise AviJp2EncoderError('Pillow was built without openjpeg')
+        save_options = self.save_options(image_data, input_header)
+        self.logger.debug('Openjpeg options are {}'.format(save_options))
+        # openjpeg reads the thread count when each encoder is created, so it is only set for this encode
+        previous_threads = os.environ.get('OPJ_NUM_THREADS')
+        os.environ['OPJ_NUM_THREADS'] = str(self.num_threads or os.cpu_count())
+        try:
+            with Image.open(input_file) as img:
+                img.save(dest_file_path, 'JPEG2000', **save_options)
+                if decoded is not None:
+                    decoded(img)
+        except (OSError, ValueError) as opj_e:
+            if os.path.exists(dest_file_path):
+                os.unlink(dest_file_path)
+            raise AviJp2EncoderError(f'{opj_e.__class__.__name__} {opj_e}') from opj_e
+        finally:
+            if previous_threads is None:
+                os.environ.pop('OPJ_NUM_THREADS', None)
+            else:
+                os.environ['OPJ_NUM_THREADS'] = previous_threads
+
+JP2_ENCODER_CLASSES = {encoder_class.name: encoder_class for encoder_class in [AviKakaduEncoder, AviOpenJpegEncoder]}
+
+def jp2_encoder(name: str=avi_const.JP2_ENCODER, num_threads: Optional[int]=None,
+                scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR, profile: str=avi_const.JP2_PROFILE) -> AviJp2Encoder:
+    if name not in JP2_ENCODER_CLASSES:
+        raise AviJp2EncoderError(f'Unknown jp2 encoder {name}. Expected one of {", ".join(avi_const.JP2_ENCODERS)}')
+    return JP2_ENCODER_CLASSES[name](num_threads, scratch_dir, profile)
+
+__all__ = ['AviJp2Encoder', 'AviKakaduEncoder', 'AviOpenJpegEncoder', 'AviJp2EncoderError', 'jp2_encoder']
@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import errno
+import shutil
+import logging
+from pathlib import Path
+from typing import Union, List, Tuple, Optional, Iterator, Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from image_processing.exceptions import ValidationError
+
+from . import constants as avi_const
+from .avi_image_data import AviImageData
+from .avi_image_header import AviImageHeader, check_header_suitable_for_jp2_conversion
+from .avi_memory_estimate import icc_conversion_method, estimate_jp2_memory
+
+#pylint: disable=missing-class-docstring
+class AviJp2PreflightError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+def _list_dir(dir_path: Path) -> Tuple[List[Path], List[Path]]:
+    files, sub_dirs = [], []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_dirs.append(Path(entry.path))
+            elif entry.is_file():
+                files.append(Path(entry.path))
+    return sorted(files), sorted(sub_dirs)
+
+def walk_source_paths(paths: Iterable[Union[str, Path]], valid_extensions: List[str],
+                      walk_threads: int=avi_const.PREFLIGHT_WALK_THREADS) -> Iterator[Tuple[Path, Optional[str]]]:
+    """
+    Yields (path, None) for every file in paths and every file with one of the lower case valid_extensions, in any case,
+    under the directories in paths, and (directory, error message) for directories that can't be listed. Directories are
+    listed walk_threads at a time and their files yielded as soon as each listing is done, so nothing waits for the whole tree
+    """
+    with ThreadPoolExecutor(max_workers=walk_threads) as executor:
+        listings = {}
+        for path in paths:
+            path = Path(path)
+            if path.is_dir():
+                listings[executor.submit(_list_dir, path)] = path
+            elif path.exists():
+                yield path, None
+            else:
+                raise FileNotFoundError(
+                        errno.ENOENT, os.strerror(errno.ENOENT), str(path))
+        while listings:
+            done, _ = wait(listings, return_when=FIRST_COMPLETED)
+            for listing in done:
+                dir_path = listings.pop(listing)
+                try:
+                    files, sub_dirs = listing.result()
+                except OSError as os_e:
+                    yield dir_path, f'{os_e.__class__.__name__} {os_e}'
+                    continue
+                for file_path in files:
+                    if file_path.suffix.lower() in valid_extensions:
+                        yield file_path, None
+                for sub_dir in sub_dirs:
+                    listings[executor.submit(_list_dir, sub_dir)] = sub_dir
+
+def preflight_tiff(src_file_path: Union[str, Path]) -> dict:
+    """
+    What :class:`~avi_py.avi_jp2_processor.AviJp2Processor` would decide about src_file_path, read from its header only.
+    suitable is False with the reasons in message if the conversion would fail
+    """
+    result = { 'src_file_path': str(src_file_path), 'suitable': False, 'message': '' }
+    try:
+        header = AviImageHeader.read(src_file_path)
+    except Exception as ex: #pylint: disable=broad-except
+        result['message'] = f'{ex.__class__.__name__} {ex}'
+        return result
+    result.update({
+        'mode': header.mode,
+        'width': header.width,
+        'height': header.height,
+        'bits_per_sample': list(header.bits_per_sample),
+        'compression': header.compression,
+        'is_tiled': header.is_tiled,
+        'has_alpha': header.has_alpha,
+        'has_icc_profile': header.icc_profile is not None,
+    })
+    # colour sources are validated after the icc conversion gives them the target profile
+    try:
+        check_header_suitable_for_jp2_conversion(
+            header._replace(icc_profile=avi_const.target_icc_profile()) if header.is_color else header,
+            require_icc_profile_for_colour=True, require_icc_profile_for_greyscale=False)
+    except ValidationError as v_e:
+        result['message'] = f'ValidationError: {v_e}'
+        return result
+    except Exception as ex: #pylint: disable=broad-except
+        result['message'] = f'{ex.__class__.__name__} {ex}'
+        return result
+
+    try:
+        image_data = AviImageData(src_file_path, image_header=header)
+        icc_conversion = icc_conversion_method(image_data)
+        result.update({
+            'src_quality': image_data.src_quality,
+            'needs_icc_profile': image_data.needs_icc_profile(),
+            'icc_conversion': icc_conversion,
+            'level_count': image_data.level_count_for_size(),
+            'estimated_memory_bytes': estimate_jp2_memory(image_data),
+        })
+    except Exception as ex: #pylint: disable=broad-except
+        result['message'] = f'{ex.__class__.__name__} {ex}'
+        return result
+    problems = []
+    if not image_data.valid_image_ext():
+        problems.append('Source image is not a .tiff or .tif')
+    if result['level_count'] < 0:
+        problems.append(f'Long side of {image_data.long_dim} pixels is under the {avi_const.IMAGE_MAX_LEVEL_SIZE} pixel minimum')
+    if icc_conversion == 'imagemagick' and shutil.which('convert') is None:
+        problems.append('imagemagick not installed on this system!')
+    result['suitable'] = not problems
+    result['message'] = '. '.join(problems)
+    return result
+
+def _preflight_chunk(src_file_paths: List[str]) -> List[dict]:
+    return [preflight_tiff(src_file_path) for src_file_path in src_file_paths]
+
+class AviJp2Preflight:
+    """
+    Class that checks every tiff under a set of files and directories for jp2 conversion without converting anything.
+    Headers are read on a process pool in chunks of chunk_size files, while the directories are still being walked,
+    and one result dict per file is streamed back as each chunk finishes
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, paths: Iterable[Union[str, Path]],
+                       max_workers: int=avi_const.PREFLIGHT_MAX_WORKERS,
+                       chunk_size: int=avi_const.PREFLIGHT_CHUNK_SIZE) -> None:
+        self.paths = paths
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.suitable_count = 0
+        self.unsuitable_count = 0
+
+    @property
+    def paths(self) -> List[Path]:
+        return self.__paths
+
+    @paths.setter
+    def paths(self, paths: Iterable[Union[str, Path]]) -> None:
+        self.__paths = [Path(path) for path in paths]
+
+    @property
+    def max_workers(self) -> int:
+        return self.__max_workers
+
+    @max_workers.setter
+    def max_workers(self, max_workers: int) -> None:
+        if max_workers < 1:
+            raise AviJp2PreflightError(f'max_workers must be at least 1 not {max_workers}')
+        self.__max_workers = max_workers
+
+    @property
+    def success(self) -> bool:
+        return self.unsuitable_count == 0
+
+    @property
+    def result(self) -> dict:
+        return { 'success': self.success, 'message': self.result_message }
+
+    @property
+    def result_message(self) -> str:
+        total = self.suitable_count + self.unsuitable_count
+        return f'{self.suitable_count} of {total} files suitable for jp2 conversion'
+
+    def iter_results(self) -> Iterator[dict]:
+        """
+        Yields the preflight_tiff result of every file as soon as its chunk is done. Results are not in walk order
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            pending, chunk = set(), []
+            for src_path, walk_error in walk_source_paths(self.paths, avi_const.VALID_IMAGE_EXTENSIONS):
+                if walk_error is not None:
+                    yield self.__count({ 'src_file_path': str(src_path), 'suitable': False, 'message': walk_error })
+                    continue
+                chunk.append(str(src_path))
+                if len(chunk) == self.chunk_size:
+                    pending.add(executor.submit(_preflight_chunk, chunk))
+                    chunk = []
+                # keep every worker busy without queueing the whole tree
+                while len(pending) >= self.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self.__chunk_results(done)
+            if chunk:
+                pending.add(executor.submit(_preflight_chunk, chunk))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self.__chunk_results(done)
+
+    def process_all(self) -> List[dict]:
+        return list(self.iter_results())
+
+    def __chunk_results(self, done) -> Iterator[dict]:
+        for future in done:
+            for result in future.result():
+                yield self.__count(result)
+
+    def __count(self, result: dict) -> dict:
+        if result['suitable']:
+            self.suitable_count += 1
+        else:
+            self.unsuitable_count += 1
+        return result
+
+__all__ = ['AviJp2Preflight', 'AviJp2PreflightError', 'preflight_tiff', 'walk_source_paths']
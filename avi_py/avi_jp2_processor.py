@@ -3,23 +3,29 @@ from __future__ import print_function
 from __future__ import annotations
 
 import tempfile
+import hashlib
 import shutil
 import logging
 import subprocess
 import json
 import os
 from pathlib import Path
-from typing import Union
-from image_processing.exceptions import KakaduError, ValidationError, ImageProcessingError
-from image_processing import validation, kakadu
+from typing import Dict, Union, Optional
+from image_processing.exceptions import ValidationError, ImageProcessingError
 from image_processing.conversion import Converter
 from image_processing.kakadu import Kakadu
-from PIL import Image
+import PIL
 from PIL.ImageCms import PyCMSError
 from . import constants as avi_const
+from .avi_derivative_sidecar import AviDerivativeSidecar
+from .avi_exiftool import AviExiftoolError, shared_exiftool
+from .avi_icc_converter import AviStripIccConverter, AviIccConverterError
+from .avi_image_derivatives import AviImageDerivatives, AviImageDerivativesError
+from .avi_jp2_encoder import AviJp2Encoder, AviJp2EncoderError, AviKakaduEncoder, jp2_encoder
+from .avi_jp2_verifier import verify_jp2
+from .avi_metrics import AviStageTimer, timed_stage, file_size, record_prometheus_metrics
 from .avi_image_data import AviImageData
-
-Image.MAX_IMAGE_PIXELS = None
+from .avi_image_header import AviImageHeader, check_header_suitable_for_jp2_conversion
 
 #pylint: disable=missing-class-docstring
 class AviJp2ProcessorError(Exception):
@@ -29,11 +35,14 @@ class AviJp2ProcessorError(Exception):
 
 class AviConverter(Converter):
     """
-    Overloaded class for coversion that allows exiftool to be run in quiet mode
+    Overloaded class for coversion that allows exiftool to be run in quiet mode, and optionally through a persistent
+    exiftool -stay_open process shared by every conversion in the worker
     """
-    def __init__(self, exiftool_path='exiftool', quiet=False):
+    def __init__(self, exiftool_path='exiftool', quiet=False, timer=None, stay_open=avi_const.EXIFTOOL_STAY_OPEN):
         super().__init__(exiftool_path)
         self.quiet = quiet
+        self.timer = timer
+        self.stay_open = stay_open
 #pylint: disable=raise-missing-from
     def copy_over_embedded_metadata(self, input_image_filepath, output_image_filepath, write_only_xmp=False):
         """
@@ -56,35 +65,100 @@ class AviConverter(Converter):
         command_options += [output_image_filepath]
         self.logger.debug(' '.join(command_options))
         try:
-            subprocess.check_call(command_options, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as error:
+            with timed_stage(self.timer, 'exiftool'):
+                if self.stay_open:
+                    shared_exiftool(self.exiftool_path).execute(*command_options[1:])
+                else:
+                    subprocess.check_call(command_options, stderr=subprocess.STDOUT)
+        except (subprocess.CalledProcessError, AviExiftoolError) as error:
             raise ImageProcessingError('Exiftool at {0} failed to copy from {1}. Command: {2}, Error: {3}'.
                                        format(self.exiftool_path, input_image_filepath, ' '.join(command_options), error))
 #pylint: enable=raise-missing-from
 
 
+#pylint: disable=too-many-instance-attributes
 class AviJp2Processor:
     """
     Class that checks and converts a source tiff image to a jp2 derivative
     """
-    def __init__(self, input_file_path: Union[str, Path], destination_file: Union[str, Path]) -> None:
-        self.image_data = AviImageData(input_file_path)
-        self.kakadu = Kakadu(kakadu_base_path=avi_const.KAKADU_BASE_PATH)
-        self.converter = AviConverter(exiftool_path=avi_const.EXIFTOOL_PATH, quiet=not avi_const.CONSOLE_DEBUG_MODE)
+    #pylint: disable=too-many-arguments
+    def __init__(self, input_file_path: Union[str, Path], destination_file: Union[str, Path], kdu_num_threads: int=None,
+                 scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR, incremental: bool=avi_const.INCREMENTAL,
+                 exiftool_stay_open: bool=avi_const.EXIFTOOL_STAY_OPEN, stream_to_kakadu: bool=avi_const.KDU_STREAM,
+                 encoder: str=avi_const.JP2_ENCODER, profile: str=avi_const.JP2_PROFILE,
+                 target_bytes_per_pixel: float=avi_const.JP2_TARGET_BYTES_PER_PIXEL,
+                 target_bytes: int=avi_const.JP2_TARGET_BYTES,
+                 derivative_paths: Optional[Dict[str, Union[str, Path]]]=None) -> None:
+        self.timer = AviStageTimer()
+        # built by the encoder setter, once the settings it is built with are set
+        self.__encoder = None
+        self.profile = profile
+        with self.timer.stage('header'):
+            self.image_data = AviImageData(input_file_path, tile_size=avi_const.JP2_PROFILES[profile]['tile_size'])
+        self.target_bytes_per_pixel = target_bytes_per_pixel
+        self.target_bytes = target_bytes
+        self.image_data.target_bits_per_pixel = self.__budget_bits_per_pixel()
+        self.kdu_num_threads = kdu_num_threads
+        self.scratch_dir = scratch_dir
+        self.incremental = incremental
+        self.stream_to_kakadu = stream_to_kakadu
+        self.encoder = encoder
+        self.verify = avi_const.JP2_VERIFY
+        # what AviJp2Structure found wrong with the jp2, None until it has been verified
+        self.jp2_mismatches = None
+        self.derivative_paths = derivative_paths or {}
+        # {name: {'path', 'width', 'height', 'bytes'}} of the image derivatives written
+        self.derivative_results = {}
+        self.skipped = False
+        self.converter = AviConverter(exiftool_path=avi_const.EXIFTOOL_PATH, quiet=not avi_const.CONSOLE_DEBUG_MODE, timer=self.timer,
+                                      stay_open=exiftool_stay_open)
         self.destination_file = destination_file
         self.success = False
         self.result_message = ''
         self.logger = logging.getLogger('avi_py')
 
     @classmethod
-    def process_jp2(cls, input_file_path: Union[str, Path], destination_file: Union[str, Path]) -> AviJp2Processor:
-        jp2_processor = cls(input_file_path, destination_file)
+    def process_jp2(cls, input_file_path: Union[str, Path], destination_file: Union[str, Path], kdu_num_threads: int=None,
+                    scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR, incremental: bool=avi_const.INCREMENTAL,
+                    exiftool_stay_open: bool=avi_const.EXIFTOOL_STAY_OPEN,
+                    stream_to_kakadu: bool=avi_const.KDU_STREAM, encoder: str=avi_const.JP2_ENCODER,
+                    profile: str=avi_const.JP2_PROFILE, target_bytes_per_pixel: float=avi_const.JP2_TARGET_BYTES_PER_PIXEL,
+                    target_bytes: int=avi_const.JP2_TARGET_BYTES,
+                    derivative_paths: Optional[Dict[str, Union[str, Path]]]=None) -> AviJp2Processor:
+        """
+        Converts input_file_path to a jp2 and writes the image derivatives in derivative_paths ({name in
+        IMAGE_DERIVATIVES: dest path}) from the same decode of the source
+        """
+        jp2_processor = cls(input_file_path, destination_file, kdu_num_threads, scratch_dir, incremental, exiftool_stay_open,
+                            stream_to_kakadu, encoder, profile, target_bytes_per_pixel, target_bytes, derivative_paths)
         jp2_processor.convert_to_jp2()
         return jp2_processor
+    #pylint: enable=too-many-arguments
 
     @property
     def result(self) -> dict:
-        return { 'success': self.success, 'message': self.result_message }
+        result = { 'success': self.success, 'message': self.result_message }
+        if self.skipped:
+            result['skipped'] = True
+        if self.jp2_mismatches is not None:
+            result['jp2_mismatches'] = self.jp2_mismatches
+        if self.derivative_paths:
+            result['derivatives'] = self.derivative_results
+        if self.timer.stopped:
+            result.update({
+                'timings': self.timer.timings(),
+                'input_bytes': file_size(self.image_data.image_src_path),
+                'output_bytes': file_size(self.destination_file) if self.success else 0,
+            })
+            if self.success and not self.skipped:
+                result.update({
+                    'layer_rates': [float(rate) for rate in self.image_data.layer_rates().split(',')],
+                    'bits_per_pixel': round(result['output_bytes'] * 8 / self.__pixel_count(), 4),
+                })
+        budget_bits_per_pixel = self.__budget_bits_per_pixel()
+        if budget_bits_per_pixel is not None:
+            result['target_bits_per_pixel'] = round(budget_bits_per_pixel, 4)
+        return result
 
     @property
     def success(self) -> bool:
@@ -102,6 +176,99 @@ class AviJp2Processor:
     def result_message(self, message: str) -> None:
         self.__result_message = message
 
+    @property
+    def kdu_num_threads(self) -> Union[None, int]:
+        return self.__kdu_num_threads
+
+    @kdu_num_threads.setter
+    def kdu_num_threads(self, kdu_num_threads: Union[None, int]) -> None:
+        self.__kdu_num_threads = kdu_num_threads
+        if self.__encoder is not None:
+            self.__encoder.num_threads = kdu_num_threads
+
+    @property
+    def scratch_dir(self) -> Union[None, str]:
+        return self.__scratch_dir
+
+    @scratch_dir.setter
+    def scratch_dir(self, scratch_dir: Union[None, str, Path]) -> None:
+        self.__scratch_dir = str(scratch_dir) if scratch_dir is not None else None
+        if self.__encoder is not None:
+            self.__encoder.scratch_dir = self.__scratch_dir
+
+    @property
+    def incremental(self) -> bool:
+        return self.__incremental
+
+    @incremental.setter
+    def incremental(self, incremental: bool) -> None:
+        self.__incremental = incremental
+
+    @property
+    def stream_to_kakadu(self) -> bool:
+        return self.__stream_to_kakadu
+
+    @stream_to_kakadu.setter
+    def stream_to_kakadu(self, stream_to_kakadu: bool) -> None:
+        self.__stream_to_kakadu = stream_to_kakadu
+
+    @property
+    def target_bytes_per_pixel(self) -> float:
+        return self.__target_bytes_per_pixel
+
+    @target_bytes_per_pixel.setter
+    def target_bytes_per_pixel(self, target_bytes_per_pixel: float) -> None:
+        if target_bytes_per_pixel < 0:
+            raise AviJp2ProcessorError(f'target_bytes_per_pixel must be 0 or more not {target_bytes_per_pixel}')
+        self.__target_bytes_per_pixel = target_bytes_per_pixel
+
+    @property
+    def target_bytes(self) -> int:
+        return self.__target_bytes
+
+    @target_bytes.setter
+    def target_bytes(self, target_bytes: int) -> None:
+        if target_bytes < 0:
+            raise AviJp2ProcessorError(f'target_bytes must be 0 or more not {target_bytes}')
+        self.__target_bytes = target_bytes
+
+    @property
+    def profile(self) -> str:
+        return self.__profile
+
+    @profile.setter
+    def profile(self, profile: str) -> None:
+        avi_const.check_jp2_profile(profile, AviJp2ProcessorError)
+        self.__profile = profile
+        if self.__encoder is not None:
+            self.__encoder.profile = profile
+
+    @property
+    def encoder(self) -> AviJp2Encoder:
+        return self.__encoder
+
+    @encoder.setter
+    def encoder(self, encoder: str) -> None:
+        if encoder not in avi_const.JP2_ENCODERS:
+            raise AviJp2ProcessorError(f'Unknown jp2 encoder {encoder}. Expected one of {", ".join(avi_const.JP2_ENCODERS)}')
+        self.__encoder = jp2_encoder(encoder, self.kdu_num_threads, self.scratch_dir, self.profile)
+
+    @property
+    def derivative_paths(self) -> Dict[str, str]:
+        return self.__derivative_paths
+
+    @derivative_paths.setter
+    def derivative_paths(self, derivative_paths: Dict[str, Union[str, Path]]) -> None:
+        unknown_names = set(derivative_paths) - set(avi_const.IMAGE_DERIVATIVES)
+        if unknown_names:
+            raise AviJp2ProcessorError(f'Unknown image derivatives {sorted(unknown_names)}. '
+                                       f'Expected some of {", ".join(avi_const.IMAGE_DERIVATIVES)}')
+        self.__derivative_paths = {name: str(dest_path) for name, dest_path in derivative_paths.items()}
+
+    @property
+    def kakadu(self) -> Optional[Kakadu]:
+        return self.encoder.kakadu if isinstance(self.encoder, AviKakaduEncoder) else None
+
     @property
     def destination_file(self) -> str:
         return self.__destination_file
@@ -114,47 +281,69 @@ class AviJp2Processor:
         return json.dumps(self.result)
 
     def convert_to_jp2(self) -> None:
+        """
+        Converts the source and records how long each stage took in result['timings']
+        """
+        try:
+            self.__convert_to_jp2()
+        finally:
+            self.timer.stop()
+            record_prometheus_metrics('jp2', self.result)
+
+    def __convert_to_jp2(self) -> None:
         try:
             if not self.image_data.valid_image_ext():
                 raise AviJp2ProcessorError('Source image is not a .tiff or .tif')
 
-            kdu_args = self.__calculate_kdu_options() + self.__calculate_kdu_recipe()
-            input_file = str(self.image_data.image_src_path)
+            sidecar = self.__current_sidecar()
+            if self.skipped:
+                self.__write_derivatives()
+                return
 
-            if self.image_data.src_quality == 'color':
+            input_file = str(self.image_data.image_src_path)
+            input_header = self.image_data.image_header
+            stream = self.stream_to_kakadu and self.encoder.can_stream and self.can_stream_to_kakadu()
+            derivatives = self.__image_derivatives(self.derivative_paths) if self.derivative_paths else None
+
+            if stream:
+                self.logger.debug('Streaming icc converted pixels to kakadu')
+                input_header = input_header._replace(icc_profile=avi_const.target_icc_profile())
+            elif self.image_data.src_quality == 'color':
                 self.logger.debug('Adding icc profile to image')
-                input_file = self.convert_icc_profile()
+                with self.timer.stage('icc_profile'):
+                    input_file = self.convert_icc_profile(derivatives)
+                if input_file != str(self.image_data.image_src_path):
+                    with self.timer.stage('header'):
+                        input_header = AviImageHeader.read(input_file)
                 self.logger.debug('Successfully added icc profile')
 
             self.logger.debug('Pre validating image at {}'.format(input_file))
             try:
-                validation.check_image_suitable_for_jp2_conversion(
-                    input_file, require_icc_profile_for_colour=True,
-                    require_icc_profile_for_greyscale=False)
+                with self.timer.stage('validation'):
+                    check_header_suitable_for_jp2_conversion(
+                        input_header, require_icc_profile_for_colour=True,
+                        require_icc_profile_for_greyscale=False)
             except ValidationError as v_e:
                 msg = f'ValidationError: {v_e}'
                 raise AviJp2ProcessorError(msg) from v_e
 
             self.logger.debug('image {} is able to be converted to jp2!'.format(input_file))
 
-            with Image.open(input_file) as input_pil:
-                if input_pil.mode == 'RGBA':
-                    if kakadu.ALPHA_OPTION not in kdu_args:
-                        kdu_args += [kakadu.ALPHA_OPTION]
-
-            self.logger.debug('Kakadu args are {}'.format(kdu_args))
-            self.logger.debug('Preparing to output jp2...')
+            self.logger.debug('Preparing to output jp2 with {}...'.format(self.encoder.name))
             try:
-                self.kakadu.kdu_compress(input_file, self.destination_file, kakadu_options=kdu_args)
-            except (KakaduError, OSError) as kdu_e:
-                msg = f'{kdu_e.__class__.__name__} {kdu_e}'
-                raise AviJp2ProcessorError(msg) from kdu_e
+                self.__encode_to_budget(input_file, input_header, stream, derivatives)
             finally:
                 # Deletes the tmp file created from the convert_icc_profile method.
                 if Path(input_file).exists() and input_file != str(self.image_data.image_src_path):
                     self.logger.debug('Removing {}'.format(input_file))
                     os.unlink(input_file)
+            if self.verify:
+                self.__verify(input_header)
+            self.__write_derivatives(derivatives)
             self.logger.debug('Successfully converted to jp2!')
+            if sidecar is not None:
+                with self.timer.stage('sidecar'):
+                    sidecar.write()
             self.__set_success_result()
         except AviJp2ProcessorError as avi_ex:
             msg = str(avi_ex)
@@ -162,21 +351,174 @@ class AviJp2Processor:
             self.logger.error('Error occured processing file for Jp2 conversion!')
             self.logger.error('Check result and logs for more details.')
 
-    def convert_icc_profile(self) -> str:
+    def __encode(self, input_file: str, input_header: AviImageHeader, stream: bool,
+                 derivatives: Optional[AviImageDerivatives]=None) -> None:
         try:
-            #pylint: disable=consider-using-with
-            out_file = tempfile.NamedTemporaryFile(prefix='image_processing-icc-convert-out', suffix=self.image_data.image_ext, delete=False)
-            #pylint: enable=consider-using-with
-            with tempfile.NamedTemporaryFile(prefix='image-processing_', suffix=self.image_data.image_ext) as temp_tiff_file_obj:
-                temp_tiff_filepath = temp_tiff_file_obj.name
-                shutil.copy(str(self.image_data.image_src_path), temp_tiff_filepath)
-                if self.image_data.needs_icc_profile():
-                    self.__convert_icc_profile_with_magick(temp_tiff_filepath, out_file.name)
-                else:
-                    self.logger.debug('Adding icc profile with pillow..')
-                    self.converter.convert_icc_profile(temp_tiff_filepath, out_file.name, str(avi_const.ICC_PROFILE_PATH))
+            if stream:
+                bands = AviStripIccConverter(input_file).iter_bands()
+                if derivatives is not None:
+                    bands = derivatives.tee(bands, input_header.mode)
+                # the icc conversion (and box reducing the derivatives) runs inside this stage, overlapped with the encode
+                with self.timer.stage('kdu_stream'):
+                    self.encoder.encode_bands(self.image_data, bands, input_header, self.destination_file)
+            else:
+                # an encoder that decodes the tiff itself hands the image on, unless the icc conversion's bands were kept
+                decoded = derivatives.keep if derivatives is not None and not derivatives.has_source else None
+                with self.timer.stage(self.encoder.stage):
+                    self.encoder.encode(self.image_data, input_file, input_header, self.destination_file, decoded)
+        except (AviJp2EncoderError, AviIccConverterError, AviImageDerivativesError, OSError) as enc_e:
+            msg = str(enc_e) if isinstance(enc_e, (AviJp2EncoderError, AviImageDerivativesError)) else f'{enc_e.__class__.__name__} {enc_e}'
+            raise AviJp2ProcessorError(msg) from enc_e
+
+    def __encode_to_budget(self, input_file: str, input_header: AviImageHeader, stream: bool,
+                           derivatives: Optional[AviImageDerivatives]=None) -> None:
+        """
+        Encodes the jp2 and, when it is encoded to a size budget and overshot it, once more with its rates scaled down
+        by the overshoot. Streamed bands only pass by derivatives on the first encode
+        """
+        self.__encode(input_file, input_header, stream, derivatives)
+        target_bits_per_pixel = self.image_data.target_bits_per_pixel
+        if target_bits_per_pixel is None:
+            return
+        achieved_bits_per_pixel = file_size(self.destination_file) * 8 / self.__pixel_count()
+        if achieved_bits_per_pixel > target_bits_per_pixel * (1 + avi_const.JP2_TARGET_TOLERANCE):
+            self.logger.debug('Jp2 is {} bits per pixel over a budget of {}, encoding again'.format(
+                achieved_bits_per_pixel, target_bits_per_pixel))
+            self.image_data.target_bits_per_pixel = target_bits_per_pixel ** 2 / achieved_bits_per_pixel
+            self.__encode(input_file, input_header, stream)
+
+    def __budget_bits_per_pixel(self) -> Optional[float]:
+        """
+        Top layer bit rate the smaller of the size budgets allows, None without a budget
+        """
+        budgets = []
+        if self.target_bytes_per_pixel > 0:
+            budgets.append(self.target_bytes_per_pixel * 8)
+        if self.target_bytes > 0:
+            budgets.append(self.target_bytes * 8 / self.__pixel_count())
+        return min(budgets) if budgets else None
+
+    def __pixel_count(self) -> int:
+        return self.image_data.image_header.width * self.image_data.image_header.height
+
+    def __verify(self, input_header: AviImageHeader) -> None:
+        """
+        Checks the jp2 is complete and has the structure the encoder was asked for, without decoding it. Mismatches are
+        only reported in the result
+        """
+        with self.timer.stage('verify'):
+            self.jp2_mismatches = verify_jp2(self.destination_file, self.encoder.expected_structure(self.image_data, input_header))
+        if self.jp2_mismatches:
+            self.logger.warning('Jp2 verification of {} found: {}'.format(self.destination_file, '; '.join(self.jp2_mismatches)))
+
+    def __image_derivatives(self, derivative_paths: Dict[str, str]) -> AviImageDerivatives:
+        header = self.image_data.image_header
+        # colour derivatives are made from icc converted pixels, greyscale ones from the source's own
+        icc_profile = avi_const.target_icc_profile() if self.image_data.src_quality == 'color' else self.image_data.icc_profile
+        return AviImageDerivatives(derivative_paths, (header.width, header.height), icc_profile)
+
+    def __write_derivatives(self, derivatives: Optional[AviImageDerivatives]=None) -> None:
+        """
+        Writes the image derivatives from the source pixels derivatives saw on their way to the encoder or through the
+        icc conversion, or else from a reduced resolution decode of the jp2. When the jp2 was skipped only the
+        derivatives that aren't up to date are written, from the jp2
+        """
+        if not self.derivative_paths:
+            return
+        sidecars = {}
+        if self.incremental:
+            with self.timer.stage('sidecar'):
+                sidecars = {name: self.__image_derivative_sidecar(name) for name in self.derivative_paths}
+        if self.skipped:
+            stale_paths = {name: dest_path for name, dest_path in self.derivative_paths.items() if not sidecars[name].is_current()}
+            if not stale_paths:
+                return
+            derivatives = self.__image_derivatives(stale_paths)
+        try:
+            with self.timer.stage('derivatives'):
+                self.derivative_results.update(derivatives.write(self.destination_file))
+        except (AviImageDerivativesError, OSError) as der_e:
+            msg = str(der_e) if isinstance(der_e, AviImageDerivativesError) else f'{der_e.__class__.__name__} {der_e}'
+            raise AviJp2ProcessorError(msg) from der_e
+        if sidecars:
+            with self.timer.stage('sidecar'):
+                for name in derivatives.derivative_paths:
+                    sidecars[name].write()
+
+    def __image_derivative_sidecar(self, name: str) -> AviDerivativeSidecar:
+        """
+        Sidecar recording the IMAGE_DERIVATIVES settings, icc profile and pillow version an image derivative is built with
+        """
+        settings = dict(avi_const.IMAGE_DERIVATIVES[name], name=name,
+                        icc_profile=hashlib.sha256(avi_const.target_icc_profile()).hexdigest())
+        return AviDerivativeSidecar(self.image_data.image_src_path, self.derivative_paths[name], settings, {'pillow': PIL.__version__})
+
+    def derivative_sidecar(self) -> AviDerivativeSidecar:
+        """
+        Sidecar recording the encoder options (minus thread counts and quiet mode, which don't change the output),
+        the target icc profile and the encoder and pillow versions the jp2 is built with. Switching encoder changes
+        the settings, so the jp2 is rebuilt
+        """
+        settings = {
+            self.encoder.name: self.encoder.settings(self.image_data, self.image_data.image_header),
+            'icc_profile': hashlib.sha256(avi_const.target_icc_profile()).hexdigest(),
+        }
+        tools = dict(self.encoder.tool_versions(), pillow=PIL.__version__)
+        return AviDerivativeSidecar(self.image_data.image_src_path, self.destination_file, settings, tools)
+
+    def __current_sidecar(self) -> Optional[AviDerivativeSidecar]:
+        """
+        The sidecar for an incremental run, None otherwise. Sets the skipped result if the jp2 is up to date
+        """
+        if not self.incremental:
+            return None
+        with self.timer.stage('sidecar'):
+            sidecar = self.derivative_sidecar()
+            if sidecar.is_current():
+                self.logger.debug('{} is up to date with {}. Skipping conversion'.format(self.destination_file, self.image_data.image_src_path))
+                self.__set_skipped_result()
+        return sidecar
+
+    def can_stream_to_kakadu(self) -> bool:
+        """
+        Whether the source can be icc converted straight into kdu_compress. Only 8 bit RGB tiffs the strip converter
+        supports that don't already carry the target profile can, everything else has nothing to gain or isn't supported
+        """
+        header = self.image_data.image_header
+        return header.mode == 'RGB' and AviStripIccConverter.supports(header) and header.icc_profile != avi_const.target_icc_profile()
+
+    def convert_icc_profile(self, derivatives: Optional[AviImageDerivatives]=None) -> str:
+        """
+        Returns the path of a tiff carrying the target sRGB icc profile. The source is read in place and at most one
+        output file is written to the scratch dir. Sources that already embed the target profile are returned as is.
+        Uncompressed 8 bit tiffs are converted in bands of rows with bounded memory, which pass through derivatives on
+        the way, anything else is loaded whole
+        """
+        src_file = str(self.image_data.image_src_path)
+        if self.image_data.icc_profile == avi_const.target_icc_profile():
+            self.logger.debug('Source already has the target icc profile. Skipping conversion')
+            return src_file
+        #pylint: disable=consider-using-with
+        out_file = tempfile.NamedTemporaryFile(prefix='image_processing-icc-convert-out', suffix=self.image_data.image_ext, dir=self.scratch_dir, delete=False)
+        #pylint: enable=consider-using-with
+        out_file.close()
+        try:
+            if self.image_data.needs_icc_profile():
+                self.__convert_icc_profile_with_magick(src_file, out_file.name)
+            elif AviStripIccConverter.supports(self.image_data.image_header):
+                self.logger.debug('Converting icc profile in strips..')
+                strip_converter = AviStripIccConverter(src_file, avi_const.ICC_PROFILE_PATH)
+                bands = strip_converter.iter_bands()
+                if derivatives is not None:
+                    bands = derivatives.tee(bands, self.image_data.image_header.mode)
+                strip_converter.convert(out_file.name, bands)
+            else:
+                self.logger.debug('Adding icc profile with pillow..')
+                self.converter.convert_icc_profile(src_file, out_file.name, str(avi_const.ICC_PROFILE_PATH))
             return out_file.name
-        except (AssertionError, PyCMSError, ImageProcessingError, IOError) as a_e:
+        except (AssertionError, PyCMSError, ImageProcessingError, AviIccConverterError, IOError) as a_e:
+            if Path(out_file.name).exists():
+                os.unlink(out_file.name)
             msg = f'{a_e.__class__.__name__}{a_e}'
             raise AviJp2ProcessorError(msg) from a_e
 
@@ -194,25 +536,19 @@ class AviJp2Processor:
             msg = f'ICC Magick Convert Failed!\n Reason: {sp_e}'
             raise IOError(msg) from sp_e
 
-    def __calculate_kdu_recipe(self) -> list:
-        return [
-          "Stiles={" + self.image_data.tile_size + "}",
-          f'Clevels={self.image_data.level_count_for_size()}',
-          f'Clayers={avi_const.KDU_DEFAULT_LAYER_COUNT}',
-        ] + avi_const.KAKADU_DEFAULT_RECIPE
-
-    def __calculate_kdu_options(self) -> list:
-        return [
-                '-rate', f'{self.image_data.layer_rates()}',
-                '-jp2_space', f'{self.image_data.jp2_space()}'
-        ] + avi_const.KAKADU_DEFAULT_OPTIONS
-
     def __set_success_result(self) -> None:
         self.success = True
         self.result_message = f'Successfully converted and wrote file to {self.destination_file}'
 
+    def __set_skipped_result(self) -> None:
+        self.success = True
+        self.skipped = True
+        self.result_message = f'Jp2 at {self.destination_file} is up to date. Skipped conversion'
+
     def __set_error_result(self, error_msg: str='') -> None:
         self.success = False
         self.result_message = error_msg
 
+#pylint: enable=too-many-instance-attributes
+
 __all__ = ['AviJp2Processor', 'AviJp2ProcessorError']
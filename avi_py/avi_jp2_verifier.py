@@ -0,0 +1,270 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Tuple, List, Union
+
+#pylint: disable=missing-class-docstring
+class AviJp2VerifierError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+JP2_SIGNATURE = b'\x00\x00\x00\x0cjP  \r\n\x87\n'
+PROGRESSION_ORDERS = ['LRCP', 'RLCP', 'RPCL', 'PCRL', 'CPRL']
+# enumerated colour spaces of a jp2 colr box
+SRGB_COLOUR_SPACE = 16
+GREYSCALE_COLOUR_SPACE = 17
+
+_SOC, _SOT, _SOD, _EOC, _SOP = 0xFF4F, 0xFF90, 0xFF93, 0xFFD9, 0xFF91
+_SIZ, _COD, _PLT = 0xFF51, 0xFF52, 0xFF58
+# markers without a length segment
+_BARE_MARKERS = (_SOC, _SOD, _EOC)
+
+class AviJp2Structure(NamedTuple):
+    """
+    What a jp2's boxes and codestream headers say about it, read without decoding any packets
+    """
+    file_bytes: int
+    width: int
+    height: int
+    components: int
+    bits_per_component: Tuple[int, ...]
+    tile_width: int
+    tile_height: int
+    tile_count: int
+    tile_part_count: int
+    levels: int
+    layers: int
+    progression: str
+    codeblock_size: Tuple[int, int]
+    # (width, height) of the precincts of each resolution, lowest first. Empty for the default of one per resolution
+    precincts: Tuple[Tuple[int, int], ...]
+    reversible: bool
+    mct: int
+    uses_sop: bool
+    uses_eph: bool
+    has_plt: bool
+    colour_method: Optional[int]
+    colour_space: Optional[int]
+    icc_profile_bytes: int
+    # truncation and inconsistencies found while walking the file
+    problems: Tuple[str, ...]
+
+    @classmethod
+    def read(cls, jp2_path: Union[str, Path]) -> AviJp2Structure:
+        """
+        Walks the box headers and codestream markers of jp2_path, seeking over the jp2h contents and the packet data
+        so memory use doesn't grow with the file. Raises AviJp2VerifierError if it isn't a jp2 with a codestream
+        """
+        file_bytes = os.path.getsize(jp2_path)
+        with open(jp2_path, 'rb') as jp2:
+            if jp2.read(len(JP2_SIGNATURE)) != JP2_SIGNATURE:
+                raise AviJp2VerifierError(f'{jp2_path} is not a jp2')
+            colour, codestream = None, None
+            for box_type, start, end in _boxes(jp2, len(JP2_SIGNATURE), file_bytes):
+                if box_type == b'jp2h':
+                    colour = _read_colour(jp2, start, end)
+                elif box_type == b'jp2c':
+                    codestream = (start, end)
+                    break
+            if codestream is None:
+                raise AviJp2VerifierError(f'{jp2_path} has no codestream box')
+            fields, problems = _read_codestream(jp2, *codestream)
+        if colour is None:
+            problems.append('No colour specification box')
+            colour = (None, None, 0)
+        if codestream[1] > file_bytes:
+            problems.append(f'Codestream box runs {codestream[1] - file_bytes} bytes past the end of the file')
+        return cls(file_bytes=file_bytes, colour_method=colour[0], colour_space=colour[1], icc_profile_bytes=colour[2],
+                   problems=tuple(problems), **fields)
+
+def _boxes(jp2: BinaryIO, start: int, end: int):
+    """
+    Yields (type, contents start, contents end) of the boxes between start and end
+    """
+    position = start
+    while position + 8 <= end:
+        jp2.seek(position)
+        length, box_type = struct.unpack('>I4s', jp2.read(8))
+        header_bytes = 8
+        if length == 1:
+            length = struct.unpack('>Q', jp2.read(8))[0]
+            header_bytes = 16
+        elif length == 0:
+            length = end - position
+        if length < header_bytes:
+            raise AviJp2VerifierError(f'Box {box_type!r} at {position} has an invalid length {length}')
+        yield box_type, position + header_bytes, position + length
+        position += length
+
+def _read_colour(jp2: BinaryIO, start: int, end: int) -> Optional[Tuple[int, Optional[int], int]]:
+    """
+    (method, enumerated colour space, icc profile bytes) of the first colr box in the jp2h box
+    """
+    for box_type, box_start, box_end in _boxes(jp2, start, end):
+        if box_type == b'colr':
+            jp2.seek(box_start)
+            colour = jp2.read(min(box_end - box_start, 7))
+            if len(colour) < 3:
+                raise AviJp2VerifierError('Colour specification box is too short')
+            method = colour[0]
+            if method == 1:
+                if len(colour) < 7:
+                    raise AviJp2VerifierError('Colour specification box is too short for an enumerated colour space')
+                return method, struct.unpack('>I', colour[3:7])[0], 0
+            return method, None, box_end - box_start - 3
+    return None
+
+def _read_marker(jp2: BinaryIO) -> Tuple[int, bytes]:
+    marker_bytes = jp2.read(2)
+    if len(marker_bytes) < 2:
+        raise EOFError
+    marker = struct.unpack('>H', marker_bytes)[0]
+    if marker in _BARE_MARKERS:
+        return marker, b''
+    length_bytes = jp2.read(2)
+    if len(length_bytes) < 2:
+        raise EOFError
+    length = struct.unpack('>H', length_bytes)[0]
+    # only the fixed parts of SIZ, COD and SOT are needed, everything else is skipped
+    if marker in (_SIZ, _COD, _SOT):
+        segment = jp2.read(length - 2)
+        if len(segment) < length - 2:
+            raise EOFError
+        return marker, segment
+    jp2.seek(length - 2, os.SEEK_CUR)
+    return marker, b''
+
+def _siz_fields(siz: bytes) -> dict:
+    if len(siz) < 36:
+        raise AviJp2VerifierError('Codestream SIZ marker is too short')
+    width, height, x_offset, y_offset, tile_width, tile_height, tile_x_offset, tile_y_offset, components = \
+        struct.unpack('>2x8IH', siz[:36])
+    if len(siz) < 36 + components * 3:
+        raise AviJp2VerifierError('Codestream SIZ marker is too short')
+    if tile_width == 0 or tile_height == 0:
+        raise AviJp2VerifierError(f'Codestream SIZ marker has a {tile_width}x{tile_height} tile size')
+    tiles_across = -(-(width - tile_x_offset) // tile_width)
+    tiles_down = -(-(height - tile_y_offset) // tile_height)
+    return {
+        'width': width - x_offset,
+        'height': height - y_offset,
+        'components': components,
+        'bits_per_component': tuple((siz[36 + index * 3] & 0x7F) + 1 for index in range(components)),
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'tile_count': tiles_across * tiles_down,
+    }
+
+def _cod_fields(cod: bytes) -> dict:
+    if len(cod) < 10:
+        raise AviJp2VerifierError('Codestream COD marker is too short')
+    style, progression, layers, mct, levels, codeblock_width, codeblock_height, _, transform = struct.unpack('>BBHBBBBBB', cod[:10])
+    return {
+        'levels': levels,
+        'layers': layers,
+        'progression': PROGRESSION_ORDERS[progression] if progression < len(PROGRESSION_ORDERS) else str(progression),
+        'codeblock_size': (2 ** (codeblock_width + 2), 2 ** (codeblock_height + 2)),
+        'precincts': tuple((2 ** (precinct & 0x0F), 2 ** (precinct >> 4)) for precinct in cod[10:11 + levels]) if style & 0x01 else (),
+        'reversible': transform == 1,
+        'mct': mct,
+        'uses_sop': bool(style & 0x02),
+        'uses_eph': bool(style & 0x04),
+    }
+
+def _read_main_header(jp2: BinaryIO, start: int) -> Tuple[dict, bytes]:
+    """
+    The first segment of every marker in the main header and the segment of the first SOT
+    """
+    jp2.seek(start)
+    try:
+        if _read_marker(jp2)[0] != _SOC:
+            raise AviJp2VerifierError('Codestream does not start with SOC')
+        segments = {}
+        marker, segment = _read_marker(jp2)
+        while marker != _SOT:
+            segments.setdefault(marker, segment)
+            marker, segment = _read_marker(jp2)
+    except EOFError as eof_e:
+        raise AviJp2VerifierError('Codestream main header is truncated') from eof_e
+    if _SIZ not in segments or _COD not in segments:
+        raise AviJp2VerifierError('Codestream main header has no SIZ or COD marker')
+    return segments, segment
+
+def _read_codestream(jp2: BinaryIO, start: int, end: int) -> Tuple[dict, List[str]]:
+    """
+    Fields from the main header and a walk over every tile part header, which are found from each SOT's length
+    """
+    segments, segment = _read_main_header(jp2, start)
+    fields = dict(_siz_fields(segments[_SIZ]), **_cod_fields(segments[_COD]))
+    problems = []
+    has_plt, tile_indexes = _PLT in segments, []
+    tile_part_start = jp2.tell() - len(segment) - 4
+    while True:
+        tile_indexes.append(struct.unpack('>H', segment[:2])[0])
+        tile_part_count = len(tile_indexes)
+        tile_part_bytes = struct.unpack('>I', segment[2:6])[0]
+        # a zero length runs to the EOC marker
+        next_start = tile_part_start + tile_part_bytes if tile_part_bytes else end - 2
+        try:
+            tile_part_header = _read_tile_part_header(jp2, min(next_start, end))
+        except EOFError:
+            problems.append(f'Tile part {tile_part_count} header is truncated')
+            break
+        has_plt = has_plt or tile_part_header[0]
+        if fields['uses_sop'] and tile_part_header[1] is False:
+            problems.append(f'Tile part {tile_part_count} does not start with an SOP marker')
+        if next_start + 2 > end:
+            problems.append(f'Tile part {tile_part_count} runs {next_start + 2 - end} bytes past the end of the codestream')
+            break
+        jp2.seek(next_start)
+        try:
+            marker, segment = _read_marker(jp2)
+        except EOFError:
+            problems.append(f'Codestream is truncated after tile part {tile_part_count}')
+            break
+        if marker == _EOC:
+            break
+        if marker != _SOT:
+            problems.append(f'Tile part {tile_part_count} is followed by marker 0x{marker:04X} instead of SOT or EOC')
+            break
+        tile_part_start = next_start
+    if len(set(tile_indexes)) != fields['tile_count']:
+        problems.append(f'Codestream has tile parts for {len(set(tile_indexes))} of {fields["tile_count"]} tiles')
+    fields.update(tile_part_count=len(tile_indexes), has_plt=has_plt)
+    return fields, problems
+
+def _read_tile_part_header(jp2: BinaryIO, tile_part_end: int) -> Tuple[bool, Optional[bool]]:
+    """
+    Whether the tile part header after an SOT has a PLT marker and whether its packet data starts with an SOP marker,
+    None if it has no packet data
+    """
+    has_plt = False
+    marker, _ = _read_marker(jp2)
+    while marker != _SOD:
+        has_plt = has_plt or marker == _PLT
+        marker, _ = _read_marker(jp2)
+    if jp2.tell() + 2 > tile_part_end:
+        return has_plt, None
+    return has_plt, jp2.read(2) == struct.pack('>H', _SOP)
+
+def verify_jp2(jp2_path: Union[str, Path], expected: dict) -> List[str]:
+    """
+    Mismatches between jp2_path's structure and expected, a dict of AviJp2Structure field values, plus every problem
+    found reading it. An empty list means the jp2 is complete and was encoded as asked
+    """
+    try:
+        structure = AviJp2Structure.read(jp2_path)
+    except (AviJp2VerifierError, OSError, struct.error) as ver_e:
+        return [f'{ver_e.__class__.__name__} {ver_e}']
+    mismatches = list(structure.problems)
+    for field, expected_value in expected.items():
+        actual_value = getattr(structure, field)
+        if actual_value != expected_value:
+            mismatches.append(f'{field} is {actual_value} not {expected_value}')
+    return mismatches
+
+__all__ = ['AviJp2Structure', 'AviJp2VerifierError', 'verify_jp2']
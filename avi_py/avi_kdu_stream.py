@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import time
+import errno
+import logging
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Union, Iterable, Tuple, List
+
+from . import constants as avi_const
+
+PNM_MAGIC = {'RGB': b'P6', 'L': b'P5'}
+
+#pylint: disable=missing-class-docstring
+class AviKduStreamError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+def kdu_compress_path(kakadu_base_path: str=avi_const.KAKADU_BASE_PATH) -> str:
+    return os.path.join(kakadu_base_path, 'kdu_compress')
+
+# one stream per image, its only job is compress, kept a class to hold the settings the encoder configures it with
+class AviKduStream: #pylint: disable=too-few-public-methods
+    """
+    Runs kdu_compress on a named pipe and writes the image into it as an 8 bit PPM (or PGM) band by band while the bands
+    are still being produced, so decoding, colour conversion and encoding overlap and no intermediate tiff is written.
+    PNM carries no icc profile, the colour space has to be given to kakadu with -jp2_space
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, mode: str, size: Tuple[int, int],
+                       kakadu_base_path: str=avi_const.KAKADU_BASE_PATH,
+                       scratch_dir: Union[None, str, Path]=avi_const.SCRATCH_DIR,
+                       open_timeout: float=avi_const.KDU_STREAM_OPEN_TIMEOUT) -> None:
+        if mode not in PNM_MAGIC:
+            raise AviKduStreamError(f'Can not stream {mode} images to kakadu')
+        self.mode = mode
+        self.size = size
+        self.kakadu_base_path = kakadu_base_path
+        self.scratch_dir = scratch_dir
+        self.open_timeout = open_timeout
+
+    def compress(self, bands: Iterable[Tuple[bytes, int]], dest_file_path: Union[str, Path], kakadu_options: List[str]) -> None:
+        """
+        Encodes the (pixels, rows) bands to dest_file_path. Raises AviKduStreamError if kdu_compress fails, in which case
+        no partial jp2 is left behind
+        """
+        with tempfile.TemporaryDirectory(prefix='avi_kdu_stream', dir=self.scratch_dir) as fifo_dir:
+            # kakadu picks the reader from the extension
+            fifo_path = os.path.join(fifo_dir, 'input.ppm' if self.mode == 'RGB' else 'input.pgm')
+            os.mkfifo(fifo_path, 0o600)
+            command = [kdu_compress_path(self.kakadu_base_path), '-i', fifo_path, '-o', str(dest_file_path)] + kakadu_options
+            self.logger.debug(' '.join(command))
+            with open(os.path.join(fifo_dir, 'kdu_compress.log'), 'w+b') as kdu_log, \
+                    subprocess.Popen(command, stdout=kdu_log, stderr=subprocess.STDOUT, env=self.__kdu_env()) as kdu_process:
+                try:
+                    self.__write_pnm(fifo_path, kdu_process, bands, kdu_log)
+                    return_code = kdu_process.wait()
+                except BaseException:
+                    kdu_process.kill()
+                    kdu_process.wait()
+                    self.__remove(dest_file_path)
+                    raise
+                if return_code != 0:
+                    self.__remove(dest_file_path)
+                    raise AviKduStreamError(f'kdu_compress exited with {return_code}: {self.__log_tail(kdu_log)}')
+
+    def __write_pnm(self, fifo_path: str, kdu_process: subprocess.Popen, bands: Iterable[Tuple[bytes, int]], kdu_log) -> None:
+        rows_written = 0
+        try:
+            with os.fdopen(self.__open_fifo(fifo_path, kdu_process, kdu_log), 'wb') as fifo:
+                fifo.write(PNM_MAGIC[self.mode] + f'\n{self.size[0]} {self.size[1]}\n255\n'.encode('ascii'))
+                for data, rows in bands:
+                    fifo.write(data)
+                    rows_written += rows
+        except BrokenPipeError as bp_e:
+            raise AviKduStreamError(f'kdu_compress stopped reading after {rows_written} rows: {self.__log_tail(kdu_log, kdu_process)}') from bp_e
+        if rows_written != self.size[1]:
+            raise AviKduStreamError(f'Streamed {rows_written} of {self.size[1]} rows to kdu_compress')
+
+    def __open_fifo(self, fifo_path: str, kdu_process: subprocess.Popen, kdu_log) -> int:
+        """
+        Opens the write end once kakadu has opened the read end. A plain open would block forever if kakadu exits first
+        """
+        deadline = time.monotonic() + self.open_timeout
+        while True:
+            try:
+                fifo_fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+                os.set_blocking(fifo_fd, True)
+                return fifo_fd
+            except OSError as os_e:
+                if os_e.errno != errno.ENXIO:
+                    raise
+            if kdu_process.poll() is not None:
+                raise AviKduStreamError(f'kdu_compress exited with {kdu_process.returncode} before reading its input: {self.__log_tail(kdu_log)}')
+            if time.monotonic() > deadline:
+                raise AviKduStreamError(f'kdu_compress did not open its input within {self.open_timeout} seconds')
+            time.sleep(0.01)
+
+    def __kdu_env(self) -> dict:
+        env = os.environ.copy()
+        if self.kakadu_base_path:
+            env['LD_LIBRARY_PATH'] = os.pathsep.join(filter(None, [self.kakadu_base_path, env.get('LD_LIBRARY_PATH')]))
+        return env
+
+    @staticmethod
+    def __log_tail(kdu_log, kdu_process: subprocess.Popen=None) -> str:
+        if kdu_process is not None:
+            kdu_process.wait()
+        kdu_log.seek(0)
+        return kdu_log.read().decode('utf-8', errors='replace').strip()[-2000:]
+
+    @staticmethod
+    def __remove(dest_file_path: Union[str, Path]) -> None:
+        if os.path.exists(dest_file_path):
+            os.unlink(dest_file_path)
+
+__all__ = ['AviKduStream', 'AviKduStreamError', 'kdu_compress_path']
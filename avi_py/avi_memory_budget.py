@@ -0,0 +1,135 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import constants as avi_const
+
+#pylint: disable=missing-class-docstring
+class AviMemoryBudgetError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+class AviMemoryBudget:
+    """
+    Admission control for concurrent jobs. Jobs are requested with their estimated memory and admitted in request order
+    while the estimates of the running jobs add up to no more than budget_bytes and fewer than max_running are running.
+    Smaller jobs behind one that doesn't fit yet are admitted around it, at most max_bypass times, after which nothing
+    else is admitted until it is. A job larger than the whole budget is admitted once nothing else is running.
+    A budget of 0 only limits the number of running jobs. Thread safe
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, budget_bytes: int=avi_const.MEMORY_BUDGET_BYTES,
+                       max_running: Optional[int]=None,
+                       max_bypass: int=avi_const.MEMORY_MAX_BYPASS) -> None:
+        self.budget_bytes = budget_bytes
+        self.max_running = max_running
+        self.max_bypass = max_bypass
+        self.__condition = threading.Condition(threading.RLock())
+        self.__waiting: List[Tuple[Any, int]] = []
+        self.__running: Dict[Any, int] = {}
+        self.__head_bypassed = 0
+        self.__acquired = set()
+
+    @property
+    def budget_bytes(self) -> int:
+        return self.__budget_bytes
+
+    @budget_bytes.setter
+    def budget_bytes(self, budget_bytes: int) -> None:
+        if budget_bytes < 0:
+            raise AviMemoryBudgetError(f'budget_bytes must not be negative not {budget_bytes}')
+        self.__budget_bytes = budget_bytes
+
+    @property
+    def max_running(self) -> Optional[int]:
+        return self.__max_running
+
+    @max_running.setter
+    def max_running(self, max_running: Optional[int]) -> None:
+        if max_running is not None and max_running < 1:
+            raise AviMemoryBudgetError(f'max_running must be at least 1 not {max_running}')
+        self.__max_running = max_running
+
+    @property
+    def reserved_bytes(self) -> int:
+        with self.__condition:
+            return sum(self.__running.values())
+
+    @property
+    def running_count(self) -> int:
+        with self.__condition:
+            return len(self.__running)
+
+    @property
+    def waiting_count(self) -> int:
+        with self.__condition:
+            return len(self.__waiting)
+
+    def fits(self, estimate: int) -> bool:
+        with self.__condition:
+            if self.max_running is not None and len(self.__running) >= self.max_running:
+                return False
+            return self.budget_bytes == 0 or not self.__running or self.reserved_bytes + estimate <= self.budget_bytes
+
+    def request(self, job: Any, estimate: int) -> None:
+        """
+        Queues job, which must be hashable and not already queued or running, until admit returns it
+        """
+        with self.__condition:
+            self.__waiting.append((job, max(0, estimate)))
+
+    def admit(self) -> List[Any]:
+        """
+        Reserves memory for and returns every waiting job that may start now, in request order
+        """
+        admitted = []
+        with self.__condition:
+            for job, estimate in list(self.__waiting):
+                is_head = job == self.__waiting[0][0]
+                if not is_head and self.__head_bypassed >= self.max_bypass:
+                    break
+                if not self.fits(estimate):
+                    continue
+                self.__waiting.remove((job, estimate))
+                self.__running[job] = estimate
+                admitted.append(job)
+                if is_head:
+                    self.__head_bypassed = 0
+                else:
+                    self.__head_bypassed += 1
+            if admitted:
+                self.logger.debug('Admitted {} jobs, {} of {} bytes reserved by {} running jobs'.format(
+                    len(admitted), self.reserved_bytes, self.budget_bytes, len(self.__running)))
+        return admitted
+
+    def release(self, job: Any) -> None:
+        """
+        Frees the memory reserved for an admitted job once it has finished
+        """
+        with self.__condition:
+            self.__running.pop(job)
+            self.__condition.notify_all()
+
+    def acquire(self, estimate: int) -> Any:
+        """
+        Blocks the calling thread until a job of estimate bytes is admitted and returns the ticket to release it with
+        """
+        ticket = object()
+        with self.__condition:
+            self.request(ticket, estimate)
+            while ticket not in self.__acquired:
+                admitted = self.admit()
+                if admitted:
+                    self.__acquired.update(admitted)
+                    self.__condition.notify_all()
+                if ticket not in self.__acquired:
+                    self.__condition.wait()
+            self.__acquired.discard(ticket)
+        return ticket
+
+__all__ = ['AviMemoryBudget', 'AviMemoryBudgetError']
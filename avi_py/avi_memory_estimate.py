@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+from typing import List, Optional
+
+from . import constants as avi_const
+from .avi_icc_converter import AviStripIccConverter
+from .avi_image_data import AviImageData
+from .avi_image_header import AviImageHeader
+
+# Pillow holds RGB and RGBA pixels in 4 bytes, imagemagick's quantum depth 16 holds 4 channels of 2 bytes
+PIL_COLOR_BYTES_PER_PIXEL = 4
+MAGICK_BYTES_PER_PIXEL = 8
+# tesseract's grey, binarised and layout images of a page
+TESS_BYTES_PER_PIXEL = 6
+# options of the worker service commands that take a value, so the value isn't mistaken for the source
+COMMAND_VALUE_OPTIONS = {'-Lf', '--log_file', '-Ll', '--log_level', '--batch', '--dest_dir', '--max_workers',
+                         '--memory_budget_mb', '--derivative', '--profile', '--target_bpp',
+                         '--target_bytes', '--tess_langs', '--tess_cfg'}
+
+def icc_conversion_method(image_data: AviImageData) -> Optional[str]:
+    """
+    How AviJp2Processor gives the source the target icc profile: imagemagick, strips, pillow or None if it already has it
+    """
+    if not image_data.needs_icc_conversion():
+        return None
+    if image_data.needs_icc_profile():
+        return 'imagemagick'
+    if AviStripIccConverter.supports(image_data.image_header):
+        return 'strips'
+    return 'pillow'
+
+def estimate_jp2_memory(image_data: AviImageData, stream_to_kakadu: bool=avi_const.KDU_STREAM,
+                        encoder: str=avi_const.JP2_ENCODER) -> int:
+    """
+    Projected peak memory in bytes of converting image_data's source to jp2 with encoder, worked out from its header alone.
+    The icc conversion and the encode run one after the other unless the pixels are streamed to kakadu
+    """
+    header = image_data.image_header
+    pixels = header.width * header.height
+    if encoder == 'openjpeg':
+        # pillow decodes the whole image and openjpeg holds a tile of 4 byte samples and its code blocks
+        tile_bytes = int(image_data.tile_size.split(',')[0]) ** 2 * header.samples_per_pixel * 4 * 2
+        encode_bytes = pixels * (1 if header.mode in ('1', 'L') else PIL_COLOR_BYTES_PER_PIXEL) + tile_bytes
+        stream_to_kakadu = False
+    else:
+        encode_bytes = header.width * header.samples_per_pixel * 4 * min(header.height, avi_const.KDU_MEMORY_ROWS)
+    icc_conversion = icc_conversion_method(image_data)
+    if icc_conversion is None:
+        return avi_const.JOB_BASE_MEMORY_BYTES + encode_bytes
+    if icc_conversion == 'imagemagick':
+        icc_bytes = pixels * MAGICK_BYTES_PER_PIXEL * 2
+    elif icc_conversion == 'strips':
+        # a band being read and one being transformed for each thread and the one being written
+        icc_bytes = min(avi_const.ICC_STRIP_BYTES * (avi_const.ICC_STRIP_THREADS + 1), image_data.pixel_bytes) * 2
+        if stream_to_kakadu and header.mode == 'RGB':
+            return avi_const.JOB_BASE_MEMORY_BYTES + icc_bytes + encode_bytes
+    else:
+        icc_bytes = pixels * PIL_COLOR_BYTES_PER_PIXEL * 2
+    return avi_const.JOB_BASE_MEMORY_BYTES + max(icc_bytes, encode_bytes)
+
+def estimate_ocr_memory(header: AviImageHeader) -> int:
+    """
+    Projected peak memory in bytes of OCRing a page: decoding it to a thresholded grey array, then tesseract
+    """
+    pixels = header.width * header.height
+    # colour pages are decoded whole and then converted to grey
+    decoded_bytes = pixels * (1 if header.mode in ('1', 'L') else PIL_COLOR_BYTES_PER_PIXEL + 1)
+    return avi_const.JOB_BASE_MEMORY_BYTES + max(decoded_bytes + pixels * 2, pixels * TESS_BYTES_PER_PIXEL)
+
+def estimate_command_memory(command: str, args: List[str]) -> int:
+    """
+    Projected peak memory of one of the worker service commands. The source is the first argument that isn't an option
+    or an option's value, commands without an image source and sources that can't be read are estimated at JOB_BASE_MEMORY_BYTES
+    """
+    src_file_path = command_source(args)
+    try:
+        if command == 'avi_jp2_convert' and src_file_path is not None:
+            return estimate_jp2_memory(AviImageData(src_file_path))
+        if command == 'avi_ocr' and src_file_path is not None:
+            return estimate_ocr_memory(AviImageHeader.read(src_file_path))
+    except (OSError, ValueError):
+        pass
+    return avi_const.JOB_BASE_MEMORY_BYTES
+
+def command_source(args: List[str]) -> Optional[str]:
+    """
+    First positional argument of a worker service command's args, or None if it has none
+    """
+    args_iter = iter(args)
+    for arg in args_iter:
+        if arg in COMMAND_VALUE_OPTIONS:
+            next(args_iter, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+__all__ = ['icc_conversion_method', 'estimate_jp2_memory', 'estimate_ocr_memory', 'estimate_command_memory', 'command_source']
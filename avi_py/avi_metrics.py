@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+import re
+import time
+import fcntl
+import logging
+import tempfile
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Union, Optional, Iterator, ContextManager
+
+from . import constants as avi_const
+
+_PROMETHEUS_METRICS = {
+    'avi_py_derivatives_total': ('counter', 'Derivatives processed by type and outcome'),
+    'avi_py_stage_seconds_total': ('counter', 'Wall seconds spent in each processing stage'),
+    'avi_py_input_bytes_total': ('counter', 'Source bytes of derivatives that were generated'),
+    'avi_py_output_bytes_total': ('counter', 'Bytes of derivatives that were generated'),
+    'avi_py_last_duration_seconds': ('gauge', 'Wall seconds of the most recent run'),
+}
+_PROMETHEUS_SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?P<labels>\{[^}]*\})? (?P<value>\S+)$')
+
+class AviStageTimer:
+    """
+    Records the wall time of each named processing stage with the monotonic perf_counter clock.
+    Stages are exclusive, time spent in a stage nested in another one is only counted for the inner stage
+    """
+    def __init__(self) -> None:
+        self.__stages = {}
+        self.__stack = []
+        self.__start = time.perf_counter()
+        self.__end = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self.__stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.__stack.pop()
+            self.__stages[name] = self.__stages.get(name, 0.0) + elapsed - nested
+            if self.__stack:
+                self.__stack[-1] += elapsed
+
+    def stop(self) -> None:
+        self.__end = time.perf_counter()
+
+    @property
+    def stopped(self) -> bool:
+        return self.__end is not None
+
+    def timings(self) -> dict:
+        """
+        Seconds per stage plus the total since the timer was created, up to stop if it has been called
+        """
+        end = self.__end if self.__end is not None else time.perf_counter()
+        timings = {name: round(seconds, 4) for name, seconds in self.__stages.items()}
+        timings['total'] = round(end - self.__start, 4)
+        return timings
+
+def timed_stage(timer: Optional[AviStageTimer], name: str) -> ContextManager:
+    return timer.stage(name) if timer is not None else nullcontext()
+
+def file_size(file_path: Union[None, str, Path]) -> int:
+    """
+    Size in bytes of file_path, 0 if it doesn't exist
+    """
+    if not file_path or not os.path.isfile(file_path):
+        return 0
+    return os.path.getsize(file_path)
+
+def _labels(**labels: str) -> str:
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+def _read_samples(textfile_path: Path) -> dict:
+    samples = {}
+    if not textfile_path.exists():
+        return samples
+    with open(textfile_path, 'r', encoding='utf-8') as textfile:
+        for line in textfile:
+            match = _PROMETHEUS_SAMPLE.match(line.strip())
+            if match and match.group('name') in _PROMETHEUS_METRICS:
+                samples[(match.group('name'), match.group('labels') or '')] = float(match.group('value'))
+    return samples
+
+def _write_samples(textfile_path: Path, samples: dict) -> None:
+    lines = []
+    for name, (metric_type, metric_help) in _PROMETHEUS_METRICS.items():
+        lines += [f'# HELP {name} {metric_help}', f'# TYPE {name} {metric_type}']
+        lines += [f'{name}{labels} {round(value, 6)!r}' for (sample_name, labels), value in sorted(samples.items()) if sample_name == name]
+    # the collector may read the file at any time, so never let it see a partial write
+    with tempfile.NamedTemporaryFile('w', dir=str(textfile_path.parent), prefix=f'.{textfile_path.name}', delete=False,
+                                     encoding='utf-8') as temp_textfile:
+        temp_textfile.write('\n'.join(lines) + '\n')
+    os.chmod(temp_textfile.name, 0o644)
+    os.replace(temp_textfile.name, textfile_path)
+
+def record_prometheus_metrics(derivative_type: str, result: dict,
+                              textfile_path: Union[None, str, Path]=avi_const.PROMETHEUS_TEXTFILE_PATH) -> None:
+    """
+    Adds a processor result to the counters in a node_exporter textfile collector file (eg. /var/lib/node_exporter/avi_py.prom).
+    Runs from different processes are serialized with a lock file next to it. Does nothing when textfile_path is None
+    """
+    if textfile_path is None or 'timings' not in result:
+        return
+    textfile_path = Path(textfile_path)
+    derivative_labels = {'type': derivative_type}
+    try:
+        textfile_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(f'{textfile_path}.lock', 'w', encoding='utf-8') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            samples = _read_samples(textfile_path)
+
+            def increment(name: str, value: float, **labels: str) -> None:
+                key = (name, _labels(**derivative_labels, **labels))
+                samples[key] = samples.get(key, 0.0) + value
+
+            increment('avi_py_derivatives_total', 1, success=str(bool(result.get('success'))).lower(),
+                      skipped=str(bool(result.get('skipped'))).lower())
+            for stage, seconds in result['timings'].items():
+                if stage != 'total':
+                    increment('avi_py_stage_seconds_total', seconds, stage=stage)
+            if result.get('success') and not result.get('skipped'):
+                increment('avi_py_input_bytes_total', result.get('input_bytes', 0))
+                increment('avi_py_output_bytes_total', result.get('output_bytes', 0))
+            samples[('avi_py_last_duration_seconds', _labels(**derivative_labels))] = result['timings']['total']
+            _write_samples(textfile_path, samples)
+    except OSError as os_ex:
+        logging.getLogger('avi_py').warning('Could not update prometheus textfile {}: {}'.format(textfile_path, os_ex))
+
+__all__ = ['AviStageTimer', 'timed_stage', 'file_size', 'record_prometheus_metrics']
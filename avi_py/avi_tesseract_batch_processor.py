@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Union, List, Tuple, Optional, Callable
+
+from . import constants as avi_const
+from .avi_batch_processor import AviBatchProcessor, read_manifest, threads_per_worker
+from .avi_tesseract_processor import AviTesseractProcessor
+from .avi_image_header import AviImageHeader
+from .avi_memory_estimate import estimate_ocr_memory
+
+def omp_threads_for_pool(pool_size: int) -> int:
+    """
+    OMP_THREAD_LIMIT for each of pool_size concurrent tesseract workers so they don't oversubscribe the cpus
+    """
+    return threads_per_worker(pool_size)
+
+def _init_ocr_worker(omp_thread_limit: int) -> None:
+    # tesseract is spawned by pytesseract with this process' environment
+    os.environ['OMP_THREAD_LIMIT'] = str(omp_thread_limit)
+
+#pylint: disable=too-many-arguments
+def _process_ocr_job(src_file_path: str, tess_langs: str, tess_cfg: str, replace_if_exists: bool,
+                     generate_searchable_pdf: bool, single_pass: bool, incremental: bool) -> dict:
+    try:
+        tess_processor = AviTesseractProcessor.process_batch_ocr(src_file_path, tess_langs, tess_cfg, replace_if_exists,
+                                                                 generate_searchable_pdf, single_pass, incremental)
+        result = tess_processor.result
+    except (FileNotFoundError, AssertionError) as ex:
+        result = { 'success': False, 'message': str(ex) }
+    result.update({ 'src_file_path': src_file_path })
+    return result
+#pylint: enable=too-many-arguments
+
+class AviTesseractBatchProcessor(AviBatchProcessor):
+    """
+    Class that runs OCR over a manifest or directory of page tiffs on one long lived process pool.
+    OCR files are written next to each page, a destination column in the manifest is ignored
+    """
+    #pylint: disable=too-many-arguments
+    def __init__(self, jobs: List[Tuple[Path, Optional[Path]]],
+                       tess_langs: str=avi_const.TESS_DEFAULT_LANG,
+                       tess_cfg: str=avi_const.TESS_DEFAULT_CFG,
+                       replace_if_exists: bool=False,
+                       generate_searchable_pdf: bool=True,
+                       single_pass: bool=avi_const.TESS_SINGLE_PASS,
+                       max_workers: int=avi_const.TESS_BATCH_MAX_WORKERS,
+                       incremental: bool=avi_const.INCREMENTAL,
+                       memory_budget: int=avi_const.MEMORY_BUDGET_BYTES) -> None:
+        self.tess_options = (tess_langs, tess_cfg, replace_if_exists, generate_searchable_pdf, single_pass, incremental)
+        super().__init__(jobs, max_workers, memory_budget)
+    #pylint: enable=too-many-arguments
+
+    @classmethod
+    def from_manifest(cls, manifest_path: Union[str, Path], max_workers: int=avi_const.TESS_BATCH_MAX_WORKERS,
+                      **tess_options) -> AviTesseractBatchProcessor:
+        return cls(read_manifest(manifest_path, avi_const.VALID_IMAGE_EXTENSIONS), max_workers=max_workers, **tess_options)
+
+    @property
+    def tess_options(self) -> Tuple[str, str, bool, bool, bool, bool]:
+        """
+        (tess_langs, tess_cfg, replace_if_exists, generate_searchable_pdf, single_pass, incremental) passed to every page
+        """
+        return self.__tess_options
+
+    @tess_options.setter
+    def tess_options(self, tess_options: Tuple[str, str, bool, bool, bool, bool]) -> None:
+        self.__tess_options = tuple(tess_options)
+
+    @property
+    def omp_thread_limit(self) -> int:
+        return omp_threads_for_pool(self.max_workers)
+
+    def _job_memory(self, src_path: Path) -> int:
+        try:
+            return estimate_ocr_memory(AviImageHeader.read(src_path))
+        except (OSError, ValueError):
+            return avi_const.JOB_BASE_MEMORY_BYTES
+
+    def _job_args(self, src_path: Path, dest_path: Optional[Path]) -> tuple:
+        return (_process_ocr_job, str(src_path)) + self.tess_options
+
+    def _worker_initializer(self) -> Tuple[Optional[Callable], tuple]:
+        return _init_ocr_worker, (self.omp_thread_limit,)
+
+__all__ = ['AviTesseractBatchProcessor', 'omp_threads_for_pool']
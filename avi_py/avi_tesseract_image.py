@@ -1,6 +1,6 @@
+import io
 import os
 import errno
-from tempfile import TemporaryDirectory, NamedTemporaryFile
 from pathlib import Path
 from typing import Union
 
@@ -8,20 +8,29 @@ from PIL import Image
 import cv2
 import numpy as np
 
+from . import constants as avi_const
+
+def encode_for_tesseract(pre_processed_img: np.ndarray) -> bytes:
+    """
+    Encodes a thresholded page as an in memory bilevel group4 tiff that can be piped to tesseract's stdin
+    """
+    with io.BytesIO() as tiff_buffer:
+        Image.fromarray(pre_processed_img, mode='L').convert('1', dither=Image.Dither.NONE).save(tiff_buffer, format='TIFF', compression='group4')
+        return tiff_buffer.getvalue()
+
 class AviTesseractImage:
     """
-    Class for pre processing and splitting up tiffs for tesseract OCR
+    Class for pre processing tiffs for tesseract OCR. The source is decoded once straight to a grayscale array
+    and thresholded in memory, nothing is written to disk
     """
     def __init__(self, image_src_path: Union[str, Path]) -> None:
         self.image_src_path = image_src_path
-        #pylint: disable=consider-using-with
-        self._temp_directory = TemporaryDirectory(prefix='avi_tess_image', dir='/tmp')
-        #pylint: enable=consider-using-with
+
     def __enter__(self):
         return self.preprocess_image()
 
     def __exit__(self, *args):
-        self._temp_directory.cleanup()
+        pass
 
     @property
     def image_src_path(self) -> Path:
@@ -37,21 +46,22 @@ class AviTesseractImage:
         self.__image_src_path = image_src_path
 
     def preprocess_image(self) -> np.ndarray:
-        preprocessed_image_name = self.__ensure_grayscaled()
-        preprocessed_image = cv2.imread(preprocessed_image_name, cv2.IMREAD_GRAYSCALE)
-        preprocessed_image = self.__apply_thresh(preprocessed_image)
-        return preprocessed_image
-
-    def __ensure_grayscaled(self) -> str:
-        #pylint: disable=consider-using-with
-        temp_file = NamedTemporaryFile(delete=False, suffix='.tif', dir=self._temp_directory.name)
-        #pylint: enable=consider-using-with
+        return self.__apply_thresh(self.__ensure_grayscaled())
+
+    def preprocessed_bytes(self) -> bytes:
+        return encode_for_tesseract(self.preprocess_image())
+
+    def __ensure_grayscaled(self) -> np.ndarray:
         with Image.open(self.image_src_path) as img:
-            img.convert('L')
-            img.save(temp_file.name)
-        return temp_file.name
+            if img.mode == 'L':
+                return np.asarray(img)
+            if img.mode in avi_const.SIXTEEN_BIT_GRAY_MODES:
+                # convert('L') would clip 16 bit samples to 255, they are scaled down as cv2.imread did instead
+                return (np.clip(np.asarray(img), 0, 65535) >> 8).astype(np.uint8)
+            with img.convert('L') as gray_img:
+                return np.asarray(gray_img)
 
     def __apply_thresh(self, img: np.ndarray) -> np.ndarray:
         return cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
-__all__ = ['AviTesseractImage']
+__all__ = ['AviTesseractImage', 'encode_for_tesseract']
@@ -3,15 +3,19 @@ from __future__ import print_function
 from __future__ import annotations
 
 import os
+import shlex
 import errno
+import subprocess
 import logging
 import json
 from pathlib import Path
-from typing import Union
+from typing import Union, List, FrozenSet, Optional
+from functools import lru_cache
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from PIL import Image
 import pytesseract
 from . import constants as avi_const
+from .avi_derivative_sidecar import AviDerivativeSidecar, tool_version
+from .avi_metrics import AviStageTimer, timed_stage, file_size, record_prometheus_metrics
 from .avi_tesseract_image import AviTesseractImage
 
 #pylint: disable=missing-class-docstring
@@ -24,6 +28,11 @@ def _out_file_path(image_src_path: Path, out_extension: str) -> Path:
     directory = image_src_path.parent
     return directory / f'{basename}.{out_extension}'
 
+@lru_cache(maxsize=1)
+def _installed_languages() -> FrozenSet[str]:
+    # tesseract --list-langs is a subprocess, only run it once per process instead of once per page
+    return frozenset(pytesseract.get_languages())
+
 #pylint: disable=unspecified-encoding
 def _write_out_file(out_file_contents: Union[bytes, str], out_file_path: Path, binary: bool=True) -> None:
     fmode = 'w+'
@@ -32,6 +41,20 @@ def _write_out_file(out_file_contents: Union[bytes, str], out_file_path: Path, b
     with open(out_file_path, fmode) as out_file:
         out_file.write(out_file_contents)
 #pylint: enable=unspecified-encoding
+
+def _run_tesseract_piped(image_bytes: bytes, output_base: str, tess_langs: str, tess_cfg: str) -> bytes:
+    """
+    Runs tesseract with the encoded image on stdin. An output_base of stdout returns the rendered output
+    instead of writing it to <output_base>.<ext>
+    """
+    args = [pytesseract.pytesseract.tesseract_cmd, 'stdin', output_base, '-l', tess_langs] + shlex.split(tess_cfg)
+    #pylint: disable=subprocess-run-check
+    tesseract_run = subprocess.run(args, input=image_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    #pylint: enable=subprocess-run-check
+    if tesseract_run.returncode != 0:
+        raise pytesseract.TesseractError(tesseract_run.returncode, tesseract_run.stderr.decode('utf-8', errors='replace'))
+    return tesseract_run.stdout
+
 def generate_pdf(image_src_path: Union[Path, str], tess_langs: str, tess_cfg: str) -> None:
     try:
         pdf = pytesseract.image_to_pdf_or_hocr(str(image_src_path), extension=avi_const.TESS_OUT_FILE_TYPES['pdf'], lang=tess_langs, config=tess_cfg)
@@ -43,34 +66,61 @@ def generate_pdf(image_src_path: Union[Path, str], tess_langs: str, tess_cfg: st
 
 def generate_mets_alto(image_src_path: Union[Path, str], tess_langs: str, tess_cfg: str) -> None:
     try:
-        with AviTesseractImage(image_src_path) as pre_processed_img:
-            xml = pytesseract.image_to_alto_xml(Image.fromarray(pre_processed_img, mode='L'), lang=tess_langs, config=tess_cfg)
-            out_file_path = _out_file_path(image_src_path, avi_const.TESS_OUT_FILE_TYPES['alto'])
-            _write_out_file(xml, out_file_path)
+        image_bytes = AviTesseractImage(image_src_path).preprocessed_bytes()
+        xml = _run_tesseract_piped(image_bytes, 'stdout', tess_langs, f'-c {avi_const.TESS_RENDERER_CONFIGS["alto"]} {tess_cfg}')
+        out_file_path = _out_file_path(Path(image_src_path), avi_const.TESS_OUT_FILE_TYPES['alto'])
+        _write_out_file(xml, out_file_path)
     except Exception as ex:
         msg = f'Error ocurred during Mets alto gneration! Details: {ex.__class__.__name__}{ex}'
         raise AviTesseractProcessorError(msg) from ex
 
+def generate_ocr_files(image_src_path: Union[Path, str], tess_langs: str, tess_cfg: str, out_file_types: List[str],
+                       timer: Optional[AviStageTimer]=None) -> None:
+    """
+    Runs recognition once on the pre processed image and lets tesseract render every type in out_file_types
+    (keys of TESS_OUT_FILE_TYPES) from that single pass. The searchable pdf embeds the bilevel pre processed page,
+    not the original scan, so the single pass is opt in
+    """
+    try:
+        image_src_path = Path(image_src_path)
+        renderer_cfg = ' '.join(f'-c {avi_const.TESS_RENDERER_CONFIGS[out_file_type]}' for out_file_type in out_file_types)
+        with timed_stage(timer, 'preprocess'):
+            image_bytes = AviTesseractImage(image_src_path).preprocessed_bytes()
+        # tesseract writes <output base>.pdf and <output base>.xml next to the source
+        with timed_stage(timer, 'tesseract'):
+            _run_tesseract_piped(image_bytes, str(image_src_path.parent / image_src_path.stem), tess_langs, f'{renderer_cfg} {tess_cfg}')
+    except Exception as ex:
+        msg = f'Error ocurred during single pass OCR generation! Details: {ex.__class__.__name__}{ex}'
+        raise AviTesseractProcessorError(msg) from ex
+
 # def generate_bbox_data(image_src_path: Path, tess_langs: str, tess_cfg: str) -> None:
 #     pass
 
+#pylint: disable=too-many-instance-attributes
 class AviTesseractProcessor:
     """
     Class that checks and converts a source tiff file and generates a PDF and Mets Alto using tesseract OCR
     """
     logger = logging.getLogger('avi_py')
 
+    #pylint: disable=too-many-arguments
     def __init__(self, image_src_path: Union[str, Path],
                        tess_langs: str=avi_const.TESS_DEFAULT_LANG,
                        tess_cfg: str=avi_const.TESS_DEFAULT_CFG,
                        replace_if_exists: bool=False,
-                       generate_searchable_pdf: bool=True) -> None:
+                       generate_searchable_pdf: bool=True,
+                       single_pass: bool=avi_const.TESS_SINGLE_PASS,
+                       incremental: bool=avi_const.INCREMENTAL) -> None:
+        self.timer = AviStageTimer()
         self.image_src_path = image_src_path
         self.tesseract_langs = tess_langs
         self.tesseract_config = tess_cfg
         self.replace_if_exists = replace_if_exists
         self.generate_searchable_pdf = generate_searchable_pdf
+        self.single_pass = single_pass
+        self.incremental = incremental
         self.success = False
+        self.skipped = False
         self.result_message = ''
 
     @classmethod
@@ -78,10 +128,13 @@ class AviTesseractProcessor:
                                tess_langs: str=avi_const.TESS_DEFAULT_LANG,
                                tess_cfg: str=avi_const.TESS_DEFAULT_CFG,
                                replace_if_exists: bool=False,
-                               generate_searchable_pdf: bool=True) -> AviTesseractProcessor:
-        tess_processor = cls(image_src_path, tess_langs, tess_cfg, replace_if_exists, generate_searchable_pdf)
+                               generate_searchable_pdf: bool=True,
+                               single_pass: bool=avi_const.TESS_SINGLE_PASS,
+                               incremental: bool=avi_const.INCREMENTAL) -> AviTesseractProcessor:
+        tess_processor = cls(image_src_path, tess_langs, tess_cfg, replace_if_exists, generate_searchable_pdf, single_pass, incremental)
         tess_processor.ocr_for_batch()
         return tess_processor
+    #pylint: enable=too-many-arguments
 
     @property
     def image_src_path(self) -> Path:
@@ -103,7 +156,7 @@ class AviTesseractProcessor:
 
     @tesseract_langs.setter
     def tesseract_langs(self, tess_langs: str) -> None:
-        existing_langs = set(pytesseract.get_languages())
+        existing_langs = _installed_languages()
         langs = set(tess_langs.split('+'))
         assert langs.issubset(existing_langs), f'{tess_langs} are not valid tesseract languages'
         self.__tesseract_langs = tess_langs
@@ -132,9 +185,35 @@ class AviTesseractProcessor:
     def generate_searchable_pdf(self, generate_searchable_pdf: bool) -> None:
         self.__generate_searchable_pdf = generate_searchable_pdf
 
+    @property
+    def single_pass(self) -> bool:
+        return self.__single_pass
+
+    @single_pass.setter
+    def single_pass(self, single_pass: bool) -> None:
+        self.__single_pass = single_pass
+
+    @property
+    def incremental(self) -> bool:
+        return self.__incremental
+
+    @incremental.setter
+    def incremental(self, incremental: bool) -> None:
+        self.__incremental = incremental
+
     @property
     def result(self) -> dict:
-        return { 'success': self.success, 'message': self.result_message }
+        result = { 'success': self.success, 'message': self.result_message }
+        if self.skipped:
+            result['skipped'] = True
+        if self.timer.stopped:
+            out_paths = [_out_file_path(self.image_src_path, out_file_ext) for out_file_ext in avi_const.TESS_OUT_FILE_TYPES.values()]
+            result.update({
+                'timings': self.timer.timings(),
+                'input_bytes': file_size(self.image_src_path),
+                'output_bytes': sum(file_size(out_path) for out_path in out_paths) if self.success else 0,
+            })
+        return result
 
     def json_result(self) -> str:
         return json.dumps(self.result)
@@ -152,33 +231,67 @@ class AviTesseractProcessor:
             return False
         if self.replace_if_exists:
             return True
+        if self.incremental:
+            return not self.derivative_sidecar('pdf').is_current()
         return not self.has_pdf()
 
     def should_generate_mets_alto(self) -> bool:
         if self.replace_if_exists:
             return True
+        if self.incremental:
+            return not self.derivative_sidecar('alto').is_current()
         return not self.has_mets_alto()
 
+    def derivative_sidecar(self, out_file_type: str) -> AviDerivativeSidecar:
+        """
+        Sidecar recording the languages, config and tesseract version the out_file_type (pdf or alto) file is built with
+        """
+        out_file_path = _out_file_path(self.image_src_path, avi_const.TESS_OUT_FILE_TYPES[out_file_type])
+        settings = {
+            'type': out_file_type,
+            'tess_langs': self.tesseract_langs,
+            'tess_cfg': self.tesseract_config,
+            'single_pass': self.single_pass,
+        }
+        tools = {'tesseract': tool_version(pytesseract.pytesseract.tesseract_cmd, '--version')}
+        return AviDerivativeSidecar(self.image_src_path, out_file_path, settings, tools)
+
     def ocr_for_batch(self) -> None:
         try:
-            if not self.should_generate_pdf() and not self.should_generate_mets_alto():
+            with timed_stage(self.timer if self.incremental else None, 'sidecar'):
+                out_file_types = [out_file_type for out_file_type, should_generate in
+                                  (('pdf', self.should_generate_pdf()), ('alto', self.should_generate_mets_alto())) if should_generate]
+            if not out_file_types:
+                self.skipped = True
                 msg = f'OCR files already generated for {self.image_src_path}. Add replace_if_exists = True to replace them'
+                if self.incremental:
+                    msg = f'OCR files for {self.image_src_path} are up to date. Skipped'
                 self.__set_success_result(msg)
                 return
-            self._generate_ocr_files()
+            self._generate_ocr_files(out_file_types)
+            if self.incremental:
+                with self.timer.stage('sidecar'):
+                    for out_file_type in out_file_types:
+                        self.derivative_sidecar(out_file_type).write()
             self.__set_success_result()
         except AviTesseractProcessorError as avi_ex:
             self.__class__.logger.error('Error occured processing file for OCR!')
             self.__class__.logger.error("Reason {0}".format(avi_ex))
             self.__set_error_result(str(avi_ex))
+        finally:
+            self.timer.stop()
+            record_prometheus_metrics('ocr', self.result)
 
-    def _generate_ocr_files(self) -> None:
-        with ProcessPoolExecutor(max_workers=avi_const.TESS_MAX_PROCESSES) as ocr_executor:
+    def _generate_ocr_files(self, out_file_types: List[str]) -> None:
+        if self.single_pass:
+            generate_ocr_files(self.image_src_path, self.tesseract_langs, self.tesseract_config, out_file_types, self.timer)
+            return
+        with self.timer.stage('tesseract'), ProcessPoolExecutor(max_workers=avi_const.TESS_MAX_PROCESSES) as ocr_executor:
             try:
                 process_list = []
-                if self.should_generate_pdf():
+                if 'pdf' in out_file_types:
                     process_list.append(ocr_executor.submit(generate_pdf, self.image_src_path, self.tesseract_langs, self.tesseract_config))
-                if self.should_generate_mets_alto():
+                if 'alto' in out_file_types:
                     process_list.append(ocr_executor.submit(generate_mets_alto, self.image_src_path, self.tesseract_langs, self.tesseract_config))
                 for process in as_completed(process_list):
                     process.result()
@@ -198,4 +311,6 @@ class AviTesseractProcessor:
         self.success = False
         self.result_message = error_msg
 
-__all__ = ['AviTesseractProcessor', 'AviTesseractProcessorError']
+#pylint: enable=too-many-instance-attributes
+
+__all__ = ['AviTesseractProcessor', 'AviTesseractProcessorError', 'generate_ocr_files']
@@ -2,7 +2,7 @@ import os
 import errno
 
 from pathlib import Path
-from typing import Union
+from typing import Union, Optional
 
 from . import constants as avi_const
 from .avi_ffprobe_data import AviFFProbeData
@@ -12,9 +12,11 @@ class AviVideoData(AviFFProbeData):
     Class for storing all low level video data for functions that are used for
     creating video deriavtives with FFMpeg
     """
-    def __init__(self, video_src_path: Union[str, Path]) -> None:
+    def __init__(self, video_src_path: Union[str, Path],
+                       use_cache: bool=avi_const.FFPROBE_CACHE_ENABLED,
+                       lazy: bool=False) -> None:
         self.video_src_path = video_src_path
-        super().__init__(video_src_path)
+        super().__init__(video_src_path, use_cache, lazy)
 
     @property
     def video_src_path(self) -> Path:
@@ -40,10 +42,15 @@ class AviVideoData(AviFFProbeData):
     def valid_video_ext(self) -> bool:
         return self.video_ext in avi_const.VALID_VIDEO_EXTENSIONS
 
-    def ss_time(self) -> int:
+    def duration(self) -> Optional[float]:
         if 'duration' not in self.ffprobe_format.keys():
+            return None
+        return float(self.ffprobe_format['duration'])
+
+    def ss_time(self) -> int:
+        duration = self.duration()
+        if duration is None:
             return avi_const.FFMPEG_DEFAULT_SS_TIME
-        duration = float(self.ffprobe_format['duration'])
         screenshot_time = round(duration / 2)
         return int(screenshot_time)
 
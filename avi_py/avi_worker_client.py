@@ -0,0 +1,37 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import json
+import socket
+from pathlib import Path
+from typing import Union, List, Optional
+
+from . import constants as avi_const
+
+#pylint: disable=missing-class-docstring
+class AviWorkerClientError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+# the client only runs jobs, kept a class to hold the socket path and timeout between runs
+class AviWorkerClient: #pylint: disable=too-few-public-methods
+    """
+    Thin client for :class:`~avi_py.avi_worker_service.AviWorkerService`. run returns the same result dict the matching script prints
+    """
+    def __init__(self, socket_path: Union[str, Path]=avi_const.SERVICE_SOCKET_PATH, timeout: Optional[float]=None) -> None:
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+
+    def run(self, command: str, args: List[str]) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+            client_socket.settimeout(self.timeout)
+            client_socket.connect(str(self.socket_path))
+            client_socket.sendall(json.dumps({ 'command': command, 'args': list(args) }).encode('utf-8') + b'\n')
+            with client_socket.makefile('rb') as response:
+                line = response.readline()
+        if not line:
+            raise AviWorkerClientError(f'No response from the avi_py worker service at {self.socket_path}')
+        return json.loads(line)
+
+__all__ = ['AviWorkerClient', 'AviWorkerClientError']
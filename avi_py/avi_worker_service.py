@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import annotations
+
+import io
+import os
+import json
+import logging
+import threading
+import socketserver
+from contextlib import redirect_stderr
+from pathlib import Path
+from typing import Union, List, Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import constants as avi_const
+from .avi_batch_processor import threads_per_worker
+from .avi_memory_budget import AviMemoryBudget
+from .avi_memory_estimate import estimate_command_memory
+
+#pylint: disable=missing-class-docstring
+class AviWorkerServiceError(Exception):
+    pass
+#pylint: enable=missing-class-docstring
+
+def _init_service_worker(omp_thread_limit: int) -> None:
+    os.environ['OMP_THREAD_LIMIT'] = str(omp_thread_limit)
+
+def _run_service_job(job_runner: Callable[..., dict], command: str, args: List[str], kdu_num_threads: int) -> dict:
+    usage_errors = io.StringIO()
+    try:
+        with redirect_stderr(usage_errors):
+            return job_runner(command, args, kdu_num_threads=kdu_num_threads)
+    except SystemExit:
+        return { 'success': False, 'message': usage_errors.getvalue().strip() }
+    except Exception as ex: #pylint: disable=broad-except
+        # anything a processor doesn't handle itself becomes a failed result so the client still gets a reply
+        logging.getLogger('avi_py').exception('{} {} failed'.format(command, args))
+        return { 'success': False, 'message': f'{ex.__class__.__name__} {ex}' }
+
+class _AviWorkerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one json request per line ({"command": "avi_jp2_convert", "args": [src, dest]}) and writes the json result
+    back as a single line
+    """
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                result = self.server.avi_service.run(request['command'], request.get('args', []))
+            except (ValueError, KeyError, TypeError) as ex:
+                result = { 'success': False, 'message': f'Invalid request! {ex.__class__.__name__} {ex}' }
+            self.wfile.write(json.dumps(result).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+class _AviWorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, avi_service: AviWorkerService) -> None:
+        self.avi_service = avi_service
+        super().__init__(socket_path, _AviWorkerRequestHandler)
+
+class AviWorkerService:
+    """
+    Resident service that keeps max_jobs warm worker processes with the avi_py processors already imported and runs
+    the single file scripts on them for clients connecting to a unix socket. Jobs over max_jobs, or whose estimated memory
+    doesn't fit in memory_budget next to the running ones, wait for a free worker.
+    job_runner is called in the worker as job_runner(command, args, kdu_num_threads=...) and must be picklable,
+    the scripts use :func:`~avi_py.entry_points.run_entry_point`
+    """
+    logger = logging.getLogger('avi_py')
+
+    def __init__(self, job_runner: Callable[..., dict],
+                       socket_path: Union[str, Path]=avi_const.SERVICE_SOCKET_PATH,
+                       max_jobs: int=avi_const.SERVICE_MAX_JOBS,
+                       memory_budget: int=avi_const.MEMORY_BUDGET_BYTES) -> None:
+        self.job_runner = job_runner
+        self.socket_path = socket_path
+        self.max_jobs = max_jobs
+        self.memory_budget = AviMemoryBudget(memory_budget, max_running=max_jobs)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._server = None
+
+    @property
+    def socket_path(self) -> Path:
+        return self.__socket_path
+
+    @socket_path.setter
+    def socket_path(self, socket_path: Union[str, Path]) -> None:
+        if not isinstance(socket_path, Path):
+            socket_path = Path(socket_path)
+        self.__socket_path = socket_path
+
+    @property
+    def max_jobs(self) -> int:
+        return self.__max_jobs
+
+    @max_jobs.setter
+    def max_jobs(self, max_jobs: int) -> None:
+        if max_jobs < 1:
+            raise AviWorkerServiceError(f'max_jobs must be at least 1 not {max_jobs}')
+        self.__max_jobs = max_jobs
+
+    def run(self, command: str, args: List[str]) -> dict:
+        """
+        Runs command with args on a worker and returns its result dict
+        """
+        if command not in avi_const.SERVICE_COMMANDS:
+            return { 'success': False, 'message': f'Unknown command {command}. Expected one of {", ".join(avi_const.SERVICE_COMMANDS)}' }
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            return { 'success': False, 'message': 'args must be a list of strings' }
+        ticket = self.memory_budget.acquire(estimate_command_memory(command, args))
+        try:
+            return self.__executor().submit(_run_service_job, self.job_runner, command, args, threads_per_worker(self.max_jobs)).result()
+        except BrokenProcessPool as pool_ex:
+            self.logger.error('Worker process died running {} {}. Restarting the pool'.format(command, args))
+            self.__reset_executor()
+            return { 'success': False, 'message': f'Worker process died! {pool_ex}' }
+        except Exception as ex: #pylint: disable=broad-except
+            self.logger.exception('{} {} failed'.format(command, args))
+            return { 'success': False, 'message': f'{ex.__class__.__name__} {ex}' }
+        finally:
+            self.memory_budget.release(ticket)
+
+    def serve_forever(self) -> None:
+        self.__executor()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        self._server = _AviWorkerServer(str(self.socket_path), self)
+        self.logger.info('avi_py worker service listening on {} with {} workers'.format(self.socket_path, self.max_jobs))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            self.__reset_executor()
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+    def __executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_jobs, initializer=_init_service_worker,
+                                                     initargs=(threads_per_worker(self.max_jobs),))
+                # start every worker now, before the server has any threads to fork
+                for warm_up in [self._executor.submit(os.getpid) for _ in range(self.max_jobs)]:
+                    warm_up.result()
+            return self._executor
+
+    def __reset_executor(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+__all__ = ['AviWorkerService', 'AviWorkerServiceError']
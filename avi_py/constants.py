@@ -1,17 +1,72 @@
 import os
 from pathlib import Path
+from functools import lru_cache
 
 KAKADU_BASE_PATH=os.getenv('KAKADU_HOME', '')
+# Encoder jp2s are written with. kakadu needs a licensed install at KAKADU_HOME, openjpeg runs through pillow
+JP2_ENCODERS=['kakadu', 'openjpeg']
+JP2_ENCODER=os.getenv('AVI_JP2_ENCODER', 'kakadu')
+# Named set of tile size and encoder options from JP2_PROFILES jp2s are written with
+JP2_PROFILE=os.getenv('AVI_JP2_PROFILE', 'archival')
+# Size budget jp2 layer rates are derived from instead of IMAGE_DEFAULT_COMPRESSION. 0 turns a budget off and with
+# both set the smaller wins
+JP2_TARGET_BYTES_PER_PIXEL=float(os.getenv('AVI_JP2_TARGET_BYTES_PER_PIXEL', '0'))
+JP2_TARGET_BYTES=int(float(os.getenv('AVI_JP2_TARGET_MB', '0')) * 1024 * 1024)
+# A jp2 over its budget by more than this fraction is encoded once more with its rates scaled down
+JP2_TARGET_TOLERANCE=0.01
+# Jp2s are checked against the options they were encoded with by reading their box and marker headers. Mismatches are
+# logged and reported in the result but don't fail the conversion, the expected kakadu structures have not been checked
+# against a licensed kakadu's output
+JP2_VERIFY=str(os.getenv('AVI_JP2_VERIFY', 'true')).lower() == 'true'
+# Colour tiffs that need an icc conversion are streamed to kdu_compress through a named pipe as they are converted
+# instead of being written to an intermediate tiff first
+KDU_STREAM=str(os.getenv('AVI_KDU_STREAM', 'false')).lower() == 'true'
+KDU_STREAM_OPEN_TIMEOUT=float(os.getenv('AVI_KDU_STREAM_OPEN_TIMEOUT', '30'))
 CONSOLE_DEBUG_MODE=str(os.getenv('AVI_DEBUG', 'false')).lower() == 'true'
 # NOTE: May not need the source folder path below. But definetley in the avi processor
 PROJECT_ROOT=Path(__file__).parent.parent
 ICC_PROFILE_PATH=PROJECT_ROOT / 'color_profiles' / 'sRGB_IEC61966-2-1_no_black_scaling.icc'
+
+@lru_cache(maxsize=None)
+def target_icc_profile() -> bytes:
+    """
+    Bytes of the ICC_PROFILE_PATH profile colour jp2s are converted to, read once per process
+    """
+    return ICC_PROFILE_PATH.read_bytes()
+
 EXIFTOOL_PATH=os.getenv('EXIFTOOL_PATH', 'exiftool')
+# Copy metadata through one long lived exiftool -stay_open process per worker instead of starting perl for every file.
+# Batch runs and the worker service always do, AVI_EXIFTOOL_STAY_OPEN=true turns it on for single files too
+EXIFTOOL_STAY_OPEN=str(os.getenv('AVI_EXIFTOOL_STAY_OPEN', 'false')).lower() == 'true'
+EXIFTOOL_TIMEOUT=float(os.getenv('AVI_EXIFTOOL_TIMEOUT', '60'))
+# Directory for intermediate files (eg. the icc converted tiff). Point at a tmpfs or fast local disk. None uses the system default
+SCRATCH_DIR=os.getenv('AVI_SCRATCH_DIR') or None
 COLOR_MODES=['RGB', 'RGBA']
+# Greyscale modes pillow opens 16 bit images in. 'I' is read as 16 bit samples too
+SIXTEEN_BIT_GRAY_MODES=['I;16', 'I;16B', 'I;16L', 'I;16N', 'I']
+# Uncompressed 8 bit tiffs have their icc profile converted a band of rows at a time. Each thread holds about one band
+ICC_STRIP_BYTES=int(os.getenv('AVI_ICC_STRIP_MB', '16')) * 1024 * 1024
+ICC_STRIP_THREADS=int(os.getenv('AVI_ICC_STRIP_THREADS', '1'))
 VALID_IMAGE_EXTENSIONS=['.tiff', '.tif']
 VALID_VIDEO_EXTENSIONS=['.mov', '.mp4', '.avi']
 VALID_AUDIO_EXTENSIONS=['.wav']
 MAX_CONCURRENCY=min(32, os.cpu_count() + 4)
+# Process pool size for batch jp2 conversions. Kakadu threads are split evenly between the workers
+JP2_BATCH_MAX_WORKERS=int(os.getenv('AVI_JP2_BATCH_WORKERS', str(min(MAX_CONCURRENCY, os.cpu_count()))))
+JP2_BATCH_MANIFEST_EXTENSIONS=VALID_IMAGE_EXTENSIONS
+# Preflight lists directories on a thread pool and reads tiff headers on a process pool, PREFLIGHT_CHUNK_SIZE files per task
+PREFLIGHT_MAX_WORKERS=int(os.getenv('AVI_PREFLIGHT_WORKERS', str(os.cpu_count())))
+PREFLIGHT_WALK_THREADS=int(os.getenv('AVI_PREFLIGHT_WALK_THREADS', '8'))
+PREFLIGHT_CHUNK_SIZE=64
+# Batch runs and the worker service only start jobs while the sum of their estimated peak memory stays under this budget.
+# Defaults to 3/4 of physical memory, 0 turns admission control off. Smaller jobs may start ahead of one that doesn't
+# fit at most MEMORY_MAX_BYPASS times before it is waited for
+MEMORY_BUDGET_BYTES=int(os.getenv('AVI_MEMORY_BUDGET_MB', str(os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') * 3 // 4 // (1024 * 1024)))) * 1024 * 1024
+MEMORY_MAX_BYPASS=int(os.getenv('AVI_MEMORY_MAX_BYPASS', '8'))
+# Estimated memory of a worker and its tools before any pixels are loaded
+JOB_BASE_MEMORY_BYTES=int(os.getenv('AVI_JOB_BASE_MEMORY_MB', '96')) * 1024 * 1024
+# kdu_compress holds about this many rows of 32 bit samples at once, the -flush_period of coded blocks and a row of tiles
+KDU_MEMORY_ROWS=int(os.getenv('AVI_KDU_MEMORY_ROWS', '2048'))
 KDU_DEFAULT_LAYER_COUNT=8
 KDU_DEFAULT_TILE_SIZE=1024
 IMAGE_DEFAULT_COMPRESSION=10
@@ -20,6 +75,26 @@ IMAGE_MAX_LEVEL_SIZE=96
 # Get screenshot five seconds into video
 FFMPEG_DEFAULT_SS_TIME=5
 FFMPEG_THUMBNAIL_SIZE=(300, 300)
+# Grabbed frames are piped to PIL as a raw rgb24 ppm instead of round tripping through a jpeg on disk
+FFMPEG_FRAME_PIPE_ARGS={'format': 'image2pipe', 'vcodec': 'ppm', 'pix_fmt': 'rgb24'}
+FFMPEG_WAVEFORM_SIZE='1800x280'
+# Seek thumbnails to the nearest keyframe and only decode keyframes instead of decoding up to the exact ss_time
+FFMPEG_KEYFRAME_SEEK=str(os.getenv('AVI_FFMPEG_KEYFRAME_SEEK', 'false')).lower() == 'true'
+FFMPEG_KEYFRAME_INPUT_ARGS={'noaccurate_seek': None, 'skip_frame': 'nokey'}
+FFMPEG_CONTACT_SHEET_GRID=(5, 5)
+FFMPEG_CONTACT_SHEET_TILE_WIDTH=160
+# Derivatives process_derivatives can produce from a single ffmpeg run
+FFMPEG_DERIVATIVE_TYPES=['thumbnail', 'mp3', 'waveform']
+
+# ffprobe results are cached in memory and in a sqlite db keyed on path, size and mtime. Set AVI_FFPROBE_CACHE_PATH=''
+# to keep the cache in memory only
+FFPROBE_CACHE_ENABLED=str(os.getenv('AVI_FFPROBE_CACHE', 'true')).lower() == 'true'
+FFPROBE_CACHE_PATH=os.getenv('AVI_FFPROBE_CACHE_PATH', str(Path.home() / '.cache' / 'avi_py' / 'ffprobe_cache.sqlite3')) or None
+FFPROBE_CACHE_MAX_BYTES=int(os.getenv('AVI_FFPROBE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+FFPROBE_CACHE_MEMORY_ENTRIES=int(os.getenv('AVI_FFPROBE_CACHE_MEMORY_ENTRIES', '256'))
+
+# Fields requested by the lazy ffprobe. ffmpeg_probe still runs the full probe when read
+FFPROBE_LAZY_ENTRIES='format=duration:stream=index,codec_type,codec_name,width,height'
 
 FFMPEG_AUDIO_ARGS={'ar': '44100', 'ac': 2, 'audio_bitrate': '192k', 'acodec': 'libmp3lame', 'f': 'mp3'}
 
@@ -52,8 +127,67 @@ KAKADU_DEFAULT_RECIPE=[
     'ORGgen_plt=yes',
     'ORGtparts=R',
 ]
+# The parts of KAKADU_DEFAULT_RECIPE pillow's openjpeg encoder can set. It can't write SOP/EPH markers or tile parts.
+# kakadu's lossy default is the irreversible 9/7 wavelet with a colour transform on rgb
+OPENJPEG_DEFAULT_OPTIONS={'codeblock_size': (64, 64), 'progression': 'RPCL', 'irreversible': True, 'plt': True}
+# archival is the original recipe. iiif-fast-read trades a little size for region reads: smaller tiles so a region
+# touches less of the codestream and precincts so a reader can find the packets of one area of a resolution level
+JP2_PROFILES={
+    'archival': {
+        'tile_size': KDU_DEFAULT_TILE_SIZE,
+        'kakadu_recipe': KAKADU_DEFAULT_RECIPE,
+        'openjpeg_options': OPENJPEG_DEFAULT_OPTIONS,
+    },
+    'iiif-fast-read': {
+        'tile_size': 512,
+        'kakadu_recipe': [
+            'Cblk={64,64}',
+            'Cprecincts={256,256},{256,256},{128,128}',
+            'Cuse_sop=yes',
+            'Cuse_eph=yes',
+            'Corder=RPCL',
+            'ORGgen_plt=yes',
+            'ORGtparts=R',
+        ],
+        'openjpeg_options': dict(OPENJPEG_DEFAULT_OPTIONS, precinct_size=(256, 256)),
+    },
+}
+
+def check_jp2_profile(profile: str, error_class: type=ValueError) -> None:
+    """
+    Raises error_class if profile is not one of JP2_PROFILES
+    """
+    if profile not in JP2_PROFILES:
+        raise error_class(f'Unknown jp2 profile {profile}. Expected one of {", ".join(JP2_PROFILES)}')
+
+# Downscaled derivatives a jp2 conversion can write alongside the jp2 from the same decode of the source. Each fits
+# inside a max_side square and is saved with the pillow quality given
+IMAGE_DERIVATIVES={
+    'access': {'format': 'JPEG', 'max_side': 3000, 'quality': 90},
+    'thumbnail': {'format': 'JPEG', 'max_side': 300, 'quality': 85},
+    'access_webp': {'format': 'WEBP', 'max_side': 3000, 'quality': 85},
+    'thumbnail_webp': {'format': 'WEBP', 'max_side': 300, 'quality': 80},
+}
 
 TESS_MAX_PROCESSES=min(2, os.cpu_count())
+TESS_BATCH_MAX_WORKERS=int(os.getenv('AVI_TESS_BATCH_WORKERS', str(os.cpu_count())))
 TESS_DEFAULT_LANG=r'osd+eng'
 TESS_DEFAULT_CFG=r'--oem 1 --psm 1 --dpi 300'
 TESS_OUT_FILE_TYPES={'pdf': 'pdf', 'alto': 'xml'}
+# off by default, the single pass pdf embeds the bilevel pre processed page instead of the original scan
+TESS_SINGLE_PASS=str(os.getenv('AVI_TESS_SINGLE_PASS', 'false')).lower() == 'true'
+TESS_RENDERER_CONFIGS={'pdf': 'tessedit_create_pdf=1', 'alto': 'tessedit_create_alto=1'}
+
+SERVICE_COMMANDS=['avi_jp2_convert', 'avi_ffmpeg_thumbnail', 'avi_ffmpeg_contact_sheet', 'avi_ffmpeg_mp3', 'avi_ocr']
+SERVICE_SOCKET_PATH=os.getenv('AVI_SERVICE_SOCKET', '/tmp/avi_py.sock')
+SERVICE_MAX_JOBS=int(os.getenv('AVI_SERVICE_MAX_JOBS', str(os.cpu_count())))
+
+# Incremental runs skip derivatives whose .<derivative>.avi.json sidecar still matches the source, settings and tool
+# versions. Sources whose mtime changed are rehashed before regenerating unless AVI_INCREMENTAL_HASH=false
+INCREMENTAL=str(os.getenv('AVI_INCREMENTAL', 'false')).lower() == 'true'
+INCREMENTAL_HASH_SOURCE=str(os.getenv('AVI_INCREMENTAL_HASH', 'true')).lower() == 'true'
+INCREMENTAL_HASH_CHUNK_SIZE=1024 * 1024
+SIDECAR_SUFFIX='.avi.json'
+
+# node_exporter textfile collector file every processor adds its stage timings and byte counts to. Unset to disable
+PROMETHEUS_TEXTFILE_PATH=os.getenv('AVI_PROMETHEUS_TEXTFILE') or None
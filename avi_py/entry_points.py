@@ -1,50 +1,112 @@
 import sys
+import json
+import signal
 import logging
 
-from argparse import ArgumentParser, Namespace
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
 from pathlib import Path
+from typing import Optional, List, Tuple
 from . import constants as avi_const
-from .avi_jp2_processor import AviJp2Processor
-from .avi_ffmpeg_processor import AviFFMpegProcessor
-from .avi_tesseract_processor import AviTesseractProcessor
+# The processors (and the worker service/client) are imported inside the function that runs them so each script only
+# loads its own dependencies, eg. avi_ffmpeg_mp3 never imports cv2, numpy, pytesseract or image_processing
 
 __LOG_FORMAT = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
 __DEFAULT_LOG_PATH = str(Path.cwd() / 'logs' / 'avi_py.log')
 __JP2_PARSER_DESC = "Generate a JP2 from a TIFF. Adds sRGB_IEC61966-2-1_no_black_scaling icc profile if is color. Prevalidates image before conversion"
+__JP2_BATCH_HELP = "Convert every tif listed in a manifest (one src path per line, optionally followed by a tab and dest path) or in a directory. Prints one json result per line"
 __FFMPEG_THUMB_PARSER_DESC = "Generate a 300x300 pixel thumbnail from a given .mov or .mp4 file"
+__FFMPEG_CONTACT_SHEET_PARSER_DESC = "Generate a contact sheet of evenly spaced frames from a given .mov or .mp4 file"
+__FFMPEG_KEYFRAME_HELP = "Only decode keyframes. Much faster on long or high bitrate video, the frame may be a few seconds off"
 __FFMPEG_AUDIO_PARSER_DESC = "Generate a mp3 from a given .wav file"
 __OCR_PARSER_DESC = "Generate OCR searchable pdfs and mets alto for a given .tif file"
-__all__ = ['convert_jp2_main', 'ffmpeg_thumbnail_main', 'ffmpeg_mp3_main', 'tesseract_ocr_main']
+__OCR_BATCH_HELP = "OCR every tif listed in a manifest (one src path per line) or in a directory on one process pool. Prints one json result per line"
+__SERVICE_PARSER_DESC = "Run a resident worker service that keeps the avi_py processors loaded and runs jobs sent by avi_client"
+__CLIENT_PARSER_DESC = "Run one of the avi_py scripts on a running avi_service. Prints the same json result as the script"
+__INCREMENTAL_HELP = "Skip outputs whose .avi.json sidecar shows they are up to date with the source, settings and tool versions"
+__JP2_DERIVATIVE_HELP = f"Also write an image derivative to PATH from the same decode of the tif. NAME is one of {', '.join(avi_const.IMAGE_DERIVATIVES)}. Can be repeated"
+__JP2_PROFILE_HELP = "Named set of tile size and encoder options to write the jp2 with. Defaults to AVI_JP2_PROFILE"
+__JP2_TARGET_BPP_HELP = "Size budget for the jp2 in bytes per pixel, its layer rates are derived from it. 0 turns it off. Defaults to AVI_JP2_TARGET_BYTES_PER_PIXEL"
+__JP2_TARGET_BYTES_HELP = "Size budget for the whole jp2 in bytes. 0 turns it off, with both budgets set the smaller wins. Defaults to AVI_JP2_TARGET_MB"
+__MEMORY_BUDGET_HELP = "Only start jobs while their estimated memory adds up to at most this many MB. 0 only limits the number of jobs"
+__PREFLIGHT_PARSER_DESC = "Check every tif under the given files and directories for jp2 conversion from their headers alone. Prints one json result per line"
+__all__ = ['convert_jp2_main', 'jp2_preflight_main', 'ffmpeg_thumbnail_main', 'ffmpeg_contact_sheet_main', 'ffmpeg_mp3_main',
+           'tesseract_ocr_main', 'avi_service_main', 'avi_client_main']
 
 def convert_jp2_main() -> None:
     """
     A basic command line script that runs :func:`~avi_py.avi_jp2_processor.AviJp2Processor.process_jp2`"
     """
+    from .avi_jp2_processor import AviJp2Processor, AviJp2ProcessorError #pylint: disable=import-outside-toplevel
 
     args = __parse_jp2_args()
     __setup_logger(args.log_file, args.log_level)
 
+    if args.batch is not None:
+        __convert_jp2_batch(args)
+        return
+
+    if args.src_file_path is None or args.dest_file_path is None:
+        sys.exit('Error! src_file_path and dest_file_path are required unless --batch is given')
+
     try:
-        jp2_conversion = AviJp2Processor.process_jp2(args.src_file_path, args.dest_file_path)
+        jp2_conversion = AviJp2Processor.process_jp2(args.src_file_path, args.dest_file_path, incremental=args.incremental,
+                                                     profile=args.profile, target_bytes_per_pixel=args.target_bytes_per_pixel,
+                                                     target_bytes=args.target_bytes, derivative_paths=dict(args.derivative))
         json_result = jp2_conversion.json_result()
         if jp2_conversion.success:
             print("{}".format(json_result), end='')
         else:
             sys.exit("Error! {}".format(json_result))
-    except FileNotFoundError as f_ex:
+    except (FileNotFoundError, AviJp2ProcessorError) as f_ex:
         sys.exit("Error! {}".format(str(f_ex)))
 
+def __convert_jp2_batch(args: Namespace) -> None:
+    """
+    Runs :class:`~avi_py.avi_jp2_batch_processor.AviJp2BatchProcessor` and prints one json result per line as each file finishes
+    """
+    from .avi_batch_processor import AviBatchProcessorError #pylint: disable=import-outside-toplevel
+    from .avi_jp2_batch_processor import AviJp2BatchProcessor #pylint: disable=import-outside-toplevel
+    try:
+        jp2_batch = AviJp2BatchProcessor.from_manifest(args.batch, args.dest_dir, args.max_workers, args.incremental,
+                                                       args.memory_budget_mb * 1024 * 1024, args.profile,
+                                                       args.target_bytes_per_pixel, args.target_bytes)
+        for result in jp2_batch.iter_results():
+            print(json.dumps(result), flush=True)
+        if not jp2_batch.success:
+            sys.exit("Error! {}".format(jp2_batch.result_message))
+    except (FileNotFoundError, AviBatchProcessorError) as f_ex:
+        sys.exit("Error! {}".format(str(f_ex)))
+
+def jp2_preflight_main() -> None:
+    """
+    A basic command line script that runs :func:`~avi_py.avi_jp2_preflight.AviJp2Preflight.iter_results`
+    """
+    from .avi_jp2_preflight import AviJp2Preflight #pylint: disable=import-outside-toplevel
+    args = __parse_preflight_args()
+    __setup_logger(args.log_file, args.log_level)
+    try:
+        preflight = AviJp2Preflight(args.paths, args.max_workers)
+        for result in preflight.iter_results():
+            if not args.unsuitable_only or not result['suitable']:
+                print(json.dumps(result), flush=True)
+        if not preflight.success:
+            sys.exit("Error! {}".format(preflight.result_message))
+    except FileNotFoundError as f_ex:
+        sys.exit("Error! {}".format(str(f_ex)))
 
 def ffmpeg_thumbnail_main() -> None:
     """
     A basic command line script that runs :func:`~avi_py.avi_ffmpeg_processor.AviFFMpegProcessor.process_thumbnail`"
     """
+    from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
 
     args = __parse_ffmpeg_thumbnail_args()
     __setup_logger(args.log_file, args.log_level)
 
     try:
-        ffmpeg_thumb = AviFFMpegProcessor.process_thumbnail(args.src_file_path, args.dest_file_path)
+        ffmpeg_thumb = AviFFMpegProcessor.process_thumbnail(args.src_file_path, args.dest_file_path,
+                                                            keyframe_seek=args.keyframe or avi_const.FFMPEG_KEYFRAME_SEEK,
+                                                            incremental=args.incremental)
         json_result = ffmpeg_thumb.json_result()
         if ffmpeg_thumb.success:
             print("{}".format(json_result), end='')
@@ -53,15 +115,38 @@ def ffmpeg_thumbnail_main() -> None:
     except FileNotFoundError as f_ex:
         sys.exit("Error! {}".format(str(f_ex)))
 
+def ffmpeg_contact_sheet_main() -> None:
+    """
+    A basic command line script that runs :func:`~avi_py.avi_ffmpeg_processor.AviFFMpegProcessor.process_contact_sheet`"
+    """
+    from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
+    args = __parse_ffmpeg_contact_sheet_args()
+    __setup_logger(args.log_file, args.log_level)
+
+    try:
+        ffmpeg_sheet = AviFFMpegProcessor.process_contact_sheet(args.src_file_path, args.dest_file_path,
+                                                                grid=(args.columns, args.rows),
+                                                                tile_width=args.tile_width,
+                                                                keyframe_seek=not args.accurate,
+                                                                incremental=args.incremental)
+        json_result = ffmpeg_sheet.json_result()
+        if ffmpeg_sheet.success:
+            print("{}".format(json_result), end='')
+        else:
+            sys.exit("Error! {}".format(json_result))
+    except FileNotFoundError as f_ex:
+        sys.exit("Error! {}".format(str(f_ex)))
+
 def ffmpeg_mp3_main() -> None:
     """
     A basic command line script that runs :func:`~avi_py.avi_ffmpeg_processor.AviFFMpegProcessor.process_mp3`"
     """
+    from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
     args = __parse_ffmpeg_mp3_args()
     __setup_logger(args.log_file, args.log_level)
 
     try:
-        ffmpeg_thumb = AviFFMpegProcessor.process_mp3(args.src_file_path, args.dest_file_path)
+        ffmpeg_thumb = AviFFMpegProcessor.process_mp3(args.src_file_path, args.dest_file_path, incremental=args.incremental)
         json_result = ffmpeg_thumb.json_result()
         if ffmpeg_thumb.success:
             print("{}".format(json_result), end='')
@@ -75,10 +160,20 @@ def tesseract_ocr_main() -> None:
     """
     A basic command line script that runs :func:`~avi_py.avi_tesseract_processor.AviTesseractProcessor.process_thumbnail`"
     """
+    from .avi_tesseract_processor import AviTesseractProcessor #pylint: disable=import-outside-toplevel
     args = __parse_tesseract_args()
     __setup_logger(args.log_file, args.log_level)
+
+    if args.batch is not None:
+        __tesseract_ocr_batch(args)
+        return
+
+    if args.src_file_path is None:
+        sys.exit('Error! src_file_path is required unless --batch is given')
+
     try:
-        tesseract_process = AviTesseractProcessor.process_batch_ocr(args.src_file_path, args.tess_langs, args.tess_cfg, args.replace_if_exists, args.generate_searchable_pdf)
+        tesseract_process = AviTesseractProcessor.process_batch_ocr(args.src_file_path, args.tess_langs, args.tess_cfg, args.replace_if_exists, args.generate_searchable_pdf,
+                                                                    args.single_pass, args.incremental)
         json_result = tesseract_process.json_result()
         if tesseract_process.success:
             print("{}".format(json_result), end='')
@@ -87,6 +182,110 @@ def tesseract_ocr_main() -> None:
     except (FileNotFoundError, AssertionError) as ex:
         sys.exit("Error! {}".format(str(ex)))
 
+def __tesseract_ocr_batch(args: Namespace) -> None:
+    """
+    Runs :class:`~avi_py.avi_tesseract_batch_processor.AviTesseractBatchProcessor` and prints one json result per line as each page finishes
+    """
+    from .avi_tesseract_batch_processor import AviTesseractBatchProcessor #pylint: disable=import-outside-toplevel
+    try:
+        ocr_batch = AviTesseractBatchProcessor.from_manifest(args.batch, args.max_workers,
+                                                             tess_langs=args.tess_langs,
+                                                             tess_cfg=args.tess_cfg,
+                                                             replace_if_exists=args.replace_if_exists,
+                                                             generate_searchable_pdf=args.generate_searchable_pdf,
+                                                             single_pass=args.single_pass,
+                                                             incremental=args.incremental,
+                                                             memory_budget=args.memory_budget_mb * 1024 * 1024)
+        for result in ocr_batch.iter_results():
+            print(json.dumps(result), flush=True)
+        if not ocr_batch.success:
+            sys.exit("Error! {}".format(ocr_batch.result_message))
+    except FileNotFoundError as f_ex:
+        sys.exit("Error! {}".format(str(f_ex)))
+
+def avi_service_main() -> None:
+    """
+    A basic command line script that runs :func:`~avi_py.avi_worker_service.AviWorkerService.serve_forever`
+    """
+    from .avi_worker_service import AviWorkerService #pylint: disable=import-outside-toplevel
+    args = __parse_service_args()
+    __setup_logger(args.log_file, args.log_level)
+    worker_service = AviWorkerService(run_entry_point, args.socket, args.max_jobs, args.memory_budget_mb * 1024 * 1024)
+    # exit through serve_forever's cleanup so the socket is removed on a normal kill too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        worker_service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def avi_client_main() -> None:
+    """
+    A basic command line script that runs :func:`~avi_py.avi_worker_client.AviWorkerClient.run`
+    """
+    from .avi_worker_client import AviWorkerClient #pylint: disable=import-outside-toplevel
+    args = __parse_client_args()
+    try:
+        result = AviWorkerClient(args.socket).run(args.command, args.args)
+        json_result = json.dumps(result)
+        if result.get('success'):
+            print("{}".format(json_result), end='')
+        else:
+            sys.exit("Error! {}".format(json_result))
+    except OSError as os_ex:
+        sys.exit("Error! Could not reach the avi_py worker service at {}. {}".format(args.socket, str(os_ex)))
+
+def run_entry_point(prog: str, argv: List[str], kdu_num_threads: Optional[int]=None) -> dict:
+    """
+    Runs one of the single file scripts with argv in the current process and returns the result dict it would print.
+    Used by :class:`~avi_py.avi_worker_service.AviWorkerService`, batch mode and the log arguments are not supported
+    """
+    try:
+        if prog == 'avi_jp2_convert':
+            return __run_jp2_convert(argv, kdu_num_threads)
+        if prog == 'avi_ffmpeg_thumbnail':
+            from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
+            args = __parse_ffmpeg_thumbnail_args(argv)
+            return AviFFMpegProcessor.process_thumbnail(args.src_file_path, args.dest_file_path,
+                                                        keyframe_seek=args.keyframe or avi_const.FFMPEG_KEYFRAME_SEEK,
+                                                        incremental=args.incremental).result
+        if prog == 'avi_ffmpeg_contact_sheet':
+            from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
+            args = __parse_ffmpeg_contact_sheet_args(argv)
+            return AviFFMpegProcessor.process_contact_sheet(args.src_file_path, args.dest_file_path, grid=(args.columns, args.rows),
+                                                            tile_width=args.tile_width, keyframe_seek=not args.accurate,
+                                                            incremental=args.incremental).result
+        if prog == 'avi_ffmpeg_mp3':
+            from .avi_ffmpeg_processor import AviFFMpegProcessor #pylint: disable=import-outside-toplevel
+            args = __parse_ffmpeg_mp3_args(argv)
+            return AviFFMpegProcessor.process_mp3(args.src_file_path, args.dest_file_path, incremental=args.incremental).result
+        if prog == 'avi_ocr':
+            from .avi_tesseract_processor import AviTesseractProcessor #pylint: disable=import-outside-toplevel
+            args = __parse_tesseract_args(argv)
+            if args.batch is not None or args.src_file_path is None:
+                raise ValueError('avi_ocr needs src_file_path, --batch is not supported by the worker service')
+            return AviTesseractProcessor.process_batch_ocr(args.src_file_path, args.tess_langs, args.tess_cfg, args.replace_if_exists,
+                                                           args.generate_searchable_pdf, args.single_pass, args.incremental).result
+        raise ValueError(f'Unknown command {prog}')
+    except (FileNotFoundError, AssertionError, ValueError) as ex:
+        return { 'success': False, 'message': str(ex) }
+
+def __run_jp2_convert(argv: List[str], kdu_num_threads: Optional[int]=None) -> dict:
+    """
+    The avi_jp2_convert part of run_entry_point. AviJp2ProcessorError is only importable along with the processor,
+    so it is caught here
+    """
+    from .avi_jp2_processor import AviJp2Processor, AviJp2ProcessorError #pylint: disable=import-outside-toplevel
+    args = __parse_jp2_args(argv)
+    if args.batch is not None or args.src_file_path is None or args.dest_file_path is None:
+        raise ValueError('avi_jp2_convert needs src_file_path and dest_file_path, --batch is not supported by the worker service')
+    try:
+        return AviJp2Processor.process_jp2(args.src_file_path, args.dest_file_path, kdu_num_threads=kdu_num_threads,
+                                           incremental=args.incremental, exiftool_stay_open=True, profile=args.profile,
+                                           target_bytes_per_pixel=args.target_bytes_per_pixel, target_bytes=args.target_bytes,
+                                           derivative_paths=dict(args.derivative)).result
+    except AviJp2ProcessorError as jp2_ex:
+        return { 'success': False, 'message': str(jp2_ex) }
+
 def __setup_logger(log_file: str, log_level_name: str='debug') -> None:
     """
     Sets up the logger. Writes to console as well a file if AVI_DEBUG=true
@@ -109,38 +308,102 @@ def __setup_logger(log_file: str, log_level_name: str='debug') -> None:
         stream_handler.setFormatter(__LOG_FORMAT)
         root_logger.addHandler(stream_handler)
 
-def __parse_ffmpeg_thumbnail_args(parser: ArgumentParser=ArgumentParser(prog='avi_ffmpeg_thumbnail',
-                                            description=__FFMPEG_THUMB_PARSER_DESC)) -> Namespace:
+def __parse_ffmpeg_thumbnail_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_ffmpeg_thumbnail', description=__FFMPEG_THUMB_PARSER_DESC)
     parser.add_argument('src_file_path', type=str, help='Full path to the source mov|mp4 file to covert')
     parser.add_argument('dest_file_path', type=str, help='Path to jpg thumbnail output file')
+    parser.add_argument('--keyframe', action='store_true', help=__FFMPEG_KEYFRAME_HELP)
+    parser.add_argument('--incremental', action='store_true', default=avi_const.INCREMENTAL, help=__INCREMENTAL_HELP)
+    parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
+    parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='DEBUG')
+    return parser.parse_args(argv)
+
+def __parse_ffmpeg_contact_sheet_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_ffmpeg_contact_sheet', description=__FFMPEG_CONTACT_SHEET_PARSER_DESC)
+    columns, rows = avi_const.FFMPEG_CONTACT_SHEET_GRID
+    parser.add_argument('src_file_path', type=str, help='Full path to the source mov|mp4 file to covert')
+    parser.add_argument('dest_file_path', type=str, help='Path to jpg contact sheet output file')
+    parser.add_argument('--columns', type=int, help='Number of frames per row', required=False, default=columns)
+    parser.add_argument('--rows', type=int, help='Number of rows', required=False, default=rows)
+    parser.add_argument('--tile_width', type=int, help='Width in pixels of each frame', required=False,
+                        default=avi_const.FFMPEG_CONTACT_SHEET_TILE_WIDTH)
+    parser.add_argument('--accurate', action='store_true', help='Decode every frame instead of keyframes only')
+    parser.add_argument('--incremental', action='store_true', default=avi_const.INCREMENTAL, help=__INCREMENTAL_HELP)
     parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
     parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='DEBUG')
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
-def __parse_ffmpeg_mp3_args(parser: ArgumentParser=ArgumentParser(prog='avi_ffmpeg_mp3',
-                                            description=__FFMPEG_AUDIO_PARSER_DESC)) -> Namespace:
+def __parse_ffmpeg_mp3_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_ffmpeg_mp3', description=__FFMPEG_AUDIO_PARSER_DESC)
     parser.add_argument('src_file_path', type=str, help='Full path to the source wav file to covert')
     parser.add_argument('dest_file_path', type=str, help='Path to mp3 thumbnail output file')
+    parser.add_argument('--incremental', action='store_true', default=avi_const.INCREMENTAL, help=__INCREMENTAL_HELP)
     parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
     parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='DEBUG')
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
-def __parse_jp2_args(parser: ArgumentParser=ArgumentParser(prog='avi_jp2_convert',
-                                            description=__JP2_PARSER_DESC)) -> Namespace:
-    parser.add_argument('src_file_path', type=str, help='Full path to the source tif file to covert')
-    parser.add_argument('dest_file_path', type=str, help='Path to jp2 output file')
+def __parse_jp2_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_jp2_convert', description=__JP2_PARSER_DESC)
+    parser.add_argument('src_file_path', type=str, nargs='?', help='Full path to the source tif file to covert')
+    parser.add_argument('dest_file_path', type=str, nargs='?', help='Path to jp2 output file')
+    parser.add_argument('--batch', type=str, help=__JP2_BATCH_HELP, required=False, default=None)
+    parser.add_argument('--dest_dir', type=str, help='Output directory for batch jp2s without a manifest dest path. Defaults to the source directory', required=False, default=None)
+    parser.add_argument('--max_workers', type=int, help='Number of parallel batch conversions', required=False, default=avi_const.JP2_BATCH_MAX_WORKERS)
+    parser.add_argument('--memory_budget_mb', type=int, help=__MEMORY_BUDGET_HELP, required=False, default=avi_const.MEMORY_BUDGET_BYTES // (1024 * 1024))
+    parser.add_argument('--derivative', type=__derivative_arg, action='append', metavar='NAME=PATH', help=__JP2_DERIVATIVE_HELP, default=[])
+    parser.add_argument('--profile', type=str, choices=list(avi_const.JP2_PROFILES), help=__JP2_PROFILE_HELP, required=False, default=avi_const.JP2_PROFILE)
+    parser.add_argument('--target_bpp', dest='target_bytes_per_pixel', type=float, help=__JP2_TARGET_BPP_HELP, required=False, default=avi_const.JP2_TARGET_BYTES_PER_PIXEL)
+    parser.add_argument('--target_bytes', dest='target_bytes', type=int, help=__JP2_TARGET_BYTES_HELP, required=False, default=avi_const.JP2_TARGET_BYTES)
+    parser.add_argument('--incremental', action='store_true', default=avi_const.INCREMENTAL, help=__INCREMENTAL_HELP)
     parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
     parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='debug')
-    return parser.parse_args()
+    return parser.parse_args(argv)
+
+def __derivative_arg(value: str) -> Tuple[str, str]:
+    name, _, dest_path = value.partition('=')
+    if name not in avi_const.IMAGE_DERIVATIVES or not dest_path:
+        raise ArgumentTypeError(f'{value} is not NAME=PATH with NAME one of {", ".join(avi_const.IMAGE_DERIVATIVES)}')
+    return name, dest_path
 
-def __parse_tesseract_args(parser: ArgumentParser=ArgumentParser(prog='avi_ocr',
-                                                  description=__OCR_PARSER_DESC)) -> Namespace:
-    parser.add_argument('src_file_path', type=str, help='Full path to source tif file to perform OCR on')
+def __parse_tesseract_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_ocr', description=__OCR_PARSER_DESC)
+    parser.add_argument('src_file_path', type=str, nargs='?', help='Full path to source tif file to perform OCR on')
+    parser.add_argument('--batch', type=str, help=__OCR_BATCH_HELP, required=False, default=None)
+    parser.add_argument('--max_workers', type=int, help='Number of pages OCRed in parallel', required=False, default=avi_const.TESS_BATCH_MAX_WORKERS)
+    parser.add_argument('--memory_budget_mb', type=int, help=__MEMORY_BUDGET_HELP, required=False, default=avi_const.MEMORY_BUDGET_BYTES // (1024 * 1024))
     parser.add_argument('--tess_langs', type=str, help='Tesseract languages to use. Note use multiple with +. (eg, eng+fra)', required=False, default=avi_const.TESS_DEFAULT_LANG)
     parser.add_argument('--tess_cfg', type=str, help='Tesseract configuration options', required= False, default=avi_const.TESS_DEFAULT_CFG)
     parser.add_argument('--replace-if-exists', dest='replace_if_exists', action='store_true', help='Replace ocr files for image if they exist')
     parser.add_argument('--no-pdf', dest='generate_searchable_pdf', action='store_false', help='Skip pdf generation')
+    parser.add_argument('--single-pass', dest='single_pass', action='store_true', help='Render the pdf and mets alto from one tesseract pass over the pre processed (bilevel) page')
+    parser.add_argument('--two-pass', dest='single_pass', action='store_false', help='Run tesseract separately for the pdf (raw tif) and the mets alto')
+    parser.add_argument('--incremental', action='store_true', default=avi_const.INCREMENTAL, help=__INCREMENTAL_HELP)
+    parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
+    parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='debug')
+    parser.set_defaults(replace_if_exists=False, generate_searchable_pdf=True, single_pass=avi_const.TESS_SINGLE_PASS)
+    return parser.parse_args(argv)
+
+def __parse_preflight_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_jp2_preflight', description=__PREFLIGHT_PARSER_DESC)
+    parser.add_argument('paths', type=str, nargs='+', help='Source tif files and directories to walk')
+    parser.add_argument('--max_workers', type=int, help='Number of processes reading headers', required=False, default=avi_const.PREFLIGHT_MAX_WORKERS)
+    parser.add_argument('--unsuitable_only', action='store_true', help='Only print files that can not be converted')
+    parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
+    parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='info')
+    return parser.parse_args(argv)
+
+def __parse_service_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_service', description=__SERVICE_PARSER_DESC)
+    parser.add_argument('--socket', type=str, help='Unix socket path to listen on', required=False, default=avi_const.SERVICE_SOCKET_PATH)
+    parser.add_argument('--max_jobs', type=int, help='Number of jobs run at the same time', required=False, default=avi_const.SERVICE_MAX_JOBS)
+    parser.add_argument('--memory_budget_mb', type=int, help=__MEMORY_BUDGET_HELP, required=False, default=avi_const.MEMORY_BUDGET_BYTES // (1024 * 1024))
     parser.add_argument('-Lf', '--log_file', type=str, help='Path to a log file to output', required=False, default=__DEFAULT_LOG_PATH)
     parser.add_argument('-Ll', '--log_level', type=str, help='Log level[debug|info|warning|error|critical]', required=False, default='debug')
-    parser.set_defaults(replace_if_exists=False, generate_searchable_pdf=True)
-    return parser.parse_args()
+    return parser.parse_args(argv)
+
+def __parse_client_args(argv: Optional[List[str]]=None) -> Namespace:
+    parser = ArgumentParser(prog='avi_client', description=__CLIENT_PARSER_DESC)
+    parser.add_argument('--socket', type=str, help='Unix socket path of the running avi_service', required=False, default=avi_const.SERVICE_SOCKET_PATH)
+    parser.add_argument('command', type=str, choices=avi_const.SERVICE_COMMANDS, help='Script to run')
+    parser.add_argument('args', nargs='...', help='Arguments for the script, exactly as they would be passed to it')
+    return parser.parse_args(argv)
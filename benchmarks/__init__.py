@@ -0,0 +1 @@
+"""avi_py benchmarks. Run each module with python -m benchmarks.<module>"""
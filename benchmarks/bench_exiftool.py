@@ -0,0 +1,61 @@
+"""
+Per file latency of AviConverter.copy_over_embedded_metadata with a new exiftool process per file and with the
+persistent exiftool -stay_open process batch runs use.
+
+    python -m benchmarks.bench_exiftool --files 50
+
+The source is a small rgb tiff with the target profile embedded and the metadata is copied into the xmp of a jp2 like
+the jp2 conversion does, so the numbers are dominated by exiftool start up rather than the copy itself.
+"""
+import json
+import time
+import shutil
+import tempfile
+import statistics
+from argparse import ArgumentParser
+from pathlib import Path
+
+from PIL import Image
+
+from avi_py import constants as avi_const
+from avi_py.avi_jp2_processor import AviConverter
+
+from . import fixtures
+
+def _time_copies(converter: AviConverter, src_path: Path, dest_paths: list) -> dict:
+    latencies = []
+    for dest_path in dest_paths:
+        start = time.perf_counter()
+        converter.copy_over_embedded_metadata(str(src_path), str(dest_path), write_only_xmp=True)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'median_file_seconds': round(statistics.median(latencies), 4),
+        'first_file_seconds': round(latencies[0], 4),
+        'total_seconds': round(sum(latencies), 4),
+    }
+
+def run(files: int, exiftool_path: str) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='avi_bench_exiftool') as work_dir:
+        src_path = fixtures.make_tiff(Path(work_dir), 0.25)
+        template_path = Path(work_dir) / 'template.jp2'
+        Image.new('RGB', (64, 64)).save(template_path)
+        for stay_open in [False, True]:
+            variant = 'stay_open' if stay_open else 'per_file'
+            dest_paths = []
+            for index in range(files):
+                dest_paths.append(Path(work_dir) / f'{variant}_{index}.jp2')
+                shutil.copyfile(template_path, dest_paths[-1])
+            converter = AviConverter(exiftool_path=exiftool_path, quiet=True, stay_open=stay_open)
+            results[variant] = _time_copies(converter, src_path, dest_paths)
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_exiftool', description='Metadata copy latency per file with and without a persistent exiftool')
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--exiftool_path', default=avi_const.EXIFTOOL_PATH)
+    args = parser.parse_args()
+    print(json.dumps(run(args.files, args.exiftool_path), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Peak RSS and wall time of the icc profile conversion of an uncompressed tiff loaded whole by image_processing's
+Converter and converted in bands by AviStripIccConverter, and whether their pixels match.
+
+    python -m benchmarks.bench_icc_memory --megapixels 100 --strip_mb 64 --threads 1 4
+
+Each variant runs in its own freshly spawned process and peak RSS is its VmHWM, reset through /proc/self/clear_refs
+once imports are done. The source carries little cms' built in sRGB profile, so every pixel goes through the transform.
+"""
+import json
+import time
+import hashlib
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
+
+from PIL import Image, ImageCms
+from image_processing.conversion import Converter
+
+from avi_py import constants as avi_const
+from avi_py.avi_icc_converter import AviStripIccConverter
+
+from . import fixtures
+
+Image.MAX_IMAGE_PIXELS = None
+
+def _make_source(work_dir: Path, megapixels: float) -> Path:
+    src_path = work_dir / f'other_icc_{megapixels:g}mp.tif'
+    no_icc_path = fixtures.make_tiff(work_dir, megapixels, 'RGB', icc_profile=False)
+    with Image.open(no_icc_path) as img:
+        img.save(src_path, icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+    no_icc_path.unlink()
+    return src_path
+
+def _pixels_digest(tiff_path: Path) -> str:
+    with Image.open(tiff_path) as img:
+        return hashlib.sha256(img.tobytes()).hexdigest()
+
+def _peak_rss_bytes() -> int:
+    with open('/proc/self/status', 'r', encoding='utf-8') as proc_status:
+        for line in proc_status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def _run_variant(src_path: Path, out_path: Path, strip_bytes: int, threads: int) -> dict:
+    # ru_maxrss survives the exec of a spawned process, so reset the high water mark instead
+    with open('/proc/self/clear_refs', 'w', encoding='utf-8') as clear_refs:
+        clear_refs.write('5')
+    start = time.perf_counter()
+    if threads == 0:
+        Converter().convert_icc_profile(str(src_path), str(out_path), str(avi_const.ICC_PROFILE_PATH))
+    else:
+        AviStripIccConverter(src_path, strip_bytes=strip_bytes, threads=threads).convert(out_path)
+    return {
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_bytes': _peak_rss_bytes(),
+    }
+
+def run(megapixels: float, strip_mb: int, thread_counts: List[int]) -> dict:
+    results = {}
+    spawn_context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='avi_bench_icc_memory') as work_dir:
+        src_path = _make_source(Path(work_dir), megapixels)
+        results['source_bytes'] = src_path.stat().st_size
+        digests = {}
+        for threads in [0] + thread_counts:
+            variant = 'whole_image' if threads == 0 else f'strips_{threads}_threads'
+            out_path = Path(work_dir) / f'{variant}.tif'
+            with spawn_context.Pool(1) as pool:
+                results[variant] = pool.apply(_run_variant, (src_path, out_path, strip_mb * 1024 * 1024, threads))
+            digests[variant] = _pixels_digest(out_path)
+            out_path.unlink()
+        results['pixels_match'] = len(set(digests.values())) == 1
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_icc_memory', description='Peak RSS of whole image and strip wise icc profile conversion')
+    parser.add_argument('--megapixels', type=float, default=50)
+    parser.add_argument('--strip_mb', type=int, default=avi_const.ICC_STRIP_BYTES // (1024 * 1024))
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+    print(json.dumps(run(args.megapixels, args.strip_mb, args.threads), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Bytes written per icc profile conversion before and after AviJp2Processor.convert_icc_profile stopped copying the
+source tiff into a temp file first.
+
+    python -m benchmarks.bench_icc_profile --megapixels 50 --scratch_dir /dev/shm
+
+Bytes are counted from write(2)/sendfile(2) calls made by this process (/proc/self/io wchar) plus blocks written by
+child processes such as imagemagick (ru_oublock). Writes to a tmpfs scratch dir do not show up in ru_oublock.
+"""
+import os
+import json
+import shutil
+import tempfile
+import resource
+from argparse import ArgumentParser
+from pathlib import Path
+
+from PIL import Image, ImageCms
+
+from avi_py import constants as avi_const
+from avi_py.avi_jp2_processor import AviJp2Processor
+
+def _self_wchar() -> int:
+    with open('/proc/self/io', 'r', encoding='utf-8') as proc_io:
+        for line in proc_io:
+            if line.startswith('wchar:'):
+                return int(line.split()[1])
+    return 0
+
+def _children_written() -> int:
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock * 512
+
+def _bytes_written(func) -> int:
+    self_before, children_before = _self_wchar(), _children_written()
+    func()
+    return (_self_wchar() - self_before) + (_children_written() - children_before)
+
+def _legacy_convert_icc_profile(jp2_processor: AviJp2Processor) -> str:
+    """
+    The convert_icc_profile implementation before the in place read. Kept here as the baseline
+    """
+    #pylint: disable=consider-using-with,protected-access
+    out_file = tempfile.NamedTemporaryFile(prefix='image_processing-icc-convert-out', suffix=jp2_processor.image_data.image_ext, delete=False)
+    with tempfile.NamedTemporaryFile(prefix='image-processing_', suffix=jp2_processor.image_data.image_ext) as temp_tiff_file_obj:
+        shutil.copy(str(jp2_processor.image_data.image_src_path), temp_tiff_file_obj.name)
+        if jp2_processor.image_data.needs_icc_profile():
+            jp2_processor._AviJp2Processor__convert_icc_profile_with_magick(temp_tiff_file_obj.name, out_file.name)
+        else:
+            jp2_processor.converter.convert_icc_profile(temp_tiff_file_obj.name, out_file.name, str(avi_const.ICC_PROFILE_PATH))
+    #pylint: enable=consider-using-with,protected-access
+    return out_file.name
+
+def _make_sources(work_dir: Path, megapixels: int) -> dict:
+    side = int((megapixels * 1_000_000) ** 0.5)
+    img = Image.effect_noise((side, side), 64).convert('RGB')
+    with open(avi_const.ICC_PROFILE_PATH, 'rb') as icc_file:
+        target_icc = icc_file.read()
+    sources = {
+        'no_icc_profile': work_dir / 'no_icc_profile.tif',
+        'other_icc_profile': work_dir / 'other_icc_profile.tif',
+        'target_icc_profile': work_dir / 'target_icc_profile.tif',
+    }
+    img.save(sources['no_icc_profile'])
+    img.save(sources['other_icc_profile'], icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+    img.save(sources['target_icc_profile'], icc_profile=target_icc)
+    return sources
+
+def run(megapixels: int, scratch_dir: str=None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='avi_bench_icc') as work_dir:
+        for name, src_path in _make_sources(Path(work_dir), megapixels).items():
+            jp2_processor = AviJp2Processor(src_path, Path(work_dir) / f'{name}.jp2', scratch_dir=scratch_dir)
+            outputs = []
+            try:
+                before = _bytes_written(lambda: outputs.append(_legacy_convert_icc_profile(jp2_processor))) #pylint: disable=cell-var-from-loop
+                after = _bytes_written(lambda: outputs.append(jp2_processor.convert_icc_profile())) #pylint: disable=cell-var-from-loop
+                results[name] = {'source_bytes': src_path.stat().st_size, 'before_bytes_written': before, 'after_bytes_written': after}
+            except Exception as ex: #pylint: disable=broad-except
+                results[name] = {'error': f'{ex.__class__.__name__} {ex}'}
+            for out_path in outputs:
+                if out_path != str(src_path) and Path(out_path).exists():
+                    os.unlink(out_path)
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_icc_profile', description='Bytes written per icc profile conversion before and after')
+    parser.add_argument('--megapixels', type=int, default=10)
+    parser.add_argument('--scratch_dir', type=str, default=avi_const.SCRATCH_DIR)
+    args = parser.parse_args()
+    print(json.dumps(run(args.megapixels, args.scratch_dir), indent=2))
+
+if __name__ == '__main__':
+    main()
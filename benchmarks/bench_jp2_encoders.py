@@ -0,0 +1,67 @@
+"""
+Wall time, throughput and output size of the kakadu and openjpeg jp2 encoders on the same synthetic tiff, encoded with
+the options AviImageData decides for it.
+
+    python -m benchmarks.bench_jp2_encoders --megapixels 100 --modes RGB L --threads 1 4 8
+
+Each encoder and thread count runs in its own freshly spawned process, since openjpeg reads OPJ_NUM_THREADS when its
+encoder is created. Sources carry the target icc profile so only the encode is timed. kakadu is skipped when
+kdu_compress isn't installed at KAKADU_HOME.
+"""
+import os
+import json
+import time
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
+
+from avi_py import constants as avi_const
+from avi_py.avi_image_data import AviImageData
+from avi_py.avi_jp2_encoder import jp2_encoder
+from avi_py.avi_kdu_stream import kdu_compress_path
+
+from . import fixtures
+
+def _run_variant(src_path: Path, out_path: Path, encoder_name: str, threads: int) -> dict:
+    image_data = AviImageData(src_path)
+    start = time.perf_counter()
+    jp2_encoder(encoder_name, num_threads=threads).encode(image_data, str(src_path), image_data.image_header, out_path)
+    seconds = time.perf_counter() - start
+    header = image_data.image_header
+    return {
+        'seconds': round(seconds, 3),
+        'megapixels_per_second': round(header.width * header.height / 1_000_000 / seconds, 2),
+        'output_bytes': out_path.stat().st_size,
+        'compression_ratio': round(image_data.pixel_bytes / out_path.stat().st_size, 2),
+    }
+
+def run(megapixels: float, modes: List[str], thread_counts: List[int]) -> dict:
+    encoder_names = [name for name in avi_const.JP2_ENCODERS
+                     if name != 'kakadu' or os.access(kdu_compress_path(), os.X_OK)]
+    results = { 'encoders': encoder_names }
+    spawn_context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='avi_bench_jp2_encoders') as work_dir:
+        for mode in modes:
+            src_path = fixtures.make_tiff(Path(work_dir), megapixels, mode)
+            for encoder_name in encoder_names:
+                for threads in thread_counts:
+                    variant = f'{mode}_{encoder_name}_{threads}_threads'
+                    out_path = Path(work_dir) / f'{variant}.jp2'
+                    with spawn_context.Pool(1) as pool:
+                        results[variant] = pool.apply(_run_variant, (src_path, out_path, encoder_name, threads))
+                    out_path.unlink()
+            src_path.unlink()
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_jp2_encoders', description='Throughput and output size of the kakadu and openjpeg jp2 encoders')
+    parser.add_argument('--megapixels', type=float, default=50)
+    parser.add_argument('--modes', nargs='+', choices=fixtures.TIFF_MODES, default=['RGB', 'L'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count()])
+    args = parser.parse_args()
+    print(json.dumps(run(args.megapixels, args.modes, args.threads), indent=2))
+
+if __name__ == '__main__':
+    main()
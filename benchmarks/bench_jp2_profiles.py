@@ -0,0 +1,167 @@
+"""
+Output size, encode time and IIIF style decode latency of the jp2s each encoding profile in JP2_PROFILES writes.
+
+    python -m benchmarks.bench_jp2_profiles --megapixels 50 --count 3 --encoders openjpeg kakadu --repeat 5
+    python -m benchmarks.bench_jp2_profiles --sources /scratch/samples/*.tif --profiles archival iiif-fast-read
+
+Every source is converted with AviJp2Processor once per profile and encoder, each in its own freshly spawned process.
+Each jp2 is then read the way an image server answers requests: a thumbnail of the whole image from the smallest
+resolution level, and a 512 pixel square from the middle of the image at every resolution level, as a /full/ tile
+request at that scale. Latencies are the median over repeat reads and sources, in milliseconds.
+
+Decoders are pillow, which can only skip resolution levels and decodes every tile of a level, and kdu_expand at
+KAKADU_HOME and opj_decompress on the PATH when installed, which also skip the tiles and precincts outside the region.
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+from avi_py import constants as avi_const
+from avi_py.avi_jp2_processor import AviJp2Processor
+from avi_py.avi_jp2_verifier import AviJp2Structure
+from avi_py.avi_kdu_stream import kdu_compress_path
+
+from . import fixtures
+
+Image.MAX_IMAGE_PIXELS = None
+
+# side of the tiles an image server is asked for
+REQUEST_TILE_SIDE = 512
+THUMBNAIL_SIDE = 200
+
+def _encode(src_path: Path, dest_path: Path, encoder: str, profile: str) -> dict:
+    start = time.perf_counter()
+    jp2_processor = AviJp2Processor.process_jp2(src_path, dest_path, encoder=encoder, profile=profile, incremental=False)
+    return {
+        'success': jp2_processor.success,
+        'message': jp2_processor.result_message,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+def _requests(structure: AviJp2Structure) -> List[Tuple[str, int, Tuple[int, int, int, int]]]:
+    """
+    (name, resolution levels to discard, full resolution region as left, top, right, bottom) of the requests made of a jp2
+    """
+    width, height = structure.width, structure.height
+    thumbnail_reduce = structure.levels
+    while thumbnail_reduce > 0 and max(width, height) >> (thumbnail_reduce - 1) <= THUMBNAIL_SIDE:
+        thumbnail_reduce -= 1
+    requests = [('thumbnail', thumbnail_reduce, (0, 0, width, height))]
+    for reduce in range(structure.levels + 1):
+        side = REQUEST_TILE_SIDE << reduce
+        left, top = max((width - side) // 2, 0), max((height - side) // 2, 0)
+        requests.append((f'tile_level_{reduce}', reduce, (left, top, min(left + side, width), min(top + side, height))))
+    return requests
+
+def _pillow_decode(jp2_path: Path, _: Tuple[int, int], reduce: int, region: Tuple[int, int, int, int], __: Path) -> None:
+    with Image.open(jp2_path) as jp2:
+        jp2.reduce = reduce
+        jp2.load()
+        jp2.crop(tuple(side >> reduce for side in region))
+
+def _kdu_expand_decode(jp2_path: Path, size: Tuple[int, int], reduce: int, region: Tuple[int, int, int, int],
+                       out_path: Path) -> None:
+    # kdu_expand takes the region as {top,left},{height,width} fractions of the image
+    (width, height), (left, top, right, bottom) = size, region
+    kdu_region = '{' + f'{top / height},{left / width}' + '},{' + f'{(bottom - top) / height},{(right - left) / width}' + '}'
+    subprocess.run([_kdu_expand_path(), '-i', str(jp2_path), '-o', str(out_path), '-reduce', str(reduce), '-region', kdu_region],
+                   check=True, capture_output=True)
+
+def _opj_decompress_decode(jp2_path: Path, _: Tuple[int, int], reduce: int, region: Tuple[int, int, int, int],
+                           out_path: Path) -> None:
+    subprocess.run([shutil.which('opj_decompress'), '-i', str(jp2_path), '-o', str(out_path), '-r', str(reduce),
+                    '-d', ','.join(str(side) for side in region)], check=True, capture_output=True)
+
+def _kdu_expand_path() -> str:
+    return os.path.join(os.path.dirname(kdu_compress_path()), 'kdu_expand')
+
+def _decoders() -> dict:
+    decoders = { 'pillow': _pillow_decode }
+    if os.access(_kdu_expand_path(), os.X_OK):
+        decoders['kdu_expand'] = _kdu_expand_decode
+    if shutil.which('opj_decompress') is not None:
+        decoders['opj_decompress'] = _opj_decompress_decode
+    return decoders
+
+def _decode_latencies(jp2_path: Path, repeat: int, work_dir: Path) -> dict:
+    """
+    {decoder: {request: [milliseconds, ...]}} for every request of jp2_path
+    """
+    latencies = {}
+    structure = AviJp2Structure.read(jp2_path)
+    for decoder_name, decode in _decoders().items():
+        for request_name, reduce, region in _requests(structure):
+            out_path = work_dir / f'decoded_{decoder_name}.{"pgm" if structure.components == 1 else "ppm"}'
+            for _ in range(repeat):
+                start = time.perf_counter()
+                decode(jp2_path, (structure.width, structure.height), reduce, region, out_path)
+                latencies.setdefault(decoder_name, {}).setdefault(request_name, []).append((time.perf_counter() - start) * 1000)
+            out_path.unlink(missing_ok=True)
+    return latencies
+
+def _sources(work_dir: Path, source_paths: Optional[List[str]], megapixels: float, count: int) -> List[Path]:
+    if source_paths:
+        return [Path(source_path) for source_path in source_paths]
+    sources = []
+    for index in range(count):
+        mode = fixtures.TIFF_MODES[index % len(fixtures.TIFF_MODES)]
+        sample_dir = work_dir / f'sample_{index}'
+        sample_dir.mkdir()
+        sources.append(fixtures.make_tiff(sample_dir, megapixels, mode))
+    return sources
+
+def run(source_paths: Optional[List[str]], megapixels: float, count: int, profiles: List[str], encoders: List[str],
+        repeat: int) -> dict:
+    encoders = [encoder for encoder in encoders if encoder != 'kakadu' or os.access(kdu_compress_path(), os.X_OK)]
+    results = { 'encoders': encoders, 'decoders': list(_decoders()) }
+    spawn_context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='avi_bench_jp2_profiles') as work_dir:
+        sources = _sources(Path(work_dir), source_paths, megapixels, count)
+        for profile in profiles:
+            for encoder in encoders:
+                encode_seconds, bytes_per_pixel, latencies = [], [], {}
+                for index, src_path in enumerate(sources):
+                    jp2_path = Path(work_dir) / f'{profile}_{encoder}_{index}.jp2'
+                    with spawn_context.Pool(1) as pool:
+                        encoded = pool.apply(_encode, (src_path, jp2_path, encoder, profile))
+                    if not encoded['success']:
+                        raise RuntimeError(f'{profile} {encoder} {src_path}: {encoded["message"]}')
+                    encode_seconds.append(encoded['seconds'])
+                    with Image.open(src_path) as src:
+                        bytes_per_pixel.append(jp2_path.stat().st_size / (src.width * src.height))
+                    for decoder_name, requests in _decode_latencies(jp2_path, repeat, Path(work_dir)).items():
+                        for request_name, milliseconds in requests.items():
+                            latencies.setdefault(decoder_name, {}).setdefault(request_name, []).extend(milliseconds)
+                    jp2_path.unlink()
+                results[f'{profile}_{encoder}'] = {
+                    'encode_seconds': round(statistics.median(encode_seconds), 3),
+                    'bytes_per_pixel': round(statistics.median(bytes_per_pixel), 4),
+                    'decode_ms': { decoder_name: { request_name: round(statistics.median(milliseconds), 2)
+                                                   for request_name, milliseconds in requests.items() }
+                                   for decoder_name, requests in latencies.items() },
+                }
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_jp2_profiles', description='Size and IIIF region decode latency of each jp2 encoding profile')
+    parser.add_argument('--sources', nargs='+', help='Sample tiffs to encode. Synthetic tiffs are generated if not given')
+    parser.add_argument('--megapixels', type=float, default=25)
+    parser.add_argument('--count', type=int, default=3)
+    parser.add_argument('--profiles', nargs='+', choices=list(avi_const.JP2_PROFILES), default=list(avi_const.JP2_PROFILES))
+    parser.add_argument('--encoders', nargs='+', choices=avi_const.JP2_ENCODERS, default=avi_const.JP2_ENCODERS)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sources, args.megapixels, args.count, args.profiles, args.encoders, args.repeat), indent=2))
+
+if __name__ == '__main__':
+    main()
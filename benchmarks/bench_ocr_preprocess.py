@@ -0,0 +1,90 @@
+"""
+Per page latency and peak RSS of the OCR pre-processing handed to tesseract, before and after AviTesseractImage
+stopped round tripping through temp files.
+
+    python -m benchmarks.bench_ocr_preprocess --megapixels 8.4 --pages 5
+
+Each variant runs in its own freshly spawned process. Peak RSS is the process' VmHWM after resetting it through
+/proc/self/clear_refs once imports are done, reported as growth over the RSS at that point. Tesseract itself is not run, the timed work ends
+once the image is ready to hand over (a temp file for the legacy path, encoded bytes for stdin now).
+"""
+import os
+import json
+import time
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cv2
+from PIL import Image
+
+from avi_py.avi_tesseract_image import AviTesseractImage
+
+from . import fixtures
+
+def _legacy_preprocess(image_src_path: Path) -> None:
+    """
+    The AviTesseractImage.preprocess_image and pytesseract hand off before the in memory pipeline. Kept here as the baseline
+    """
+    with tempfile.TemporaryDirectory(prefix='avi_tess_image', dir='/tmp') as temp_dir:
+        temp_file_name = str(Path(temp_dir) / 'preprocessed.tif')
+        with Image.open(image_src_path) as img:
+            img.convert('L')
+            img.save(temp_file_name)
+        preprocessed_image = cv2.imread(temp_file_name, cv2.IMREAD_GRAYSCALE)
+        preprocessed_image = cv2.threshold(preprocessed_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        # pytesseract.image_to_alto_xml saved the PIL image to its own temp png before running tesseract
+        with tempfile.NamedTemporaryFile(prefix='tess_', suffix='.png') as tess_input:
+            Image.fromarray(preprocessed_image, mode='L').save(tess_input.name, format='PNG')
+
+def _in_memory_preprocess(image_src_path: Path) -> None:
+    AviTesseractImage(image_src_path).preprocessed_bytes()
+
+VARIANTS = {'before': _legacy_preprocess, 'after': _in_memory_preprocess}
+
+def _proc_status_bytes(field: str) -> int:
+    with open('/proc/self/status', 'r', encoding='utf-8') as proc_status:
+        for line in proc_status:
+            if line.startswith(f'{field}:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def _reset_peak_rss() -> None:
+    with open('/proc/self/clear_refs', 'w', encoding='utf-8') as clear_refs:
+        clear_refs.write('5')
+
+def _run_variant(variant: str, page_paths: list) -> dict:
+    _reset_peak_rss()
+    baseline_rss = _proc_status_bytes('VmRSS')
+    latencies = []
+    for page_path in page_paths:
+        start = time.perf_counter()
+        VARIANTS[variant](page_path)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'mean_page_seconds': round(sum(latencies) / len(latencies), 4),
+        'min_page_seconds': round(min(latencies), 4),
+        'peak_rss_growth_bytes': _proc_status_bytes('VmHWM') - baseline_rss,
+    }
+
+def run(megapixels: float, pages: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='avi_bench_ocr') as work_dir:
+        page_paths = fixtures.make_text_pages(Path(work_dir), megapixels, pages)
+        spawn_context = multiprocessing.get_context('spawn')
+        for variant in VARIANTS:
+            with spawn_context.Pool(1) as pool:
+                results[variant] = pool.apply(_run_variant, (variant, page_paths))
+        results['source_bytes'] = os.path.getsize(page_paths[0])
+    return results
+
+def main() -> None:
+    parser = ArgumentParser(prog='bench_ocr_preprocess', description='Per page OCR pre-processing latency and peak RSS before and after')
+    parser.add_argument('--megapixels', type=float, default=8.4)
+    parser.add_argument('--pages', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.megapixels, args.pages), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+End to end benchmark of AviJp2Processor, AviFFMpegProcessor and AviTesseractProcessor on synthetic inputs.
+
+    python -m benchmarks.bench_suite --output baseline.json
+    python -m benchmarks.bench_suite --suite full --work_dir /scratch/avi_bench --output baseline.json
+    python -m benchmarks.bench_suite --compare baseline.json --threshold 0.1
+
+Every run of a case happens in its own fresh python process. Wall time, cpu time (the process and every child it
+waited for, so kakadu, ffmpeg and tesseract are included) and peak RSS (that process' own rusage from wait4, the
+larger of it and its biggest child) are recorded, along with the stage timings the processor reports in its result. With --repeat the median wall and cpu times and the largest peak RSS are kept.
+--compare exits with 1 if any case got slower or bigger than the baseline by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import statistics
+import tempfile
+import resource
+import subprocess
+from argparse import ArgumentParser, Namespace, SUPPRESS
+from pathlib import Path
+from typing import Callable, List
+
+from avi_py import constants as avi_const
+from avi_py.avi_derivative_sidecar import tool_version
+from avi_py.avi_jp2_processor import AviJp2Processor
+from avi_py.avi_ffmpeg_processor import AviFFMpegProcessor
+from avi_py.avi_tesseract_processor import AviTesseractProcessor
+
+from . import fixtures
+
+SUITES = {
+    'quick': {'megapixels': [10], 'wav_seconds': [30], 'video_seconds': [10], 'ocr_pages': 2},
+    'full': {'megapixels': [10, 50, 100, 250, 500], 'wav_seconds': [60, 600, 3600], 'video_seconds': [10, 60, 600], 'ocr_pages': 10},
+}
+METRICS = ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes']
+
+def _children_cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+def _run_jp2(case: dict) -> dict:
+    return AviJp2Processor.process_jp2(case['src'], case['dest'], incremental=False).result
+
+def _run_ffmpeg(case: dict) -> dict:
+    ffmpeg_processor = AviFFMpegProcessor(case['src'], case['dest'], is_video=case['is_video'], incremental=False)
+    if case['operation'] == 'thumbnail':
+        ffmpeg_processor.generate_thumbnail()
+    elif case['operation'] == 'contact_sheet':
+        ffmpeg_processor.generate_contact_sheet()
+    elif case['operation'] == 'mp3':
+        ffmpeg_processor.generate_mp3()
+    else:
+        ffmpeg_processor.generate_derivatives(case['derivative_paths'])
+    return ffmpeg_processor.result
+
+def _run_ocr(case: dict) -> dict:
+    results = [AviTesseractProcessor.process_batch_ocr(page, replace_if_exists=True, incremental=False).result for page in case['pages']]
+    timings = {}
+    for result in results:
+        for stage, seconds in result.get('timings', {}).items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    failed = [result for result in results if not result['success']]
+    return {**(failed[0] if failed else {'success': True, 'message': f'OCRed {len(results)} pages'}), 'timings': timings}
+
+def _stages(result: dict, wall_seconds: float) -> dict:
+    """
+    The stage timings the processor reported, plus whatever the timings don't cover as other
+    """
+    stages = {stage: round(seconds, 4) for stage, seconds in result.get('timings', {}).items() if stage != 'total'}
+    stages['other'] = round(max(wall_seconds - sum(stages.values()), 0.0), 4)
+    return stages
+
+RUNNERS = {'jp2': _run_jp2, 'ffmpeg': _run_ffmpeg, 'ocr': _run_ocr}
+
+def _measure_case(case: dict) -> dict:
+    cpu_start, children_cpu_start = time.process_time(), _children_cpu_seconds()
+    start = time.perf_counter()
+    try:
+        result = RUNNERS[case['processor']](case)
+    except Exception as ex: #pylint: disable=broad-except
+        result = {'success': False, 'message': f'{ex.__class__.__name__} {ex}'}
+    wall_seconds = time.perf_counter() - start
+    cpu_seconds = (time.process_time() - cpu_start) + (_children_cpu_seconds() - children_cpu_start)
+    measurement = {
+        'success': result.get('success', False),
+        'wall_seconds': round(wall_seconds, 4),
+        'cpu_seconds': round(cpu_seconds, 4),
+        'stages': _stages(result, wall_seconds),
+    }
+    if not measurement['success']:
+        measurement['message'] = result.get('message', '')
+    return measurement
+
+def _summarize(runs: List[dict], input_bytes: int) -> dict:
+    summary = {
+        'success': all(run['success'] for run in runs),
+        'runs': len(runs),
+        'input_bytes': input_bytes,
+        'wall_seconds': round(statistics.median(run['wall_seconds'] for run in runs), 4),
+        'cpu_seconds': round(statistics.median(run['cpu_seconds'] for run in runs), 4),
+        'peak_rss_bytes': max(run['peak_rss_bytes'] for run in runs),
+        'stages': {stage: round(statistics.median(run['stages'].get(stage, 0.0) for run in runs), 4)
+                   for stage in runs[0]['stages']},
+    }
+    messages = [run['message'] for run in runs if 'message' in run]
+    if messages:
+        summary['message'] = messages[0]
+    return summary
+
+def _jp2_cases(work_dir: Path, out_dir: Path, megapixels: List[float], modes: List[str]) -> List[dict]:
+    cases = []
+    for size in megapixels:
+        for mode in modes:
+            for icc_profile in ([True, False] if mode != 'L' else [False]):
+                src = fixtures.make_tiff(work_dir, size, mode, icc_profile)
+                cases.append({'name': f'jp2/{src.stem}', 'processor': 'jp2', 'src': str(src), 'dest': str(out_dir / f'{src.stem}.jp2')})
+    return cases
+
+def _ffmpeg_cases(work_dir: Path, out_dir: Path, wav_seconds: List[float], video_seconds: List[float]) -> List[dict]:
+    cases = []
+    for seconds in video_seconds:
+        src = fixtures.make_video(work_dir, seconds)
+        for operation in ['thumbnail', 'contact_sheet']:
+            cases.append({'name': f'ffmpeg/{operation}_{src.stem}', 'processor': 'ffmpeg', 'operation': operation, 'is_video': True,
+                          'src': str(src), 'dest': str(out_dir / f'{src.stem}_{operation}.jpg')})
+        cases.append({'name': f'ffmpeg/derivatives_{src.stem}', 'processor': 'ffmpeg', 'operation': 'derivatives', 'is_video': True,
+                      'src': str(src), 'dest': '', 'derivative_paths': {'thumbnail': str(out_dir / f'{src.stem}_thumb.jpg'),
+                                                                       'mp3': str(out_dir / f'{src.stem}.mp3'),
+                                                                       'waveform': str(out_dir / f'{src.stem}_waveform.png')}})
+    for seconds in wav_seconds:
+        src = fixtures.make_wav(work_dir, seconds)
+        cases.append({'name': f'ffmpeg/mp3_{src.stem}', 'processor': 'ffmpeg', 'operation': 'mp3', 'is_video': False,
+                      'src': str(src), 'dest': str(out_dir / f'{src.stem}.mp3')})
+        cases.append({'name': f'ffmpeg/derivatives_{src.stem}', 'processor': 'ffmpeg', 'operation': 'derivatives', 'is_video': False,
+                      'src': str(src), 'dest': '', 'derivative_paths': {'mp3': str(out_dir / f'{src.stem}_all.mp3'),
+                                                                       'waveform': str(out_dir / f'{src.stem}_waveform.png')}})
+    return cases
+
+def _ocr_cases(work_dir: Path, ocr_megapixels: float, ocr_pages: int) -> List[dict]:
+    pages = fixtures.make_text_pages(work_dir, ocr_megapixels, ocr_pages)
+    return [{'name': f'ocr/{ocr_pages}_pages_{ocr_megapixels:g}mp', 'processor': 'ocr', 'pages': [str(page) for page in pages]}]
+
+def build_cases(work_dir: Path, args: Namespace) -> List[dict]:
+    """
+    Generates any fixture not already in work_dir and returns the cases to run
+    """
+    out_dir = work_dir / 'out'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cases = []
+    if 'jp2' in args.processors:
+        cases += _jp2_cases(work_dir, out_dir, args.megapixels, args.modes)
+    if 'ffmpeg' in args.processors:
+        cases += _ffmpeg_cases(work_dir, out_dir, args.wav_seconds, args.video_seconds)
+    if 'ocr' in args.processors:
+        cases += _ocr_cases(work_dir, args.ocr_megapixels, args.ocr_pages)
+    return cases
+
+def _input_bytes(case: dict) -> int:
+    return sum(os.path.getsize(src) for src in case.get('pages', [case.get('src')]))
+
+def _measure_case_process(case: dict) -> dict:
+    """
+    Measures case in a fresh python process. getrusage(RUSAGE_CHILDREN) only ever grows in this process, so the peak
+    RSS is read from wait4, which reports the case process (and the children it waited for) alone
+    """
+    with tempfile.NamedTemporaryFile(prefix='avi_bench_case', suffix='.json') as measurement_file:
+        args = [sys.executable, '-m', 'benchmarks.bench_suite', '--measure_case', json.dumps(case), measurement_file.name]
+        case_process = subprocess.Popen(args, cwd=str(avi_const.PROJECT_ROOT)) #pylint: disable=consider-using-with
+        _, wait_status, usage = os.wait4(case_process.pid, 0)
+        case_process.returncode = os.waitstatus_to_exitcode(wait_status)
+        if case_process.returncode != 0:
+            return {'success': False, 'message': f'case process exited with {case_process.returncode}',
+                    'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_bytes': usage.ru_maxrss * 1024, 'stages': {}}
+        measurement = json.loads(Path(measurement_file.name).read_text(encoding='utf-8'))
+    measurement['peak_rss_bytes'] = usage.ru_maxrss * 1024
+    return measurement
+
+def run_cases(cases: List[dict], repeat: int=1, progress: Callable[[str], None]=None) -> dict:
+    results = {}
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            runs.append(_measure_case_process(case))
+        results[case['name']] = _summarize(runs, _input_bytes(case))
+        if progress is not None:
+            progress(f"{case['name']}: {results[case['name']]['wall_seconds']}s")
+    return results
+
+def environment() -> dict:
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'tools': {
+            'kdu_compress': tool_version(os.path.join(avi_const.KAKADU_BASE_PATH, 'kdu_compress'), '-v'),
+            'ffmpeg': tool_version('ffmpeg', '-version'),
+            'tesseract': tool_version('tesseract', '--version'),
+        },
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Returns a line for every metric of every case that is worse than the baseline by more than threshold (0.1 = 10%)
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('cases', {}).get(name)
+        if previous is None or not previous.get('success') or not current['success']:
+            continue
+        for metric in METRICS:
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                change = (current[metric] - previous[metric]) / previous[metric]
+                regressions.append(f'{name} {metric}: {previous[metric]} -> {current[metric]} (+{change:.0%})')
+    return regressions
+
+def _parse_args() -> Namespace:
+    parser = ArgumentParser(prog='bench_suite', description='Wall time, cpu time and peak RSS of every processor on synthetic inputs')
+    parser.add_argument('--suite', type=str, choices=sorted(SUITES), default='quick', help='Default fixture sizes')
+    parser.add_argument('--processors', type=str, nargs='+', choices=sorted(RUNNERS), default=sorted(RUNNERS))
+    parser.add_argument('--megapixels', type=float, nargs='+', help='Tiff sizes for the jp2 cases')
+    parser.add_argument('--modes', type=str, nargs='+', choices=fixtures.TIFF_MODES, default=fixtures.TIFF_MODES)
+    parser.add_argument('--wav_seconds', type=float, nargs='+', help='Wav lengths for the mp3 and waveform cases')
+    parser.add_argument('--video_seconds', type=float, nargs='+', help='Video lengths for the thumbnail and contact sheet cases')
+    parser.add_argument('--ocr_pages', type=int, help='Pages in the OCR case')
+    parser.add_argument('--ocr_megapixels', type=float, default=8.4)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--work_dir', type=str, help='Directory fixtures are generated in and reused from. Defaults to a temp dir')
+    parser.add_argument('--output', type=str, help='Write the results json here')
+    parser.add_argument('--compare', type=str, help='Baseline results json to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slow down before a metric counts as a regression')
+    # internal, runs one case json and writes its measurement json to the path, see _measure_case_process
+    parser.add_argument('--measure_case', type=str, nargs=2, help=SUPPRESS)
+    args = parser.parse_args()
+    for option, default in SUITES[args.suite].items():
+        if getattr(args, option) is None:
+            setattr(args, option, default)
+    return args
+
+def main() -> None:
+    args = _parse_args()
+    if args.measure_case:
+        case_json, measurement_path = args.measure_case
+        Path(measurement_path).write_text(json.dumps(_measure_case(json.loads(case_json))), encoding='utf-8')
+        return
+    # probing is part of the work being measured, don't let results cached by a previous run hide it
+    os.environ['AVI_FFPROBE_CACHE'] = 'false'
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='avi_bench_suite'))
+    try:
+        results = {'environment': environment(), 'cases': run_cases(build_cases(work_dir, args), args.repeat,
+                                                                     lambda line: print(line, file=sys.stderr))}
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare(results['cases'], json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
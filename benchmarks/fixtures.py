@@ -0,0 +1,111 @@
+"""
+Synthetic inputs for the benchmarks, generated locally so nothing has to be checked in or downloaded.
+Tiffs are a noise/gradient texture so kakadu has realistic work to do, audio and video come from ffmpeg's lavfi sources
+and OCR pages are lines of rendered text on an off white background.
+"""
+from pathlib import Path
+from typing import List, Tuple
+
+import ffmpeg
+from PIL import Image, ImageDraw
+
+from avi_py import constants as avi_const
+
+TIFF_MODES = ['RGB', 'RGBA', 'L']
+# Side of the texture tile repeated across large tiffs. Generating noise for every pixel of a 500 MP image takes minutes
+_TEXTURE_SIDE = 1024
+
+def _texture(mode: str) -> Image.Image:
+    noise = Image.effect_noise((_TEXTURE_SIDE, _TEXTURE_SIDE), 48)
+    gradient = Image.linear_gradient('L').resize((_TEXTURE_SIDE, _TEXTURE_SIDE))
+    luma = Image.blend(noise, gradient, 0.5)
+    if mode == 'L':
+        return luma
+    bands = [luma, gradient.rotate(90), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)]
+    if mode == 'RGBA':
+        bands.append(Image.new('L', luma.size, 255))
+    return Image.merge(mode, bands)
+
+def tiff_size(megapixels: float) -> Tuple[int, int]:
+    """
+    4:3 pixel dimensions for a megapixels sized image
+    """
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    return width, int(width * 3 / 4)
+
+def make_tiff(work_dir: Path, megapixels: float, mode: str='RGB', icc_profile: bool=True) -> Path:
+    """
+    Writes an uncompressed tiff of about megapixels, with the target sRGB profile embedded when icc_profile is set.
+    The profile is rgb only so grayscale tiffs are always written without one.
+    Pillow holds the whole image in memory while saving, so a 500 MP RGB tiff needs about 1.5GB
+    """
+    if mode == 'L':
+        icc_profile = False
+    icc_name = 'icc' if icc_profile else 'no_icc'
+    tiff_path = work_dir / f'{mode.lower()}_{megapixels:g}mp_{icc_name}.tif'
+    if tiff_path.exists():
+        return tiff_path
+    size = tiff_size(megapixels)
+    texture = _texture(mode)
+    img = Image.new(mode, size)
+    for left in range(0, size[0], _TEXTURE_SIDE):
+        for top in range(0, size[1], _TEXTURE_SIDE):
+            img.paste(texture, (left, top))
+    if icc_profile:
+        with open(avi_const.ICC_PROFILE_PATH, 'rb') as icc_file:
+            img.save(tiff_path, icc_profile=icc_file.read())
+    else:
+        img.save(tiff_path)
+    return tiff_path
+
+def make_wav(work_dir: Path, seconds: float) -> Path:
+    """
+    Stereo 44.1kHz 16 bit wav of a sine tone with some pink noise mixed in
+    """
+    wav_path = work_dir / f'audio_{seconds:g}s.wav'
+    if wav_path.exists():
+        return wav_path
+    tone = ffmpeg.input(f'sine=frequency=440:sample_rate=44100:duration={seconds}', f='lavfi')
+    noise = ffmpeg.input(f'anoisesrc=color=pink:sample_rate=44100:amplitude=0.1:duration={seconds}', f='lavfi')
+    ffmpeg \
+        .filter([tone, noise], 'amix', inputs=2) \
+        .output(str(wav_path), ac=2, acodec='pcm_s16le') \
+        .overwrite_output() \
+        .run(capture_stdout=True, capture_stderr=True)
+    return wav_path
+
+def make_video(work_dir: Path, seconds: float, size: str='1280x720', ext: str='.mp4') -> Path:
+    """
+    h264/aac video from the testsrc2 pattern with a sine audio track, one keyframe every two seconds
+    """
+    video_path = work_dir / f'video_{seconds:g}s_{size}{ext}'
+    if video_path.exists():
+        return video_path
+    video = ffmpeg.input(f'testsrc2=size={size}:rate=30:duration={seconds}', f='lavfi')
+    audio = ffmpeg.input(f'sine=frequency=440:sample_rate=44100:duration={seconds}', f='lavfi')
+    ffmpeg \
+        .output(video, audio, str(video_path), vcodec='libx264', pix_fmt='yuv420p', g=60, acodec='aac', shortest=None) \
+        .overwrite_output() \
+        .run(capture_stdout=True, capture_stderr=True)
+    return video_path
+
+def make_text_pages(work_dir: Path, megapixels: float, pages: int) -> List[Path]:
+    """
+    Letter proportioned pages of rendered text
+    """
+    width = int((megapixels * 1_000_000 / 1.294) ** 0.5)
+    height = int(width * 1.294)
+    page_paths = []
+    for page in range(pages):
+        page_path = work_dir / f'page_{megapixels:g}mp_{page}.tif'
+        page_paths.append(page_path)
+        if page_path.exists():
+            continue
+        img = Image.new('RGB', (width, height), (236, 230, 214))
+        draw = ImageDraw.Draw(img)
+        for line_y in range(100, height - 100, 40):
+            draw.text((100, line_y), f'page {page} line {line_y} the quick brown fox jumps over the lazy dog', fill=(30, 30, 30))
+        img.save(page_path)
+    return page_paths
+
+__all__ = ['TIFF_MODES', 'tiff_size', 'make_tiff', 'make_wav', 'make_video', 'make_text_pages']
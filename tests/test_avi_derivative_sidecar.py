@@ -0,0 +1,99 @@
+import os
+import logging
+import sys
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from avi_py.avi_derivative_sidecar import AviDerivativeSidecar, tool_version, file_digest
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+SETTINGS = {'type': 'thumbnail', 'size': (300, 300)}
+TOOLS = {'ffmpeg': 'ffmpeg version 6.0'}
+
+@pytest.fixture(name='derivative_files')
+def fixture_derivative_files():
+    with TemporaryDirectory(prefix='avi_test_sidecar', dir='/tmp') as temp_dir:
+        src_path = f'{temp_dir}/source.mov'
+        dest_path = f'{temp_dir}/source.jpg'
+        with open(src_path, 'wb') as src_file:
+            src_file.write(b'source' * 1024)
+        with open(dest_path, 'wb') as dest_file:
+            dest_file.write(b'derivative')
+        yield src_path, dest_path
+
+def _touch(file_path, offset_ns=10 ** 9):
+    file_stat = os.stat(file_path)
+    os.utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + offset_ns))
+
+class TestAviDerivativeSidecar:
+    """
+    Unit tests for the incremental generation sidecars
+    """
+    def test_sidecar_round_trip(self, derivative_files):
+        src_path, dest_path = derivative_files
+        sidecar = AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS)
+
+        assert sidecar.sidecar_path.name == '.source.jpg.avi.json'
+        assert sidecar.is_current() is False
+
+        sidecar.write({'columns': 5})
+        record = sidecar.read()
+        assert record['source']['sha256'] == file_digest(src_path)
+        assert record['settings'] == {'type': 'thumbnail', 'size': [300, 300]}
+        assert record['details'] == {'columns': 5}
+        assert AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS).is_current() is True
+
+    def test_sidecar_settings_and_tools_changes(self, derivative_files):
+        src_path, dest_path = derivative_files
+        AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS).write()
+
+        assert AviDerivativeSidecar(src_path, dest_path, {**SETTINGS, 'size': (200, 200)}, TOOLS).is_current() is False
+        assert AviDerivativeSidecar(src_path, dest_path, SETTINGS, {'ffmpeg': 'ffmpeg version 7.0'}).is_current() is False
+
+    def test_sidecar_source_changes(self, derivative_files):
+        src_path, dest_path = derivative_files
+        sidecar = AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS)
+        sidecar.write()
+
+        # touched but identical content is still current and the record picks up the new mtime
+        _touch(src_path)
+        assert sidecar.is_current() is True
+        assert sidecar.read()['source']['mtime_ns'] == os.stat(src_path).st_mtime_ns
+
+        with open(src_path, 'r+b') as src_file:
+            src_file.write(b'edited')
+        assert sidecar.is_current() is False
+
+        sidecar.write()
+        _touch(src_path)
+        assert AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS, hash_source=False).is_current() is False
+
+    def test_sidecar_derivative_changes(self, derivative_files):
+        src_path, dest_path = derivative_files
+        sidecar = AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS)
+        sidecar.write()
+
+        with open(dest_path, 'ab') as dest_file:
+            dest_file.write(b'replaced')
+        assert sidecar.is_current() is False
+
+        sidecar.write()
+        os.unlink(dest_path)
+        assert sidecar.is_current() is False
+
+        sidecar.remove()
+        assert not sidecar.sidecar_path.exists()
+
+    def test_sidecar_unreadable_record(self, derivative_files):
+        src_path, dest_path = derivative_files
+        sidecar = AviDerivativeSidecar(src_path, dest_path, SETTINGS, TOOLS)
+        sidecar.sidecar_path.write_text('{not json', encoding='utf-8')
+
+        assert sidecar.read() is None
+        assert sidecar.is_current() is False
+
+    def test_tool_version(self):
+        assert tool_version('/tmp/avi_py_missing_tool', '-version') == 'unknown'
+        assert 'python' in tool_version(sys.executable, '--version').lower()
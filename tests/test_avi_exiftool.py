@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import logging
+import textwrap
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image
+
+from avi_py.avi_exiftool import AviExiftool, AviExiftoolError, shared_exiftool
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+# Speaks the -stay_open protocol without needing perl and exiftool. A file argument that doesn't exist is reported
+# as an error like exiftool does and a file named crash makes it exit mid command
+FAKE_EXIFTOOL = textwrap.dedent('''\
+    #!{python}
+    import os, sys
+    args = []
+    for line in sys.stdin:
+        line = line.rstrip('\\n')
+        if args == ['-stay_open'] and line == 'False':
+            sys.exit(0)
+        if not line.startswith('-execute'):
+            args.append(line)
+            continue
+        files = [arg for arg in args if arg.startswith('/')]
+        if any(os.path.basename(arg) == 'crash' for arg in files):
+            sys.exit(3)
+        missing = [arg for arg in files if not os.path.exists(arg)]
+        for arg in missing:
+            print(f'Error: File not found - {{arg}}')
+        print(f'    {{len(files) - len(missing)}} image files updated')
+        print('{{ready' + line[len('-execute'):] + '}}', flush=True)
+        args = []
+    ''')
+
+@pytest.fixture(name='exiftool_dir')
+def fixture_exiftool_dir():
+    with TemporaryDirectory(prefix='avi_test_exiftool', dir='/tmp') as temp_dir:
+        exiftool_path = f'{temp_dir}/exiftool'
+        with open(exiftool_path, 'w', encoding='utf-8') as exiftool_file:
+            exiftool_file.write(FAKE_EXIFTOOL.format(python=sys.executable))
+        os.chmod(exiftool_path, 0o755)
+        with open(f'{temp_dir}/image.tif', 'wb') as image_file:
+            image_file.write(b'tif')
+        yield temp_dir
+
+class TestAviExiftool:
+    """
+    Unit tests for the persistent exiftool process
+    """
+    def test_execute(self, exiftool_dir):
+        exiftool = AviExiftool(f'{exiftool_dir}/exiftool')
+        try:
+            assert exiftool.running is False
+            assert '1 image files updated' in exiftool.execute('-overwrite_original', f'{exiftool_dir}/image.tif')
+            pid = exiftool.pid
+            assert '1 image files updated' in exiftool.execute('-q', f'{exiftool_dir}/image.tif')
+            assert exiftool.pid == pid
+            assert exiftool.running is True
+        finally:
+            exiftool.close()
+        assert exiftool.running is False
+
+    def test_execute_error(self, exiftool_dir):
+        exiftool = AviExiftool(f'{exiftool_dir}/exiftool')
+        try:
+            with pytest.raises(AviExiftoolError, match='Error: File not found'):
+                exiftool.execute(f'{exiftool_dir}/missing.tif')
+            # exiftool reported the error but is still usable
+            assert exiftool.running is True
+            exiftool.execute(f'{exiftool_dir}/image.tif')
+        finally:
+            exiftool.close()
+
+    def test_restart_after_exit(self, exiftool_dir):
+        exiftool = AviExiftool(f'{exiftool_dir}/exiftool', timeout=10)
+        try:
+            with pytest.raises(AviExiftoolError, match='exited with 3'):
+                exiftool.execute(f'{exiftool_dir}/crash')
+            assert exiftool.running is False
+            assert '1 image files updated' in exiftool.execute(f'{exiftool_dir}/image.tif')
+        finally:
+            exiftool.close()
+
+    def test_shared_exiftool(self, exiftool_dir):
+        exiftool = shared_exiftool(f'{exiftool_dir}/exiftool')
+        try:
+            assert shared_exiftool(f'{exiftool_dir}/exiftool') is exiftool
+            assert shared_exiftool('exiftool') is not exiftool
+        finally:
+            exiftool.close()
+
+    @pytest.mark.skipif(shutil.which('exiftool') is None, reason='exiftool is not installed')
+    def test_copy_metadata(self, exiftool_dir):
+        Image.new('RGB', (8, 8)).save(f'{exiftool_dir}/src.tif', description='avi_py test')
+        Image.new('RGB', (8, 8)).save(f'{exiftool_dir}/dest.tif')
+        exiftool = AviExiftool('exiftool')
+        try:
+            exiftool.execute('-tagsFromFile', f'{exiftool_dir}/src.tif', '-overwrite_original', f'{exiftool_dir}/dest.tif')
+            assert 'avi_py test' in exiftool.execute('-ImageDescription', f'{exiftool_dir}/dest.tif')
+            with pytest.raises(AviExiftoolError):
+                exiftool.execute('-tagsFromFile', f'{exiftool_dir}/missing.tif', '-overwrite_original', f'{exiftool_dir}/dest.tif')
+        finally:
+            exiftool.close()
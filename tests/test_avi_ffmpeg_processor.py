@@ -7,7 +7,7 @@ import pytest
 
 from avi_py.avi_video_data import AviVideoData
 from avi_py.avi_audio_data import AviAudioData
-from avi_py.avi_ffmpeg_processor import AviFFMpegProcessor
+from avi_py.avi_ffmpeg_processor import AviFFMpegProcessor, _derivative_outputs
 
 from . import file_fixtures
 
@@ -92,6 +92,62 @@ class TestAviFFMpegProcessor:
             assert mp4_jpg.format =='JPEG'
             assert mp4_jpg.width == 300
 
+    def test_mov_keyframe_thumbnail_generation(self, thumbnail_dest_file):
+        mov_ffmpeg_thumbnail = AviFFMpegProcessor.process_thumbnail(file_fixtures.MOV_VIDEO, thumbnail_dest_file, keyframe_seek=True)
+
+        assert mov_ffmpeg_thumbnail.success is True
+        assert set(mov_ffmpeg_thumbnail.result['timings']) == {'ffprobe', 'ffmpeg', 'pillow', 'total'}
+        assert mov_ffmpeg_thumbnail.result['output_bytes'] > 0
+        with file_fixtures.image_fixture(thumbnail_dest_file) as mov_jpg:
+            assert mov_jpg.format =='JPEG'
+            assert mov_jpg.width == 300
+
+    def test_mov_contact_sheet_generation(self, thumbnail_dest_file):
+        for keyframe_seek in [True, False]:
+            mov_contact_sheet = AviFFMpegProcessor.process_contact_sheet(file_fixtures.MOV_VIDEO, thumbnail_dest_file, grid=(3, 2),
+                                                                         tile_width=120, keyframe_seek=keyframe_seek)
+
+            assert mov_contact_sheet.success is True
+            layout = mov_contact_sheet.result['contact_sheet']
+            assert (layout['columns'], layout['rows'], layout['tile_width']) == (3, 2, 120)
+            assert layout['interval'] > 0
+            assert json.loads(mov_contact_sheet.json_result())['contact_sheet'] == layout
+
+            with file_fixtures.image_fixture(thumbnail_dest_file) as sheet_jpg:
+                assert sheet_jpg.format =='JPEG'
+                assert sheet_jpg.size == (3 * 120, 2 * layout['tile_height'])
+
+    def test_mov_incremental_generation(self, thumbnail_dest_file, mp3_destination_file):
+        first_run = AviFFMpegProcessor.process_thumbnail(file_fixtures.MOV_VIDEO, thumbnail_dest_file, incremental=True)
+        assert first_run.success is True
+        assert 'skipped' not in first_run.result
+
+        second_run = AviFFMpegProcessor.process_thumbnail(file_fixtures.MOV_VIDEO, thumbnail_dest_file, incremental=True)
+        assert second_run.success is True
+        assert second_run.result['skipped'] is True
+        assert second_run.result_message == f'ffmpeg derivative at {thumbnail_dest_file} is up to date. Skipped'
+
+        changed_settings = AviFFMpegProcessor.process_thumbnail(file_fixtures.MOV_VIDEO, thumbnail_dest_file, keyframe_seek=True, incremental=True)
+        assert 'skipped' not in changed_settings.result
+
+        sheet_path = thumbnail_dest_file.replace('.jpg', '-sheet.jpg')
+        first_sheet = AviFFMpegProcessor.process_contact_sheet(file_fixtures.MOV_VIDEO, sheet_path, grid=(2, 2), incremental=True)
+        second_sheet = AviFFMpegProcessor.process_contact_sheet(file_fixtures.MOV_VIDEO, sheet_path, grid=(2, 2), incremental=True)
+        assert second_sheet.result['skipped'] is True
+        assert second_sheet.result['contact_sheet'] == first_sheet.result['contact_sheet']
+
+        derivative_paths = {'thumbnail': thumbnail_dest_file, 'mp3': mp3_destination_file}
+        partial_run = AviFFMpegProcessor.process_derivatives(file_fixtures.MOV_VIDEO, derivative_paths, keyframe_seek=True, incremental=True)
+        assert partial_run.success is True
+        assert partial_run.derivative_paths == {'mp3': mp3_destination_file}
+
+    def test_wav_contact_sheet_generation(self, thumbnail_dest_file):
+        wav_contact_sheet = AviFFMpegProcessor(file_fixtures.WAV_AUDIO, thumbnail_dest_file, is_video=False)
+        wav_contact_sheet.generate_contact_sheet()
+
+        assert wav_contact_sheet.success is False
+        assert 'contact_sheet' not in wav_contact_sheet.result
+
     def test_wav_mp3_generation(self, mp3_destination_file):
         wav_ffmpeg_mp3 = AviFFMpegProcessor.process_mp3(file_fixtures.WAV_AUDIO, mp3_destination_file)
 
@@ -114,3 +170,46 @@ class TestAviFFMpegProcessor:
         assert wav_ffmpeg_mp3.result_message == wav_ffmpeg_mp3.result.get('message')
 
         assert wav_ffmpeg_mp3.json_result() == json.dumps(wav_ffmpeg_mp3.result)
+
+    def test_mov_single_pass_derivatives(self, thumbnail_dest_file, mp3_destination_file):
+        derivative_paths = {'thumbnail': thumbnail_dest_file, 'mp3': mp3_destination_file}
+        mov_derivatives = AviFFMpegProcessor.process_derivatives(file_fixtures.MOV_VIDEO, derivative_paths)
+
+        assert isinstance(mov_derivatives, AviFFMpegProcessor)
+        assert isinstance(mov_derivatives.video_data, AviVideoData)
+        assert mov_derivatives.derivative_paths == derivative_paths
+        assert mov_derivatives.success is True
+        assert mov_derivatives.result_message == f'Successfully created ffmpeg derivatives at {thumbnail_dest_file}, {mp3_destination_file}'
+
+        with file_fixtures.image_fixture(thumbnail_dest_file) as mov_jpg:
+            assert mov_jpg.format =='JPEG'
+            assert mov_jpg.width == 300
+
+        with open(mp3_destination_file, 'rb') as mp3_file:
+            assert len(mp3_file.read(16)) == 16
+
+    def test_wav_single_pass_derivatives(self, temp_folder, mp3_destination_file):
+        waveform_dest_file = f'{temp_folder}/test-waveform-out.png'
+        derivative_paths = {'mp3': mp3_destination_file, 'waveform': waveform_dest_file}
+        wav_derivatives = AviFFMpegProcessor.process_derivatives(file_fixtures.WAV_AUDIO, derivative_paths, is_video=False)
+
+        assert isinstance(wav_derivatives.audio_data, AviAudioData)
+        assert wav_derivatives.success is True
+
+        with file_fixtures.image_fixture(waveform_dest_file) as waveform_png:
+            assert waveform_png.format == 'PNG'
+
+        wav_thumbnail = AviFFMpegProcessor.process_derivatives(file_fixtures.WAV_AUDIO, {'thumbnail': f'{temp_folder}/wav.jpg'}, is_video=False)
+        assert wav_thumbnail.success is False
+        assert wav_thumbnail.result_message == 'Thumbnails can only be generated from video sources'
+
+    def test_derivative_outputs_seek_the_thumbnail_input(self):
+        args = _derivative_outputs('/src/video.mov', {'thumbnail': 'pipe', 'mp3': '/dest/audio.mp3'}, 12.5).get_args()
+        # the thumbnail input is seeked before it is opened, the audio input reads from the start
+        assert args[:6] == ['-ss', '12.5', '-i', '/src/video.mov', '-i', '/src/video.mov']
+        assert 'trim' not in ' '.join(args)
+        assert args[args.index('/dest/audio.mp3') - 1] != '-ss'
+
+        keyframe_args = _derivative_outputs('/src/video.mov', {'thumbnail': 'pipe'}, 12.5, keyframe_seek=True).get_args()
+        assert keyframe_args[:7] == ['-noaccurate_seek', '-skip_frame', 'nokey', '-ss', '12.5', '-i', '/src/video.mov']
+        assert keyframe_args.count('-i') == 1
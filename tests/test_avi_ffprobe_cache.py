@@ -0,0 +1,143 @@
+import logging
+import sys
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from avi_py.avi_ffprobe_cache import AviFFProbeCache
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+class FakeProbe:
+    """
+    Stand in for ffmpeg.probe that counts how often ffprobe would have run
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, src_file_path):
+        self.calls += 1
+        return { 'format': { 'filename': src_file_path, 'duration': '10.0', 'padding': 'x' * 512 }, 'streams': [] }
+
+@pytest.fixture(name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_ffprobe_cache', dir='/tmp') as temp_dir:
+        print(f'Created temp file at {temp_dir}')
+        yield temp_dir
+
+@pytest.fixture(name='src_files')
+def fixture_src_files(temp_folder):
+    src_files = []
+    for i in range(3):
+        src_file = Path(temp_folder) / f'src_{i}.wav'
+        src_file.write_bytes(b'\0' * (i + 1))
+        src_files.append(str(src_file))
+    yield src_files
+
+@pytest.fixture(name='db_path')
+def fixture_db_path(temp_folder):
+    yield Path(temp_folder) / 'cache' / 'ffprobe.sqlite3'
+
+
+class TestAviFFProbeCache:
+    """
+    Unit tests for the AviFFProbeCache class
+    """
+    def test_memory_and_disk_hits(self, src_files, db_path):
+        fake_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=db_path)
+
+        first = cache.probe(src_files[0], probe_func=fake_probe)
+        second = cache.probe(src_files[0], probe_func=fake_probe)
+        assert first == second
+        assert fake_probe.calls == 1
+        assert cache.stats == { 'hits': 1, 'misses': 1, 'memory_entries': 1 }
+
+        second['format']['duration'] = 'changed'
+        assert cache.probe(src_files[0], probe_func=fake_probe)['format']['duration'] == '10.0'
+
+        assert db_path.exists()
+        fresh_cache = AviFFProbeCache(db_path=db_path)
+        assert fresh_cache.probe(src_files[0], probe_func=fake_probe) == first
+        assert fake_probe.calls == 1
+        assert fresh_cache.hits == 1
+
+    def test_stale_entries_are_reprobed(self, src_files, db_path):
+        fake_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=db_path)
+
+        cache.probe(src_files[0], probe_func=fake_probe)
+        src_stat = os.stat(src_files[0])
+        os.utime(src_files[0], ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns + 1_000_000_000))
+        cache.probe(src_files[0], probe_func=fake_probe)
+        assert fake_probe.calls == 2
+
+    def test_invalidate_and_clear(self, src_files, db_path):
+        fake_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=db_path)
+
+        cache.probe(src_files[0], probe_func=fake_probe)
+        cache.invalidate(src_files[0])
+        cache.probe(src_files[0], probe_func=fake_probe)
+        assert fake_probe.calls == 2
+
+        cache.clear()
+        assert cache.stats == { 'hits': 0, 'misses': 0, 'memory_entries': 0 }
+        cache.probe(src_files[0], probe_func=fake_probe)
+        assert fake_probe.calls == 3
+
+    def test_eviction(self, src_files, db_path):
+        fake_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=db_path, max_bytes=1500, memory_entries=1)
+
+        for src_file in src_files:
+            cache.probe(src_file, probe_func=fake_probe)
+        assert cache.stats['memory_entries'] == 1
+
+        fresh_cache = AviFFProbeCache(db_path=db_path, max_bytes=1500)
+        fresh_cache.probe(src_files[0], probe_func=fake_probe)
+        assert fake_probe.calls == 4
+        fresh_cache.probe(src_files[2], probe_func=fake_probe)
+        assert fake_probe.calls == 4
+
+    def test_memory_only(self, src_files):
+        fake_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=None)
+
+        cache.probe(src_files[1], probe_func=fake_probe)
+        cache.probe(src_files[1], probe_func=fake_probe)
+        assert fake_probe.calls == 1
+
+        with pytest.raises(FileNotFoundError):
+            cache.probe('/tmp/avi_py_missing.wav', probe_func=fake_probe)
+
+    def test_unusable_db_path_falls_back_to_memory(self, src_files, temp_folder):
+        fake_probe = FakeProbe()
+        # the cache directory would have to be made under a regular file
+        cache = AviFFProbeCache(db_path=Path(src_files[0]) / 'cache' / 'ffprobe.sqlite3')
+
+        cache.probe(src_files[1], probe_func=fake_probe)
+        cache.probe(src_files[1], probe_func=fake_probe)
+        assert fake_probe.calls == 1
+        assert cache.db_path is None
+        cache.invalidate(src_files[1])
+        cache.clear()
+        assert sorted(os.listdir(temp_folder)) == ['src_0.wav', 'src_1.wav', 'src_2.wav']
+
+    def test_probe_variants(self, src_files, db_path):
+        full_probe = FakeProbe()
+        entries_probe = FakeProbe()
+        cache = AviFFProbeCache(db_path=db_path)
+
+        cache.probe(src_files[0], probe_func=full_probe)
+        cache.probe(src_files[0], probe_func=entries_probe, variant='format=duration')
+        cache.probe(src_files[0], probe_func=entries_probe, variant='format=duration')
+        assert full_probe.calls == 1
+        assert entries_probe.calls == 1
+
+        cache.invalidate(src_files[0])
+        assert cache.stats['memory_entries'] == 0
+        cache.probe(src_files[0], probe_func=entries_probe, variant='format=duration')
+        assert entries_probe.calls == 2
@@ -0,0 +1,79 @@
+import io
+import sys
+import logging
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image, ImageCms
+
+from avi_py import constants as avi_const
+from avi_py.avi_icc_converter import AviStripIccConverter, AviTiffStripWriter, AviIccConverterError
+from avi_py.avi_image_header import AviImageHeader
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+# little cms' built in sRGB differs from the target profile, so converting between them changes pixels
+SOURCE_ICC_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+
+@pytest.fixture(name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_icc_converter', dir='/tmp') as temp_dir:
+        yield temp_dir
+
+def _source_tiff(temp_folder, mode='RGB', size=(301, 203), **save_options):
+    img = Image.effect_noise(size, 64).convert(mode) if mode == 'L' else \
+        Image.merge(mode, [Image.effect_noise(size, 64 + band * 10) for band in range(len(mode))])
+    src_path = f'{temp_folder}/source_{mode}.tif'
+    img.save(src_path, icc_profile=SOURCE_ICC_PROFILE, dpi=(400, 400), **save_options)
+    return src_path
+
+def _whole_image_conversion(src_path):
+    # what image_processing's Converter.convert_icc_profile does
+    with Image.open(src_path) as img:
+        return ImageCms.profileToProfile(img, ImageCms.ImageCmsProfile(io.BytesIO(img.info['icc_profile'])),
+                                         str(avi_const.ICC_PROFILE_PATH)).tobytes()
+
+class TestAviIccConverter:
+    """
+    Unit tests for the strip wise icc profile conversion
+    """
+    @pytest.mark.parametrize('mode,strip_bytes,threads,save_options', [
+        ('RGB', 301 * 3 * 10, 1, {}),
+        ('RGB', 1, 3, {}),
+        ('RGBA', 301 * 4 * 64, 2, {}),
+    ])
+    def test_pixels_match_whole_image_conversion(self, temp_folder, mode, strip_bytes, threads, save_options):
+        src_path = _source_tiff(temp_folder, mode, **save_options)
+        out_path = f'{temp_folder}/converted.tif'
+        assert AviStripIccConverter.supports(AviImageHeader.read(src_path)) is True
+
+        AviStripIccConverter(src_path, strip_bytes=strip_bytes, threads=threads).convert(out_path)
+
+        with Image.open(out_path) as converted:
+            assert converted.mode == mode
+            assert converted.size == (301, 203)
+            assert converted.info['icc_profile'] == avi_const.ICC_PROFILE_PATH.read_bytes()
+            assert converted.info['dpi'] == (400, 400)
+            assert converted.tobytes() == _whole_image_conversion(src_path)
+
+    def test_supports(self, temp_folder):
+        assert AviStripIccConverter.supports(AviImageHeader.read(_source_tiff(temp_folder))) is True
+        assert AviStripIccConverter.supports(AviImageHeader.read(_source_tiff(temp_folder, 'L'))) is False
+        compressed_path = _source_tiff(temp_folder, compression='tiff_lzw')
+        assert AviStripIccConverter.supports(AviImageHeader.read(compressed_path)) is False
+        with pytest.raises(AviIccConverterError):
+            AviStripIccConverter(compressed_path).convert(f'{temp_folder}/converted.tif')
+
+    def test_strip_writer(self, temp_folder):
+        img = Image.effect_noise((20, 10), 64).convert('RGB')
+        out_path = f'{temp_folder}/written.tif'
+        with AviTiffStripWriter(out_path, 'RGB', img.size, SOURCE_ICC_PROFILE, big_tiff=True) as writer:
+            for top in range(0, 10, 4):
+                writer.write_strip(img.crop((0, top, 20, min(top + 4, 10))).tobytes(), min(4, 10 - top))
+        with Image.open(out_path) as written:
+            assert written.tobytes() == img.tobytes()
+            assert written.info['icc_profile'] == SOURCE_ICC_PROFILE
+
+        with pytest.raises(AviIccConverterError):
+            with AviTiffStripWriter(out_path, 'RGB', img.size, SOURCE_ICC_PROFILE) as writer:
+                writer.write_strip(img.crop((0, 0, 20, 4)).tobytes(), 4)
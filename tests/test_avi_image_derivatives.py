@@ -0,0 +1,162 @@
+import os
+import sys
+import logging
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image, ImageCms
+
+from avi_py import constants as avi_const
+from avi_py.avi_image_derivatives import AviBandDownscaler, AviImageDerivatives, AviImageDerivativesError, \
+    derivative_size, reduce_factor, eight_bit
+from avi_py.avi_jp2_processor import AviJp2Processor, AviJp2ProcessorError
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+SIZE = (3100, 2300)
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_image_derivatives', dir='/tmp') as temp_dir:
+        yield Path(temp_dir)
+
+@pytest.fixture(scope='module', name='src_path')
+def fixture_src_path(temp_folder):
+    src_path = temp_folder / 'source.tif'
+    Image.effect_noise(SIZE, 64).convert('RGB').save(
+        src_path, icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+    return src_path
+
+def _bands(img, band_rows):
+    top = 0
+    for rows in band_rows:
+        yield img.crop((0, top, img.width, top + rows)).tobytes(), rows
+        top += rows
+
+class TestAviImageDerivatives:
+    """
+    Tests for writing downscaled jpeg and webp derivatives from streamed bands or a reduced resolution jp2 decode
+    """
+    def test_sizes(self):
+        assert derivative_size((3100, 2300), 300) == (300, 223)
+        assert derivative_size((200, 100), 300) == (200, 100)
+        # box reduced to at least twice the derivative before the lanczos resize
+        assert reduce_factor((3100, 2300), 300) == 5
+        assert reduce_factor((3100, 2300), 3000) == 1
+
+    @pytest.mark.parametrize('band_rows', [(777,), (100,) * 7 + (77,), (3, 5, 7, 11) * 25 + (127,)])
+    def test_band_downscaler(self, band_rows):
+        img = Image.effect_noise((1001, 777), 64).convert('RGB')
+        downscaler = AviBandDownscaler('RGB', img.size, 4)
+        for data, rows in _bands(img, band_rows):
+            downscaler.add_band(data, rows)
+        # rows carried between bands reduce exactly as the whole image does
+        assert downscaler.image().tobytes() == img.reduce(4).tobytes()
+
+        partial = AviBandDownscaler('L', (100, 100), 3)
+        partial.add_band(bytes(100 * 50), 50)
+        with pytest.raises(AviImageDerivativesError):
+            partial.image()
+
+    def test_tee(self, temp_folder):
+        img = Image.effect_noise(SIZE, 64).convert('RGB')
+        derivatives = AviImageDerivatives({'thumbnail': temp_folder / 'tee.jpg', 'thumbnail_webp': temp_folder / 'tee.webp'}, SIZE)
+        teed = list(derivatives.tee(_bands(img, (1000, 1000, 300)), 'RGB'))
+        assert [rows for _, rows in teed] == [1000, 1000, 300]
+
+        # every band went past, so no jp2 is needed
+        results = derivatives.write()
+        assert results['thumbnail'] == {'path': str(temp_folder / 'tee.jpg'), 'width': 300, 'height': 223,
+                                        'bytes': os.path.getsize(temp_folder / 'tee.jpg')}
+        with Image.open(temp_folder / 'tee.webp') as webp:
+            assert (webp.format, webp.size) == ('WEBP', (300, 223))
+
+        with pytest.raises(AviImageDerivativesError):
+            AviImageDerivatives({'poster': temp_folder / 'poster.jpg'}, SIZE)
+        with pytest.raises(AviImageDerivativesError):
+            AviImageDerivatives({'thumbnail': temp_folder / 'none.jpg'}, SIZE).write()
+
+    def test_keep(self, temp_folder):
+        img = Image.effect_noise(SIZE, 64).convert('RGB')
+        derivatives = AviImageDerivatives({'thumbnail': temp_folder / 'kept.jpg'}, SIZE)
+        assert derivatives.has_source is False
+        derivatives.keep(img)
+        assert derivatives.has_source is True
+        # the kept image is box reduced straight away, no jp2 is needed
+        assert derivatives.write()['thumbnail']['width'] == 300
+
+    def test_modes(self, temp_folder):
+        # hidden pixels under transparency are black, the jpeg shows the white page they sit on
+        rgba = Image.new('RGBA', (400, 300), (0, 0, 0, 0))
+        la = Image.new('LA', (400, 300), (0, 0))
+        sixteen_bit = Image.new('I;16', (400, 300), 40000)
+        derivatives = AviImageDerivatives({'thumbnail': temp_folder / 'mode.jpg', 'thumbnail_webp': temp_folder / 'mode.webp'},
+                                          (400, 300))
+        for img, jpeg_mode, jpeg_pixel in [(rgba, 'RGB', (255, 255, 255)), (la, 'L', 255), (sixteen_bit, 'L', 156)]:
+            derivatives.write_image(img)
+            with Image.open(temp_folder / 'mode.jpg') as jpeg:
+                assert jpeg.mode == jpeg_mode
+                assert jpeg.getpixel((150, 150)) == pytest.approx(jpeg_pixel, abs=2)
+        with Image.open(temp_folder / 'mode.webp') as webp:
+            assert webp.mode == 'RGB'
+        derivatives.write_image(rgba)
+        with Image.open(temp_folder / 'mode.webp') as webp:
+            assert webp.mode == 'RGBA'
+
+        # 16 bit samples are scaled, not clipped at 255
+        assert eight_bit(sixteen_bit).getpixel((0, 0)) == 40000 >> 8
+        assert eight_bit(Image.new('1', (4, 4), 1)).mode == 'L'
+
+    def test_processor_derivatives(self, temp_folder, src_path, monkeypatch):
+        # the source's own pixels are kept, the lossy jp2 is not decoded again
+        def no_jp2_decode(self, jp2_path):
+            raise AssertionError(f'{jp2_path} was decoded for its derivatives')
+        monkeypatch.setattr(AviImageDerivatives, 'reduced_jp2_image', no_jp2_decode)
+        derivative_paths = {'access': temp_folder / 'access.jpg', 'thumbnail': temp_folder / 'thumbnail.jpg'}
+        processor = AviJp2Processor.process_jp2(src_path, temp_folder / 'source.jp2', encoder='openjpeg',
+                                                derivative_paths=derivative_paths)
+        assert processor.success is True, processor.result_message
+        assert set(processor.result['derivatives']) == {'access', 'thumbnail'}
+        assert 'derivatives' in processor.result['timings']
+        for name, dest_path in derivative_paths.items():
+            with Image.open(dest_path) as derivative:
+                assert derivative.format == 'JPEG'
+                assert derivative.size == derivative_size(SIZE, avi_const.IMAGE_DERIVATIVES[name]['max_side'])
+                # made from the icc converted pixels, so they carry the target profile
+                assert derivative.info['icc_profile'] == avi_const.ICC_PROFILE_PATH.read_bytes()
+
+        # without the source's pixels the thumbnail is read from a lower resolution level of the jp2
+        monkeypatch.undo()
+        derivatives = AviImageDerivatives({'thumbnail': temp_folder / 'unused.jpg'}, SIZE)
+        assert derivatives.reduced_jp2_image(temp_folder / 'source.jp2').size == (775, 575)
+
+        with pytest.raises(AviJp2ProcessorError):
+            AviJp2Processor(src_path, temp_folder / 'unknown.jp2', derivative_paths={'poster': temp_folder / 'poster.jpg'})
+
+    def test_processor_derivatives_from_decoded_source(self, temp_folder, monkeypatch):
+        def no_jp2_decode(self, jp2_path):
+            raise AssertionError(f'{jp2_path} was decoded for its derivatives')
+        monkeypatch.setattr(AviImageDerivatives, 'reduced_jp2_image', no_jp2_decode)
+        gray_path = temp_folder / 'gray.tif'
+        Image.effect_noise(SIZE, 64).save(gray_path)
+        # no icc conversion, so the image openjpeg decoded is kept for them
+        processor = AviJp2Processor.process_jp2(gray_path, temp_folder / 'gray.jp2', encoder='openjpeg',
+                                                derivative_paths={'thumbnail': temp_folder / 'gray.jpg'})
+        assert processor.success is True, processor.result_message
+        with Image.open(temp_folder / 'gray.jpg') as derivative:
+            assert (derivative.mode, derivative.size) == ('L', (300, 223))
+
+    def test_incremental_writes_stale_derivatives(self, temp_folder, src_path):
+        derivative_paths = {'thumbnail': temp_folder / 'incremental.jpg', 'thumbnail_webp': temp_folder / 'incremental.webp'}
+        first = AviJp2Processor.process_jp2(src_path, temp_folder / 'incremental.jp2', encoder='openjpeg', incremental=True,
+                                            derivative_paths=derivative_paths)
+        assert first.success is True, first.result_message
+        os.unlink(derivative_paths['thumbnail_webp'])
+
+        second = AviJp2Processor.process_jp2(src_path, temp_folder / 'incremental.jp2', encoder='openjpeg', incremental=True,
+                                             derivative_paths=derivative_paths)
+        assert second.success is True and second.result['skipped'] is True
+        # only the missing derivative is written, from the jp2 that was already there
+        assert list(second.result['derivatives']) == ['thumbnail_webp']
+        assert derivative_paths['thumbnail_webp'].exists()
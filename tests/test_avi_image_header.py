@@ -0,0 +1,138 @@
+import logging
+import math
+import struct
+import sys
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from PIL import Image
+from image_processing.exceptions import ValidationError
+from avi_py.avi_image_header import AviImageHeader, check_header_suitable_for_jp2_conversion
+
+from . import file_fixtures
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_image_header', dir='/tmp') as temp_dir:
+        print(f'Created temp file at {temp_dir}')
+        yield temp_dir
+
+TILE_SIZE = 128
+
+def write_tiled_rgba_tiff(tiff_path, width, height, rgba=(10, 20, 30, 255)):
+    """
+    Writes an uncompressed little endian RGBA tiff in TILE_SIZE tiles. Pillow only writes strips
+    """
+    tiles_across, tiles_down = math.ceil(width / TILE_SIZE), math.ceil(height / TILE_SIZE)
+    tile_count = tiles_across * tiles_down
+    tile_bytes = bytes(rgba) * TILE_SIZE * TILE_SIZE
+    entry_count = 12
+    ifd_offset = 8
+    data_offset = ifd_offset + 2 + entry_count * 12 + 4
+    bits_offset, tile_offsets_offset = data_offset, data_offset + 8
+    tile_byte_counts_offset = tile_offsets_offset + 4 * tile_count
+    first_tile_offset = tile_byte_counts_offset + 4 * tile_count
+    entries = [
+        (256, 4, 1, width), (257, 4, 1, height), (258, 3, 4, bits_offset), (259, 3, 1, 1), (262, 3, 1, 2),
+        (277, 3, 1, 4), (284, 3, 1, 1), (322, 3, 1, TILE_SIZE), (323, 3, 1, TILE_SIZE),
+        (324, 4, tile_count, tile_offsets_offset), (325, 4, tile_count, tile_byte_counts_offset), (338, 3, 1, 2),
+    ]
+    with open(tiff_path, 'wb') as tiff_file:
+        tiff_file.write(struct.pack('<2sHI', b'II', 42, ifd_offset))
+        tiff_file.write(struct.pack('<H', entry_count))
+        for tag, field_type, count, value in entries:
+            # a single short sits left justified in the 4 byte value field
+            value_format = '<HHIH2x' if field_type == 3 and count == 1 else '<HHII'
+            tiff_file.write(struct.pack(value_format, tag, field_type, count, value))
+        tiff_file.write(struct.pack('<I', 0))
+        tiff_file.write(struct.pack('<4H', 8, 8, 8, 8))
+        tiff_file.write(struct.pack(f'<{tile_count}I', *(first_tile_offset + i * len(tile_bytes) for i in range(tile_count))))
+        tiff_file.write(struct.pack(f'<{tile_count}I', *([len(tile_bytes)] * tile_count)))
+        for _ in range(tile_count):
+            tiff_file.write(tile_bytes)
+
+@pytest.fixture(name='rgba_tiled_image')
+def fixture_rgba_tiled_image(temp_folder):
+    rgba_path = f'{temp_folder}/rgba_tiled.tif'
+    write_tiled_rgba_tiff(rgba_path, 300, 200)
+    yield rgba_path
+
+@pytest.fixture(name='rgba_stripped_image')
+def fixture_rgba_stripped_image(temp_folder):
+    rgba_path = f'{temp_folder}/rgba_stripped.tif'
+    Image.new('RGBA', (300, 200), (10, 20, 30, 255)).save(rgba_path)
+    yield rgba_path
+
+class TestAviImageHeader:
+    """
+    Unit tests for the AviImageHeader record
+    """
+    def test_grayscaled_image_header(self):
+        header = AviImageHeader.read(file_fixtures.GRAYSCALED_IMAGE)
+
+        assert isinstance(header, AviImageHeader)
+        assert header.is_monotone is True
+        assert header.is_color is False
+        assert header.has_alpha is False
+        assert header.is_tiled is False
+        assert header.chunk_count >= 1
+
+        with file_fixtures.image_fixture(file_fixtures.GRAYSCALED_IMAGE) as gsi:
+            assert header.mode == gsi.mode
+            assert (header.width, header.height) == gsi.size
+            assert header.long_dim == max(gsi.width, gsi.height)
+            assert header.icc_profile == gsi.info.get('icc_profile')
+
+        check_header_suitable_for_jp2_conversion(header)
+
+    def test_no_icc_image_header(self):
+        header = AviImageHeader.read(file_fixtures.NO_ICC_IMAGE)
+
+        assert header.is_color is True
+        assert header.icc_profile is None
+        assert header.samples_per_pixel >= 3
+
+        with pytest.raises(ValidationError):
+            check_header_suitable_for_jp2_conversion(header, require_icc_profile_for_colour=True)
+        check_header_suitable_for_jp2_conversion(header, require_icc_profile_for_colour=False)
+
+    def test_srgb_image_header(self):
+        header = AviImageHeader.read(file_fixtures.SRGB_IMAGE)
+
+        assert header.is_color is True
+        assert header.icc_profile is not None
+        check_header_suitable_for_jp2_conversion(header)
+
+    def test_rgba_tiled_image_header(self, rgba_tiled_image):
+        header = AviImageHeader.read(rgba_tiled_image)
+
+        assert header.mode == 'RGBA'
+        assert header.has_alpha is True
+        assert header.bits_per_sample == (8, 8, 8, 8)
+        assert header.pixel_count == 300 * 200
+        assert header.is_tiled is True
+        assert (header.tile_width, header.tile_height) == (TILE_SIZE, TILE_SIZE)
+        assert header.rows_per_strip is None
+        assert header.chunk_count == 3 * 2
+
+        with Image.open(rgba_tiled_image) as img:
+            assert img.getpixel((299, 199)) == (10, 20, 30, 255)
+
+        with pytest.raises(AttributeError):
+            header.mode = 'RGB'
+
+    def test_rgba_stripped_image_header(self, rgba_stripped_image):
+        header = AviImageHeader.read(rgba_stripped_image)
+
+        assert header.has_alpha is True
+        assert header.is_tiled is False
+        assert (header.tile_width, header.tile_height) == (None, None)
+        assert header.rows_per_strip is not None
+        assert header.chunk_count == math.ceil(200 / header.rows_per_strip)
+
+    def test_missing_image_header(self):
+        with pytest.raises(FileNotFoundError):
+            AviImageHeader.read('/tmp/avi_py_missing_image.tif')
@@ -0,0 +1,124 @@
+import logging
+import sys
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from avi_py.avi_batch_processor import AviBatchProcessor, AviBatchProcessorError, REQUEST_WINDOW, read_manifest, threads_per_worker
+from avi_py.avi_jp2_batch_processor import AviJp2BatchProcessor
+from avi_py import constants as avi_const
+
+from . import file_fixtures
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+BATCH_IMAGES = [file_fixtures.GRAYSCALED_IMAGE, file_fixtures.SRGB_IMAGE, file_fixtures.NO_ICC_IMAGE]
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_batch_files', dir='/tmp') as temp_dir:
+        print(f'Created temp file at {temp_dir}')
+        yield temp_dir
+
+@pytest.fixture(name='manifest_file')
+def fixture_manifest_file(temp_folder):
+    manifest_path = Path(temp_folder) / 'manifest.txt'
+    lines = ['# batch test manifest', '', f'{BATCH_IMAGES[0]}\t{Path(temp_folder) / "explicit.jp2"}'] + BATCH_IMAGES[1:]
+    manifest_path.write_text('\n'.join(lines), encoding='utf-8')
+    yield str(manifest_path)
+
+def _echo_job(src_path):
+    return { 'success': True, 'src_file_path': str(src_path) }
+
+class _EstimateCountingBatch(AviBatchProcessor):
+    estimated: list = []
+
+    def _job_args(self, src_path, dest_path):
+        return _echo_job, src_path
+
+    def _job_memory(self, src_path):
+        self.estimated.append(src_path)
+        return avi_const.JOB_BASE_MEMORY_BYTES
+
+
+class TestAviJp2BatchProcessor:
+    """
+    Tests for converting a batch of tiffs with the AviJp2BatchProcessor class
+    """
+    def test_read_manifest(self, manifest_file, temp_folder):
+        entries = read_manifest(manifest_file, avi_const.JP2_BATCH_MANIFEST_EXTENSIONS)
+        assert len(entries) == 3
+        assert entries[0] == (Path(BATCH_IMAGES[0]), Path(temp_folder) / 'explicit.jp2')
+        assert entries[1] == (Path(BATCH_IMAGES[1]), None)
+
+        dir_entries = read_manifest(file_fixtures.TEST_FILE_DIR, avi_const.JP2_BATCH_MANIFEST_EXTENSIONS)
+        assert all(src_path.suffix in avi_const.VALID_IMAGE_EXTENSIONS for src_path, _ in dir_entries)
+        assert all(dest_path is None for _, dest_path in dir_entries)
+
+        with pytest.raises(FileNotFoundError):
+            read_manifest('/tmp/avi_py_missing_manifest.txt', avi_const.JP2_BATCH_MANIFEST_EXTENSIONS)
+
+    def test_read_manifest_directory_extension_case(self, temp_folder):
+        delivery_dir = Path(temp_folder) / 'upper_case_delivery'
+        delivery_dir.mkdir()
+        for name in ['a.TIF', 'b.Tiff', 'c.tif', 'notes.txt']:
+            (delivery_dir / name).touch()
+        entries = read_manifest(delivery_dir, avi_const.JP2_BATCH_MANIFEST_EXTENSIONS)
+        assert [src_path.name for src_path, _ in entries] == ['a.TIF', 'b.Tiff', 'c.tif']
+
+    def test_dest_collisions(self, temp_folder):
+        jobs = [(Path(temp_folder) / 'a' / 'x.tif', None), (Path(temp_folder) / 'b' / 'x.tif', None)]
+        with pytest.raises(AviBatchProcessorError, match='x.tif'):
+            AviJp2BatchProcessor(jobs, dest_dir=temp_folder)
+        # next to their sources, or with a dest path of their own, they don't collide
+        assert len(AviJp2BatchProcessor(jobs).jobs) == 2
+        assert len(AviJp2BatchProcessor([jobs[0], (jobs[1][0], Path(temp_folder) / 'b_x.jp2')], dest_dir=temp_folder).jobs) == 2
+
+    def test_profile(self, temp_folder):
+        jobs = [(Path(temp_folder) / 'x.tif', None)]
+        assert AviJp2BatchProcessor(jobs, profile='iiif-fast-read')._job_args(*jobs[0])[-3] == 'iiif-fast-read'
+        with pytest.raises(AviBatchProcessorError):
+            AviJp2BatchProcessor(jobs, profile='fastest')
+
+    def test_target_size(self, temp_folder):
+        jobs = [(Path(temp_folder) / 'x.tif', None)]
+        assert AviJp2BatchProcessor(jobs, target_bytes_per_pixel=0.25, target_bytes=4096)._job_args(*jobs[0])[-2:] == (0.25, 4096)
+        with pytest.raises(AviBatchProcessorError):
+            AviJp2BatchProcessor(jobs, target_bytes=-1)
+
+    def test_jobs_estimated_as_they_come_up(self):
+        jobs = [(Path(f'/tmp/page_{page}.tif'), None) for page in range(20)]
+        batch = _EstimateCountingBatch(jobs, max_workers=2)
+        batch.estimated = []
+        results = batch.iter_results()
+        next(results)
+        # the first result comes back before most of the batch has been estimated
+        assert len(batch.estimated) <= 2 * REQUEST_WINDOW + 2
+        assert len(list(results)) == 19
+        assert batch.estimated == [src_path for src_path, _ in jobs]
+        assert batch.success
+
+    def test_threads_per_worker(self):
+        assert threads_per_worker(1) == os.cpu_count()
+        assert threads_per_worker(os.cpu_count() * 2) == 1
+        assert threads_per_worker(0) == os.cpu_count()
+
+    def test_batch_convert(self, manifest_file, temp_folder):
+        jp2_batch = AviJp2BatchProcessor.from_manifest(manifest_file, dest_dir=temp_folder, max_workers=2)
+
+        assert jp2_batch.max_workers == 2
+        assert jp2_batch.kdu_num_threads == threads_per_worker(2)
+        assert jp2_batch.dest_file_path_for(Path(BATCH_IMAGES[1])) == Path(temp_folder) / f'{Path(BATCH_IMAGES[1]).stem}.jp2'
+
+        results = list(jp2_batch.iter_results())
+        assert len(results) == 3
+        assert sorted(result['src_file_path'] for result in results) == sorted(BATCH_IMAGES)
+        for result in results:
+            assert all(key in result for key in ['success', 'message', 'src_file_path', 'dest_file_path'])
+            assert result['success'] is True
+            assert Path(result['dest_file_path']).exists()
+
+        assert jp2_batch.success is True
+        assert jp2_batch.result == { 'success': True, 'message': '3 of 3 files processed successfully' }
@@ -0,0 +1,147 @@
+import os
+import sys
+import struct
+import logging
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image, ImageCms
+from image_processing import kakadu
+
+from avi_py import constants as avi_const
+from avi_py.avi_image_data import AviImageData
+from avi_py.avi_jp2_encoder import AviKakaduEncoder, AviOpenJpegEncoder, AviJp2EncoderError, jp2_encoder
+from avi_py.avi_jp2_processor import AviJp2Processor, AviJp2ProcessorError
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_jp2_encoder', dir='/tmp') as temp_dir:
+        yield temp_dir
+
+def _tiff(temp_folder, name, mode='RGB', size=(1200, 900)):
+    src_path = f'{temp_folder}/{name}.tif'
+    img = Image.effect_noise(size, 64).convert(mode)
+    if mode == 'RGB':
+        img.save(src_path, icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes())
+    else:
+        img.save(src_path)
+    return src_path
+
+def _cod(jp2_path):
+    """
+    (progression, layers, mct, decomposition levels) from the COD marker segment of a jp2
+    """
+    with open(jp2_path, 'rb') as jp2:
+        data = jp2.read()
+    cod = data.index(b'\xff\x52')
+    return struct.unpack('>BHBB', data[cod + 5:cod + 10])
+
+class TestAviJp2Encoder:
+    """
+    Tests for the kakadu and openjpeg jp2 encoders
+    """
+    def test_unknown_encoder(self, temp_folder):
+        with pytest.raises(AviJp2EncoderError):
+            jp2_encoder('jasper')
+        with pytest.raises(AviJp2ProcessorError):
+            AviJp2Processor(_tiff(temp_folder, 'unknown', 'L'), f'{temp_folder}/unknown.jp2', encoder='jasper')
+
+    def test_kakadu_settings_leave_out_threads(self, temp_folder):
+        image_data = AviImageData(_tiff(temp_folder, 'kakadu_settings'))
+        encoder = jp2_encoder('kakadu', num_threads=3)
+        assert isinstance(encoder, AviKakaduEncoder)
+
+        kdu_args = encoder.kdu_args(image_data, image_data.image_header)
+        assert kdu_args[kdu_args.index('-num_threads') + 1] == '3'
+        assert kdu_args[:4] == ['-rate', image_data.layer_rates(), '-jp2_space', 'sRGB']
+        assert f'Clevels={image_data.level_count_for_size()}' in kdu_args
+        settings = encoder.settings(image_data, image_data.image_header)
+        assert '-num_threads' not in settings and '3' not in settings and '-quiet' not in settings
+
+    def test_kakadu_alpha_only_for_rgba(self, temp_folder):
+        rgba_data = AviImageData(_tiff(temp_folder, 'kakadu_rgba', 'RGBA'))
+        la_data = AviImageData(_tiff(temp_folder, 'kakadu_la', 'LA'))
+        assert la_data.image_header.has_alpha is True
+
+        encoder = AviKakaduEncoder()
+        assert kakadu.ALPHA_OPTION in encoder.kdu_args(rgba_data, rgba_data.image_header)
+        assert kakadu.ALPHA_OPTION not in encoder.kdu_args(la_data, la_data.image_header)
+
+    def test_openjpeg_save_options(self, temp_folder):
+        gray_data = AviImageData(_tiff(temp_folder, 'gray_options', 'L'))
+        options = AviOpenJpegEncoder().save_options(gray_data, gray_data.image_header)
+
+        # kakadu's bits per pixel as compression ratios of an 8 bit image, most compressed first
+        rates = [float(rate) for rate in gray_data.layer_rates().split(',')]
+        assert options['quality_layers'] == sorted((round(8 / rate, 4) for rate in rates), reverse=True)
+        assert options['num_resolutions'] == gray_data.level_count_for_size() + 1
+        assert options['tile_size'] == (avi_const.KDU_DEFAULT_TILE_SIZE, avi_const.KDU_DEFAULT_TILE_SIZE)
+        assert options['mct'] == 0
+
+    @pytest.mark.parametrize('mode', ['RGB', 'L'])
+    def test_openjpeg_encode(self, temp_folder, mode, monkeypatch):
+        src_path = _tiff(temp_folder, f'openjpeg_{mode}', mode)
+        dest_path = f'{temp_folder}/openjpeg_{mode}.jp2'
+        image_data = AviImageData(src_path)
+        monkeypatch.setenv('OPJ_NUM_THREADS', '3')
+        jp2_encoder('openjpeg', num_threads=2).encode(image_data, src_path, image_data.image_header, dest_path)
+        # the thread count is only set for the encode
+        assert os.environ['OPJ_NUM_THREADS'] == '3'
+
+        with Image.open(dest_path) as jp2:
+            assert (jp2.format, jp2.mode, jp2.size) == ('JPEG2000', mode, (1200, 900))
+        progression, layers, mct, levels = _cod(dest_path)
+        assert progression == 2  # RPCL
+        assert layers == image_data.layer_count
+        assert mct == (1 if mode == 'RGB' else 0)
+        assert levels == image_data.level_count_for_size()
+
+    def test_openjpeg_encode_error_removes_output(self, temp_folder):
+        src_path = _tiff(temp_folder, 'openjpeg_truncated', 'L')
+        image_data = AviImageData(src_path)
+        with open(src_path, 'r+b') as src:
+            src.truncate(4096)
+        dest_path = f'{temp_folder}/openjpeg_truncated.jp2'
+        with pytest.raises(AviJp2EncoderError):
+            AviOpenJpegEncoder().encode(image_data, src_path, image_data.image_header, dest_path)
+        assert not os.path.exists(dest_path)
+
+    def test_processor_with_openjpeg(self, temp_folder):
+        src_path = _tiff(temp_folder, 'processor_openjpeg')
+        Image.effect_noise((1200, 900), 64).convert('RGB').save(
+            src_path, icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+        processor = AviJp2Processor(src_path, f'{temp_folder}/processor_openjpeg.jp2', encoder='openjpeg',
+                                    stream_to_kakadu=True)
+        assert processor.kakadu is None
+        # built once, with the processor's settings
+        assert processor.encoder is processor.encoder
+        assert processor.encoder.scratch_dir == processor.scratch_dir
+        processor.convert_to_jp2()
+
+        assert processor.success is True, processor.result_message
+        # openjpeg can't take streamed pixels, so the icc converted tiff is encoded
+        assert 'openjpeg_compress' in processor.result['timings']
+        assert 'kdu_stream' not in processor.result['timings']
+        sidecar_settings = processor.derivative_sidecar().settings
+        assert 'openjpeg' in sidecar_settings and 'kakadu' not in sidecar_settings
+
+    def test_profiles(self, temp_folder):
+        src_path = _tiff(temp_folder, 'profile_gray', 'L', size=(2500, 1800))
+        with pytest.raises(AviJp2EncoderError):
+            jp2_encoder('openjpeg', profile='fastest')
+        with pytest.raises(AviJp2ProcessorError):
+            AviJp2Processor(src_path, f'{temp_folder}/profile.jp2', profile='fastest')
+
+        processor = AviJp2Processor(src_path, f'{temp_folder}/profile.jp2', encoder='openjpeg', profile='iiif-fast-read')
+        assert processor.image_data.tile_size == '512,512'
+        assert processor.encoder.save_options(processor.image_data, processor.image_data.image_header)['precinct_size'] == (256, 256)
+        kdu_args = jp2_encoder('kakadu', profile='iiif-fast-read').kdu_args(processor.image_data, processor.image_data.image_header)
+        assert 'Stiles={512,512}' in kdu_args and 'Cprecincts={256,256},{256,256},{128,128}' in kdu_args
+
+        processor.convert_to_jp2()
+        assert processor.success is True, processor.result_message
+        # the profile's options are part of the sidecar settings so changing profile rebuilds the jp2
+        archival_settings = AviJp2Processor(src_path, f'{temp_folder}/profile.jp2', encoder='openjpeg').derivative_sidecar().settings
+        assert processor.derivative_sidecar().settings != archival_settings
@@ -0,0 +1,100 @@
+import sys
+import shutil
+import logging
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image, ImageCms
+
+from avi_py import constants as avi_const
+from avi_py.avi_jp2_preflight import AviJp2Preflight, preflight_tiff, walk_source_paths
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+OTHER_ICC_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+
+@pytest.fixture(scope='module', name='delivery')
+def fixture_delivery():
+    with TemporaryDirectory(prefix='avi_test_preflight', dir='/tmp') as temp_dir:
+        delivery = Path(temp_dir)
+        (delivery / 'box_1' / 'folder_1').mkdir(parents=True)
+        (delivery / 'box_2').mkdir()
+        Image.new('L', (400, 300)).save(delivery / 'box_1' / 'gray.tif')
+        Image.new('RGB', (400, 300)).save(delivery / 'box_1' / 'folder_1' / 'other_icc.tif', icc_profile=OTHER_ICC_PROFILE)
+        Image.new('RGB', (400, 300)).save(delivery / 'box_1' / 'folder_1' / 'target_icc.tiff',
+                                          icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes())
+        Image.new('CMYK', (400, 300)).save(delivery / 'box_2' / 'cmyk.tif')
+        Image.new('L', (50, 40)).save(delivery / 'box_2' / 'tiny.tif')
+        (delivery / 'box_2' / 'truncated.tif').write_bytes(b'II*\x00garbage')
+        Image.new('L', (400, 300)).save(delivery / 'box_2' / 'scan.png')
+        yield delivery
+
+class TestAviJp2Preflight:
+    """
+    Tests for checking tiffs for jp2 conversion from their headers with the AviJp2Preflight class
+    """
+    def test_walk_source_paths(self, delivery):
+        walked = [path for path, _ in walk_source_paths([delivery], avi_const.VALID_IMAGE_EXTENSIONS, walk_threads=2)]
+        assert sorted(path.name for path in walked) == ['cmyk.tif', 'gray.tif', 'other_icc.tif', 'target_icc.tiff', 'tiny.tif', 'truncated.tif']
+        # files given directly are checked whatever their extension
+        assert list(walk_source_paths([delivery / 'box_2' / 'scan.png'], avi_const.VALID_IMAGE_EXTENSIONS)) == [(delivery / 'box_2' / 'scan.png', None)]
+        with pytest.raises(FileNotFoundError):
+            list(walk_source_paths(['/tmp/avi_py_missing_delivery'], avi_const.VALID_IMAGE_EXTENSIONS))
+
+    def test_upper_case_extensions(self, tmp_path):
+        Image.new('L', (400, 300)).save(tmp_path / 'SCAN.TIF')
+        Image.new('L', (400, 300)).save(tmp_path / 'page.Tiff')
+        Image.new('L', (400, 300)).save(tmp_path / 'SCAN.PNG')
+
+        walked = [path for path, _ in walk_source_paths([tmp_path], avi_const.VALID_IMAGE_EXTENSIONS)]
+        assert sorted(path.name for path in walked) == ['SCAN.TIF', 'page.Tiff']
+        assert all(preflight_tiff(path)['suitable'] for path in walked)
+
+    def test_preflight_tiff(self, delivery):
+        gray = preflight_tiff(delivery / 'box_1' / 'gray.tif')
+        assert gray['suitable'] is True
+        assert gray['src_quality'] == 'gray'
+        assert gray['icc_conversion'] is None
+        assert gray['level_count'] == 2
+        assert gray['estimated_memory_bytes'] > avi_const.JOB_BASE_MEMORY_BYTES
+
+        other_icc = preflight_tiff(delivery / 'box_1' / 'folder_1' / 'other_icc.tif')
+        assert other_icc['suitable'] is True
+        assert (other_icc['src_quality'], other_icc['needs_icc_profile'], other_icc['icc_conversion']) == ('color', False, 'strips')
+        assert preflight_tiff(delivery / 'box_1' / 'folder_1' / 'target_icc.tiff')['icc_conversion'] is None
+
+        cmyk = preflight_tiff(delivery / 'box_2' / 'cmyk.tif')
+        assert cmyk['suitable'] is False
+        assert cmyk['message'] == 'ValidationError: Unsupported colour mode CMYK'
+
+        assert 'pixel minimum' in preflight_tiff(delivery / 'box_2' / 'tiny.tif')['message']
+        assert preflight_tiff(delivery / 'box_2' / 'truncated.tif')['suitable'] is False
+        assert preflight_tiff(delivery / 'box_2' / 'scan.png')['message'] == 'Source image is not a .tiff or .tif'
+
+    def test_estimate_errors(self, delivery, monkeypatch):
+        def fail_estimate(image_data):
+            raise ZeroDivisionError('division by zero')
+        monkeypatch.setattr('avi_py.avi_jp2_preflight.estimate_jp2_memory', fail_estimate)
+        # a failure after the header read is this file's result rather than the whole chunk's
+        gray = preflight_tiff(delivery / 'box_1' / 'gray.tif')
+        assert gray['suitable'] is False
+        assert gray['message'] == 'ZeroDivisionError division by zero'
+
+    def test_no_icc_profile_needs_imagemagick(self, delivery):
+        no_icc_path = delivery / 'no_icc.tif'
+        Image.new('RGB', (400, 300)).save(no_icc_path)
+        no_icc = preflight_tiff(no_icc_path)
+        no_icc_path.unlink()
+        assert (no_icc['needs_icc_profile'], no_icc['icc_conversion']) == (True, 'imagemagick')
+        assert no_icc['suitable'] is (shutil.which('convert') is not None)
+
+    def test_iter_results(self, delivery):
+        preflight = AviJp2Preflight([delivery], max_workers=2, chunk_size=2)
+        results = preflight.process_all()
+
+        assert len(results) == 6
+        assert sorted(Path(result['src_file_path']).name for result in results if result['suitable']) == \
+            ['gray.tif', 'other_icc.tif', 'target_icc.tiff']
+        assert preflight.success is False
+        assert preflight.result == { 'success': False, 'message': '3 of 6 files suitable for jp2 conversion' }
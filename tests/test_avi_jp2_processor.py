@@ -1,12 +1,15 @@
 import logging
 import sys
 import json
+import os
 from tempfile import TemporaryDirectory, NamedTemporaryFile
 
 import pytest
+from PIL import Image, ImageCms
 
 from image_processing import conversion
 from image_processing.kakadu import Kakadu
+from avi_py import constants as avi_const
 from avi_py.avi_jp2_processor import AviJp2Processor
 from avi_py.avi_image_data import AviImageData
 
@@ -120,3 +123,68 @@ class TestAviJp2Convert:
 
         assert isinstance(no_icc_image_convert.json_result(), str)
         assert no_icc_image_convert.json_result() == json.dumps(no_icc_image_convert.result)
+
+    def test_convert_icc_profile_scratch_dir(self, temp_folder):
+        srgb_processor = AviJp2Processor(file_fixtures.SRGB_IMAGE, f'{temp_folder}/scratch-srgb.jp2', scratch_dir=temp_folder)
+
+        assert srgb_processor.scratch_dir == temp_folder
+
+        icc_converted_file = srgb_processor.convert_icc_profile()
+        try:
+            if icc_converted_file != file_fixtures.SRGB_IMAGE:
+                assert icc_converted_file.startswith(temp_folder)
+            with file_fixtures.image_fixture(icc_converted_file) as icc_converted:
+                assert icc_converted.info.get('icc_profile') is not None
+        finally:
+            if icc_converted_file != file_fixtures.SRGB_IMAGE:
+                os.unlink(icc_converted_file)
+
+    def test_can_stream_to_kakadu(self, temp_folder):
+        img = Image.effect_noise((64, 48), 64).convert('RGB')
+        other_icc_path, target_icc_path = f'{temp_folder}/stream-other-icc.tif', f'{temp_folder}/stream-target-icc.tif'
+        img.save(other_icc_path, icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+        img.save(target_icc_path, icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes())
+
+        stream_processor = AviJp2Processor(other_icc_path, f'{temp_folder}/stream.jp2', stream_to_kakadu=True)
+        assert stream_processor.stream_to_kakadu is True
+        assert stream_processor.can_stream_to_kakadu() is True
+        assert AviJp2Processor(target_icc_path, f'{temp_folder}/stream.jp2').can_stream_to_kakadu() is False
+        img.convert('RGBA').save(other_icc_path, icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes())
+        assert AviJp2Processor(other_icc_path, f'{temp_folder}/stream.jp2').can_stream_to_kakadu() is False
+
+    def test_target_size(self, temp_folder):
+        src_path = f'{temp_folder}/target-size.tif'
+        Image.effect_noise((2000, 1500), 64).convert('RGB').save(src_path, icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes())
+        pixels = 2000 * 1500
+
+        bpp_processor = AviJp2Processor.process_jp2(src_path, f'{temp_folder}/target-bpp.jp2', encoder='openjpeg',
+                                                    target_bytes_per_pixel=0.05)
+        assert bpp_processor.success is True, bpp_processor.result_message
+        assert bpp_processor.result['target_bits_per_pixel'] == 0.4
+        assert bpp_processor.result['layer_rates'][0] == 0.4
+        assert bpp_processor.result['bits_per_pixel'] <= 0.4 * (1 + avi_const.JP2_TARGET_TOLERANCE)
+
+        # the smaller of the two budgets is used
+        size_processor = AviJp2Processor.process_jp2(src_path, f'{temp_folder}/target-bytes.jp2', encoder='openjpeg',
+                                                     target_bytes_per_pixel=0.05, target_bytes=100_000)
+        assert size_processor.result['target_bits_per_pixel'] == round(100_000 * 8 / pixels, 4)
+        assert size_processor.result['output_bytes'] <= 100_000 * (1 + avi_const.JP2_TARGET_TOLERANCE)
+        assert size_processor.derivative_sidecar().settings != bpp_processor.derivative_sidecar().settings
+
+        default_processor = AviJp2Processor(src_path, f'{temp_folder}/target-none.jp2')
+        assert default_processor.image_data.target_bits_per_pixel is None
+        assert 'target_bits_per_pixel' not in default_processor.result
+
+    def test_target_size_overshoot_encodes_again(self, temp_folder, monkeypatch):
+        src_path = f'{temp_folder}/target-retry.tif'
+        Image.effect_noise((1200, 900), 64).convert('L').save(src_path)
+        # every jp2 is over a budget with a negative tolerance
+        monkeypatch.setattr(avi_const, 'JP2_TARGET_TOLERANCE', -0.5)
+        monkeypatch.setattr(avi_const, 'JP2_VERIFY', True)
+        processor = AviJp2Processor.process_jp2(src_path, f'{temp_folder}/target-retry.jp2', encoder='openjpeg',
+                                                target_bytes_per_pixel=0.1)
+        assert processor.success is True, processor.result_message
+        assert processor.result['target_bits_per_pixel'] == 0.8
+        # encoded again with the rates scaled by how far the first jp2 was from the budget
+        assert processor.result['layer_rates'][0] != 0.8
+        assert processor.result['jp2_mismatches'] == []
@@ -0,0 +1,140 @@
+import sys
+import logging
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image
+
+from avi_py import constants as avi_const
+from avi_py.avi_image_data import AviImageData
+from avi_py.avi_jp2_encoder import AviKakaduEncoder, AviOpenJpegEncoder
+from avi_py import avi_jp2_processor
+from avi_py.avi_jp2_processor import AviJp2Processor
+from avi_py.avi_jp2_verifier import AviJp2Structure, AviJp2VerifierError, verify_jp2
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+SIZE = (2500, 1800)
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_jp2_verifier', dir='/tmp') as temp_dir:
+        yield Path(temp_dir)
+
+@pytest.fixture(scope='module', name='encoded')
+def fixture_encoded(temp_folder):
+    src_path = temp_folder / 'source.tif'
+    Image.effect_noise(SIZE, 64).convert('RGB').save(src_path, icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes())
+    image_data = AviImageData(src_path)
+    jp2_path = temp_folder / 'source.jp2'
+    AviOpenJpegEncoder().encode(image_data, str(src_path), image_data.image_header, jp2_path)
+    return image_data, jp2_path
+
+def _damaged_copy(jp2_path, temp_folder, name, keep_bytes):
+    damaged_path = temp_folder / name
+    damaged_path.write_bytes(jp2_path.read_bytes()[:keep_bytes])
+    return damaged_path
+
+class TestAviJp2Verifier:
+    """
+    Tests for checking jp2s against their encoder options from their box and marker headers
+    """
+    def test_read_structure(self, encoded):
+        image_data, jp2_path = encoded
+        structure = AviJp2Structure.read(jp2_path)
+
+        assert (structure.width, structure.height, structure.components) == (*SIZE, 3)
+        assert structure.bits_per_component == (8, 8, 8)
+        assert (structure.tile_width, structure.tile_height, structure.tile_count) == (1024, 1024, 6)
+        assert structure.tile_part_count == 6
+        assert (structure.levels, structure.layers) == (image_data.level_count_for_size(), image_data.layer_count)
+        assert (structure.progression, structure.codeblock_size, structure.reversible) == ('RPCL', (64, 64), False)
+        assert structure.precincts == ()
+        assert (structure.colour_method, structure.colour_space, structure.icc_profile_bytes) == (1, 16, 0)
+        assert structure.has_plt is True and structure.uses_sop is False
+        assert structure.problems == ()
+
+    def test_verify_against_encoder_options(self, encoded):
+        image_data, jp2_path = encoded
+        expected = AviOpenJpegEncoder().expected_structure(image_data, image_data.image_header)
+        assert verify_jp2(jp2_path, expected) == []
+
+        expected['levels'] += 1
+        assert verify_jp2(jp2_path, expected) == [f'levels is {expected["levels"] - 1} not {expected["levels"]}']
+
+    def test_kakadu_expected_structure(self, encoded):
+        image_data, _ = encoded
+        expected = AviKakaduEncoder().expected_structure(image_data, image_data.image_header)
+        assert (expected['uses_sop'], expected['uses_eph'], expected['has_plt'], expected['progression']) == (True, True, True, 'RPCL')
+        # ORGtparts=R gives every tile a tile part per resolution
+        assert expected['tile_part_count'] == 6 * (image_data.level_count_for_size() + 1)
+        assert expected['precincts'] == ()
+
+        # the last of the Cprecincts is used for every lower resolution
+        iiif_expected = AviKakaduEncoder(profile='iiif-fast-read').expected_structure(image_data, image_data.image_header)
+        assert iiif_expected['precincts'] == ((128, 128),) * (image_data.level_count_for_size() - 1) + ((256, 256),) * 2
+
+    def test_openjpeg_precincts(self, encoded, temp_folder):
+        image_data, _ = encoded
+        image_data = AviImageData(image_data.image_src_path, tile_size=512)
+        encoder = AviOpenJpegEncoder(profile='iiif-fast-read')
+        jp2_path = temp_folder / 'precincts.jp2'
+        encoder.encode(image_data, str(image_data.image_src_path), image_data.image_header, jp2_path)
+
+        assert AviJp2Structure.read(jp2_path).precincts[-2:] == ((128, 128), (256, 256))
+        assert verify_jp2(jp2_path, encoder.expected_structure(image_data, image_data.image_header)) == []
+
+    def test_truncated_jp2(self, encoded, temp_folder):
+        _, jp2_path = encoded
+        jp2_bytes = jp2_path.stat().st_size
+
+        no_eoc = verify_jp2(_damaged_copy(jp2_path, temp_folder, 'no_eoc.jp2', jp2_bytes - 2), {})
+        assert no_eoc == ['Codestream is truncated after tile part 6', 'Codestream box runs 2 bytes past the end of the file']
+
+        half = AviJp2Structure.read(_damaged_copy(jp2_path, temp_folder, 'half.jp2', jp2_bytes // 2))
+        assert half.tile_part_count < 6
+        assert f'Codestream has tile parts for {half.tile_part_count} of 6 tiles' in half.problems
+
+        with pytest.raises(AviJp2VerifierError):
+            AviJp2Structure.read(_damaged_copy(jp2_path, temp_folder, 'header_only.jp2', 120))
+        assert verify_jp2(encoded[0].image_src_path, {}) == [f'AviJp2VerifierError {encoded[0].image_src_path} is not a jp2']
+
+    def test_damaged_headers(self, encoded, temp_folder):
+        _, jp2_path = encoded
+        jp2_bytes = jp2_path.read_bytes()
+
+        # a colour specification box cut down to two bytes
+        colr = jp2_bytes.index(b'colr') - 4
+        short_colr = temp_folder / 'short_colr.jp2'
+        short_colr.write_bytes(jp2_bytes[:colr] + (10).to_bytes(4, 'big') + jp2_bytes[colr + 4:])
+        with pytest.raises(AviJp2VerifierError, match='Colour specification box'):
+            AviJp2Structure.read(short_colr)
+
+        # a 0 pixel wide tile
+        tile_width = jp2_bytes.index(b'\xff\x51') + 22
+        zero_tile = temp_folder / 'zero_tile.jp2'
+        zero_tile.write_bytes(jp2_bytes[:tile_width] + bytes(4) + jp2_bytes[tile_width + 4:])
+        with pytest.raises(AviJp2VerifierError, match='0x1024 tile size'):
+            AviJp2Structure.read(zero_tile)
+        assert verify_jp2(zero_tile, {}) == ['AviJp2VerifierError Codestream SIZ marker has a 0x1024 tile size']
+
+    def test_processor_result(self, encoded, temp_folder, monkeypatch):
+        image_data, _ = encoded
+        monkeypatch.setattr(avi_const, 'JP2_VERIFY', True)
+        processor = AviJp2Processor.process_jp2(image_data.image_src_path, temp_folder / 'processor.jp2', encoder='openjpeg')
+        assert processor.success is True, processor.result_message
+        assert processor.result['jp2_mismatches'] == []
+        assert 'verify' in processor.result['timings']
+
+        # mismatches are reported, the jp2 is still written
+        monkeypatch.setattr(avi_jp2_processor, 'verify_jp2', lambda jp2_path, expected: ['levels is 4 not 5'])
+        mismatched = AviJp2Processor.process_jp2(image_data.image_src_path, temp_folder / 'mismatched.jp2', encoder='openjpeg')
+        assert mismatched.success is True, mismatched.result_message
+        assert mismatched.result['jp2_mismatches'] == ['levels is 4 not 5']
+        assert (temp_folder / 'mismatched.jp2').exists()
+
+        monkeypatch.setattr(avi_const, 'JP2_VERIFY', False)
+        unverified = AviJp2Processor.process_jp2(image_data.image_src_path, temp_folder / 'unverified.jp2', encoder='openjpeg')
+        assert 'jp2_mismatches' not in unverified.result
+        assert 'verify' not in unverified.result['timings']
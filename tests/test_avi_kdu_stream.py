@@ -0,0 +1,78 @@
+import os
+import sys
+import logging
+import textwrap
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image
+
+from avi_py.avi_kdu_stream import AviKduStream, AviKduStreamError
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+# Stands in for kakadu: copies the pnm it reads from -i to -o. -fail_after N exits with an error after reading N bytes
+FAKE_KDU_COMPRESS = textwrap.dedent('''\
+    #!{python}
+    import sys
+    args = sys.argv[1:]
+    input_path, output_path = args[args.index('-i') + 1], args[args.index('-o') + 1]
+    fail_after = int(args[args.index('-fail_after') + 1]) if '-fail_after' in args else None
+    if fail_after == 0:
+        print('Kakadu Error: bad option')
+        sys.exit(2)
+    with open(input_path, 'rb') as input_file, open(output_path, 'wb') as output_file:
+        data = input_file.read(fail_after) if fail_after else input_file.read()
+        output_file.write(data)
+    if fail_after:
+        print('Kakadu Error: failed mid stream')
+        sys.exit(1)
+    ''')
+
+@pytest.fixture(name='kakadu_dir')
+def fixture_kakadu_dir():
+    with TemporaryDirectory(prefix='avi_test_kdu_stream', dir='/tmp') as temp_dir:
+        with open(f'{temp_dir}/kdu_compress', 'w', encoding='utf-8') as kdu_file:
+            kdu_file.write(FAKE_KDU_COMPRESS.format(python=sys.executable))
+        os.chmod(f'{temp_dir}/kdu_compress', 0o755)
+        yield temp_dir
+
+def _bands(img, band_rows):
+    for top in range(0, img.height, band_rows):
+        band = img.crop((0, top, img.width, min(top + band_rows, img.height)))
+        yield band.tobytes(), band.height
+
+class TestAviKduStream:
+    """
+    Unit tests for streaming pnm data to kdu_compress through a named pipe
+    """
+    @pytest.mark.parametrize('mode', ['RGB', 'L'])
+    def test_compress(self, kakadu_dir, mode):
+        img = Image.effect_noise((257, 1031), 64).convert(mode)
+        dest_path = f'{kakadu_dir}/streamed.jp2'
+        AviKduStream(mode, img.size, kakadu_base_path=kakadu_dir, scratch_dir=kakadu_dir).compress(_bands(img, 100), dest_path, [])
+
+        with Image.open(dest_path) as streamed:
+            assert streamed.format == 'PPM'
+            assert streamed.mode == mode
+            assert streamed.tobytes() == img.tobytes()
+        assert sorted(os.listdir(kakadu_dir)) == ['kdu_compress', 'streamed.jp2']
+
+    def test_kakadu_errors(self, kakadu_dir):
+        img = Image.effect_noise((300, 300), 64).convert('RGB')
+        dest_path = f'{kakadu_dir}/streamed.jp2'
+        kdu_stream = AviKduStream('RGB', img.size, kakadu_base_path=kakadu_dir, open_timeout=10)
+
+        with pytest.raises(AviKduStreamError, match='bad option'):
+            kdu_stream.compress(_bands(img, 10), dest_path, ['-fail_after', '0'])
+        with pytest.raises(AviKduStreamError, match='failed mid stream'):
+            kdu_stream.compress(_bands(img, 10), dest_path, ['-fail_after', '1000'])
+        assert not os.path.exists(dest_path)
+
+        with pytest.raises(AviKduStreamError, match='Streamed 10 of 300 rows'):
+            kdu_stream.compress(_bands(img.crop((0, 0, 300, 10)), 10), dest_path, [])
+        assert not os.path.exists(dest_path)
+
+    def test_unsupported_mode(self):
+        with pytest.raises(AviKduStreamError):
+            AviKduStream('RGBA', (10, 10))
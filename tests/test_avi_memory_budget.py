@@ -0,0 +1,94 @@
+import sys
+import time
+import logging
+import threading
+
+import pytest
+
+from avi_py.avi_memory_budget import AviMemoryBudget, AviMemoryBudgetError
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+MB = 1024 * 1024
+
+class TestAviMemoryBudget:
+    """
+    Unit tests for admitting jobs while their estimated memory fits in a budget
+    """
+    def test_admits_while_under_budget(self):
+        budget = AviMemoryBudget(100 * MB)
+        for job, estimate in [('a', 40 * MB), ('b', 40 * MB), ('c', 40 * MB)]:
+            budget.request(job, estimate)
+
+        assert budget.admit() == ['a', 'b']
+        assert budget.reserved_bytes == 80 * MB
+        assert budget.admit() == []
+
+        budget.release('a')
+        assert budget.admit() == ['c']
+        assert budget.waiting_count == 0
+        assert budget.running_count == 2
+
+    def test_small_jobs_backfill_around_large_ones(self):
+        budget = AviMemoryBudget(100 * MB, max_bypass=2)
+        for job, estimate in [('running', 60 * MB), ('large', 50 * MB), ('small_1', 10 * MB), ('small_2', 10 * MB),
+                              ('small_3', 10 * MB)]:
+            budget.request(job, estimate)
+
+        assert budget.admit() == ['running', 'small_1', 'small_2']
+        # large has been passed max_bypass times, small_3 waits for it even though it fits
+        budget.release('small_1')
+        assert budget.admit() == []
+
+        budget.release('running')
+        assert budget.admit() == ['large', 'small_3']
+
+    def test_oversized_jobs_run_alone(self):
+        budget = AviMemoryBudget(100 * MB)
+        budget.request('small', 10 * MB)
+        budget.request('huge', 500 * MB)
+
+        assert budget.admit() == ['small']
+        budget.release('small')
+        assert budget.admit() == ['huge']
+        assert budget.reserved_bytes == 500 * MB
+
+    def test_max_running_and_no_budget(self):
+        budget = AviMemoryBudget(0, max_running=2)
+        for job in range(3):
+            budget.request(job, 10 ** 12)
+
+        assert budget.admit() == [0, 1]
+        budget.release(0)
+        assert budget.admit() == [2]
+
+        with pytest.raises(AviMemoryBudgetError):
+            AviMemoryBudget(-1)
+        with pytest.raises(AviMemoryBudgetError):
+            AviMemoryBudget(100 * MB, max_running=0)
+
+    def test_acquire_blocks_threads_until_admitted(self):
+        budget = AviMemoryBudget(100 * MB)
+        running, peak_reserved = [], []
+        lock = threading.Lock()
+
+        def run_job(estimate):
+            ticket = budget.acquire(estimate)
+            with lock:
+                running.append(estimate)
+                peak_reserved.append(sum(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(estimate)
+            budget.release(ticket)
+
+        threads = [threading.Thread(target=run_job, args=(estimate,)) for estimate in [60 * MB, 60 * MB, 30 * MB, 30 * MB, 150 * MB]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert not any(thread.is_alive() for thread in threads)
+        assert len(peak_reserved) == 5
+        assert all(reserved <= 100 * MB or reserved == 150 * MB for reserved in peak_reserved)
+        assert budget.running_count == 0
@@ -0,0 +1,78 @@
+import sys
+import logging
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image, ImageCms
+
+from avi_py import constants as avi_const
+from avi_py.avi_image_data import AviImageData
+from avi_py.avi_image_header import AviImageHeader
+from avi_py.avi_memory_estimate import estimate_jp2_memory, estimate_ocr_memory, estimate_command_memory, \
+    command_source
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+OTHER_ICC_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+# taller than the rows kakadu holds at once
+SIZE = (1000, 6000)
+
+@pytest.fixture(scope='module', name='temp_folder')
+def fixture_temp_folder():
+    with TemporaryDirectory(prefix='avi_test_memory_estimate', dir='/tmp') as temp_dir:
+        yield temp_dir
+
+def _tiff(temp_folder, name, mode='RGB', **save_options):
+    src_path = f'{temp_folder}/{name}.tif'
+    Image.new(mode, SIZE).save(src_path, **save_options)
+    return src_path
+
+class TestAviMemoryEstimate:
+    """
+    Unit tests for the header only memory estimates of jp2 and OCR jobs
+    """
+    def test_jp2_without_icc_conversion(self, temp_folder):
+        gray_data = AviImageData(_tiff(temp_folder, 'gray', 'L'))
+        target_data = AviImageData(_tiff(temp_folder, 'target', icc_profile=avi_const.ICC_PROFILE_PATH.read_bytes()))
+
+        assert gray_data.pixel_bytes == SIZE[0] * SIZE[1]
+        assert target_data.pixel_bytes == SIZE[0] * SIZE[1] * 3
+        assert target_data.needs_icc_conversion() is False
+        assert estimate_jp2_memory(gray_data) == avi_const.JOB_BASE_MEMORY_BYTES + SIZE[0] * 4 * avi_const.KDU_MEMORY_ROWS
+        assert estimate_jp2_memory(target_data) == avi_const.JOB_BASE_MEMORY_BYTES + SIZE[0] * 3 * 4 * avi_const.KDU_MEMORY_ROWS
+        # pillow decodes the whole image for openjpeg, which holds one tile
+        assert estimate_jp2_memory(target_data, encoder='openjpeg') == avi_const.JOB_BASE_MEMORY_BYTES + SIZE[0] * SIZE[1] * 4 + \
+            avi_const.KDU_DEFAULT_TILE_SIZE ** 2 * 3 * 4 * 2
+
+    def test_jp2_icc_conversion_paths(self, temp_folder):
+        strip_data = AviImageData(_tiff(temp_folder, 'strips', icc_profile=OTHER_ICC_PROFILE))
+        whole_data = AviImageData(_tiff(temp_folder, 'lzw', icc_profile=OTHER_ICC_PROFILE, compression='tiff_lzw'))
+        magick_data = AviImageData(_tiff(temp_folder, 'no_icc'))
+        assert strip_data.needs_icc_conversion() is True
+
+        # loading the whole image costs more than bands, adding a profile with imagemagick more still
+        assert estimate_jp2_memory(strip_data, stream_to_kakadu=False) < estimate_jp2_memory(whole_data)
+        assert estimate_jp2_memory(whole_data) < estimate_jp2_memory(magick_data)
+        # streaming runs the bands and kakadu at the same time
+        assert estimate_jp2_memory(strip_data, stream_to_kakadu=True) > estimate_jp2_memory(strip_data, stream_to_kakadu=False)
+
+    def test_ocr(self, temp_folder):
+        gray_header = AviImageHeader.read(_tiff(temp_folder, 'page_gray', 'L'))
+        color_header = AviImageHeader.read(_tiff(temp_folder, 'page_color'))
+        assert avi_const.JOB_BASE_MEMORY_BYTES < estimate_ocr_memory(gray_header) < estimate_ocr_memory(color_header)
+
+    def test_command(self, temp_folder):
+        src_path = _tiff(temp_folder, 'command', 'L')
+        assert estimate_command_memory('avi_jp2_convert', ['--incremental', src_path, f'{temp_folder}/out.jp2']) == \
+            estimate_jp2_memory(AviImageData(src_path))
+        assert estimate_command_memory('avi_ocr', [src_path]) == estimate_ocr_memory(AviImageHeader.read(src_path))
+        assert estimate_command_memory('avi_jp2_convert', ['/tmp/avi_py_missing_image.tif', 'out.jp2']) == avi_const.JOB_BASE_MEMORY_BYTES
+        assert estimate_command_memory('avi_ffmpeg_mp3', ['in.wav', 'out.mp3']) == avi_const.JOB_BASE_MEMORY_BYTES
+
+        # option values aren't taken for the source
+        assert command_source(['-Lf', 'avi.log', '--log_level', 'info', src_path, 'out.jp2']) == src_path
+        assert command_source(['--incremental', '--tess_langs', 'eng+fra', src_path]) == src_path
+        assert command_source(['--target_bpp', '0.5', '--target_bytes', '1000', src_path, 'out.jp2']) == src_path
+        assert command_source(['--batch', 'manifest.txt']) is None
+        assert estimate_command_memory('avi_ocr', ['-Lf', f'{temp_folder}/avi.log', src_path]) == \
+            estimate_ocr_memory(AviImageHeader.read(src_path))
@@ -0,0 +1,67 @@
+import logging
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from avi_py.avi_metrics import AviStageTimer, timed_stage, file_size, record_prometheus_metrics
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+@pytest.fixture(name='textfile_path')
+def fixture_textfile_path():
+    with TemporaryDirectory(prefix='avi_test_metrics', dir='/tmp') as temp_dir:
+        yield f'{temp_dir}/collector/avi_py.prom'
+
+def _samples(textfile_path):
+    with open(textfile_path, 'r', encoding='utf-8') as textfile:
+        return dict(line.rsplit(' ', 1) for line in textfile.read().splitlines() if not line.startswith('#'))
+
+class TestAviMetrics:
+    """
+    Unit tests for the stage timer and the prometheus textfile
+    """
+    def test_stage_timer(self):
+        timer = AviStageTimer()
+        with timer.stage('outer'):
+            time.sleep(0.02)
+            with timer.stage('inner'):
+                time.sleep(0.05)
+        with timed_stage(None, 'ignored'):
+            pass
+        assert timer.stopped is False
+
+        timer.stop()
+        timings = timer.timings()
+        assert timer.stopped is True
+        assert set(timings) == {'outer', 'inner', 'total'}
+        assert 0.015 <= timings['outer'] < 0.05
+        assert timings['inner'] >= 0.045
+        assert timings['total'] >= timings['outer'] + timings['inner']
+        assert timer.timings() == timings
+
+    def test_file_size(self, textfile_path):
+        assert file_size(None) == 0
+        assert file_size(textfile_path) == 0
+        assert file_size(__file__) > 0
+
+    def test_record_prometheus_metrics(self, textfile_path):
+        result = { 'success': True, 'message': '', 'input_bytes': 1000, 'output_bytes': 100,
+                   'timings': {'kdu_compress': 1.5, 'header': 0.25, 'total': 2.0} }
+        record_prometheus_metrics('jp2', result, textfile_path)
+        record_prometheus_metrics('jp2', result, textfile_path)
+        record_prometheus_metrics('jp2', { **result, 'success': False }, textfile_path)
+        record_prometheus_metrics('jp2', { 'success': True, 'message': '' }, textfile_path)
+
+        samples = _samples(textfile_path)
+        assert samples['avi_py_derivatives_total{skipped="false",success="true",type="jp2"}'] == '2.0'
+        assert samples['avi_py_derivatives_total{skipped="false",success="false",type="jp2"}'] == '1.0'
+        assert samples['avi_py_stage_seconds_total{stage="kdu_compress",type="jp2"}'] == '4.5'
+        assert samples['avi_py_input_bytes_total{type="jp2"}'] == '2000.0'
+        assert samples['avi_py_output_bytes_total{type="jp2"}'] == '200.0'
+        assert samples['avi_py_last_duration_seconds{type="jp2"}'] == '2.0'
+
+    def test_record_prometheus_metrics_disabled(self, textfile_path):
+        record_prometheus_metrics('jp2', { 'success': True, 'timings': {'total': 1.0} }, None)
+        assert file_size(textfile_path) == 0
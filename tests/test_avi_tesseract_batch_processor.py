@@ -0,0 +1,62 @@
+import logging
+import sys
+import os
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from avi_py.avi_tesseract_batch_processor import AviTesseractBatchProcessor, omp_threads_for_pool
+from avi_py import constants as avi_const
+
+from . import file_fixtures
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+@pytest.fixture(scope='module', name='page_folder')
+def fixture_page_folder():
+    with TemporaryDirectory(prefix='avi_test_ocr_batch', dir='/tmp') as temp_dir:
+        for page in range(3):
+            shutil.copy(file_fixtures.OCR_IMAGE, Path(temp_dir) / f'page_{page}.tif')
+        print(f'Created temp pages at {temp_dir}')
+        yield temp_dir
+
+class TestAviTesseractBatchProcessor:
+    """
+    Tests for running OCR over a batch of pages with the AviTesseractBatchProcessor class
+    """
+    def test_omp_threads_for_pool(self):
+        assert omp_threads_for_pool(1) == os.cpu_count()
+        assert omp_threads_for_pool(os.cpu_count() * 2) == 1
+        assert omp_threads_for_pool(0) == os.cpu_count()
+
+    def test_batch_ocr(self, page_folder):
+        ocr_batch = AviTesseractBatchProcessor.from_manifest(page_folder, max_workers=2, replace_if_exists=True)
+
+        assert ocr_batch.max_workers == 2
+        assert ocr_batch.omp_thread_limit == omp_threads_for_pool(2)
+        assert ocr_batch.tess_options == (avi_const.TESS_DEFAULT_LANG, avi_const.TESS_DEFAULT_CFG, True, True, avi_const.TESS_SINGLE_PASS,
+                                          avi_const.INCREMENTAL)
+
+        results = list(ocr_batch.iter_results())
+        assert len(results) == 3
+        for result in results:
+            assert all(key in result for key in ['success', 'message', 'src_file_path'])
+            assert result['success'] is True
+            src_path = Path(result['src_file_path'])
+            assert (src_path.parent / f'{src_path.stem}.pdf').exists()
+            assert (src_path.parent / f'{src_path.stem}.xml').exists()
+
+        assert ocr_batch.success is True
+        assert ocr_batch.result == { 'success': True, 'message': '3 of 3 files processed successfully' }
+
+    def test_batch_ocr_missing_page(self, page_folder, tmp_path):
+        manifest_path = tmp_path / 'manifest.txt'
+        manifest_path.write_text(f'{Path(page_folder) / "page_0.tif"}\n/tmp/avi_py_missing_page.tif\n', encoding='utf-8')
+        ocr_batch = AviTesseractBatchProcessor.from_manifest(manifest_path)
+
+        results = ocr_batch.process_all()
+        assert ocr_batch.max_workers == min(2, avi_const.TESS_BATCH_MAX_WORKERS)
+        assert sorted(result['success'] for result in results) == [False, True]
+        assert ocr_batch.success is False
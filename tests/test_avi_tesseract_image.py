@@ -1,3 +1,4 @@
+import io
 import logging
 import sys
 from pathlib import Path
@@ -8,7 +9,7 @@ import pytest
 import numpy as np
 
 from PIL import Image
-from avi_py.avi_tesseract_image import AviTesseractImage
+from avi_py.avi_tesseract_image import AviTesseractImage, encode_for_tesseract
 from . import file_fixtures
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -30,10 +31,40 @@ class TestAviTesseractImage:
         assert isinstance(ocr_tesseract_image, AviTesseractImage)
         assert isinstance(ocr_tesseract_image.image_src_path, Path)
         assert str(ocr_tesseract_image.image_src_path) == file_fixtures.OCR_IMAGE
-        assert isinstance(ocr_tesseract_image._temp_directory, TemporaryDirectory)
         assert isinstance(ocr_tesseract_image.preprocess_image(), np.ndarray)
 
     def test_avi_tesseract_image_with_stmnt(self, ocr_tesseract_image_ctx):
         assert isinstance(ocr_tesseract_image_ctx, np.ndarray)
         tess_img = Image.fromarray(ocr_tesseract_image_ctx, mode='L')
         assert tess_img.mode == 'L'
+
+    def test_avi_tesseract_image_grayscaled_threshold(self, ocr_tesseract_image):
+        pre_processed_img = ocr_tesseract_image.preprocess_image()
+        assert pre_processed_img.ndim == 2
+        assert pre_processed_img.dtype == np.uint8
+        assert set(np.unique(pre_processed_img)).issubset({0, 255})
+        with file_fixtures.image_fixture(file_fixtures.OCR_IMAGE) as ocr_img:
+            assert pre_processed_img.shape == (ocr_img.height, ocr_img.width)
+
+    def test_avi_tesseract_image_preprocessed_bytes(self, ocr_tesseract_image):
+        pre_processed_img = ocr_tesseract_image.preprocess_image()
+        image_bytes = ocr_tesseract_image.preprocessed_bytes()
+        assert image_bytes == encode_for_tesseract(pre_processed_img)
+        with Image.open(io.BytesIO(image_bytes)) as tess_img:
+            assert tess_img.mode == '1'
+            assert tess_img.info['compression'] == 'group4'
+            assert np.array_equal(np.asarray(tess_img.convert('L')), pre_processed_img)
+
+    def test_avi_tesseract_image_sixteen_bit(self):
+        # dark text on a light page, both well above 255 as 16 bit samples
+        page = np.full((120, 200), 60000, dtype=np.uint16)
+        page[40:80, 50:150] = 10000
+        with TemporaryDirectory(prefix='avi_test_tess_16_bit', dir='/tmp') as temp_dir:
+            src_path = f'{temp_dir}/page16.tif'
+            Image.fromarray(page, mode='I;16').save(src_path)
+            with Image.open(src_path) as page_img:
+                assert page_img.mode == 'I;16'
+            pre_processed_img = AviTesseractImage(src_path).preprocess_image()
+        assert pre_processed_img.dtype == np.uint8
+        assert (pre_processed_img[40:80, 50:150] == 0).all()
+        assert pre_processed_img[:40].min() == 255
@@ -46,6 +46,7 @@ class TestAviTesseractProcessor:
         assert isinstance(avi_tesseract_processor.tesseract_langs, str)
         assert isinstance(avi_tesseract_processor.tesseract_config, str)
         assert isinstance(avi_tesseract_processor.replace_if_exists, bool)
+        assert isinstance(avi_tesseract_processor.single_pass, bool)
         assert isinstance(avi_tesseract_processor.success, bool)
         assert isinstance(avi_tesseract_processor.result_message, str)
         assert isinstance(avi_tesseract_processor.result, dict)
@@ -59,6 +60,7 @@ class TestAviTesseractProcessor:
         assert avi_tesseract_processor.tesseract_langs == avi_const.TESS_DEFAULT_LANG
         assert avi_tesseract_processor.tesseract_config == avi_const.TESS_DEFAULT_CFG
         assert avi_tesseract_processor.replace_if_exists is False
+        assert avi_tesseract_processor.single_pass == avi_const.TESS_SINGLE_PASS
         assert avi_tesseract_processor.success is False
         assert avi_tesseract_processor.result_message == ''
         assert avi_tesseract_processor.result == { 'success': False, 'message': '' }
@@ -69,7 +71,39 @@ class TestAviTesseractProcessor:
         assert processed_ocr.success is True
         expected_result_message =  f'Successfully created OCR pdf/xml files at {processed_ocr.image_src_path.parent}'
         assert processed_ocr.result_message == expected_result_message
-        assert processed_ocr.result == { 'success': True, 'message': expected_result_message }
-        assert processed_ocr.json_result() == json.dumps({ 'success': True, 'message': expected_result_message })
+        assert { key: processed_ocr.result[key] for key in ['success', 'message'] } == { 'success': True, 'message': expected_result_message }
+        assert processed_ocr.json_result() == json.dumps(processed_ocr.result)
+        assert set(processed_ocr.result['timings']) >= {'preprocess', 'tesseract', 'total'}
+        assert processed_ocr.result['input_bytes'] == Path(processed_ocr.image_src_path).stat().st_size
+        assert processed_ocr.result['output_bytes'] > 0
         assert processed_ocr.has_pdf() is True
         assert processed_ocr.has_mets_alto() is True
+
+    def test_process_batch_ocr_single_and_two_pass(self, ocr_file):
+        for single_pass in [True, False]:
+            processed_ocr = AviTesseractProcessor.process_batch_ocr(ocr_file, replace_if_exists=True, single_pass=single_pass)
+            assert processed_ocr.single_pass is single_pass
+            assert processed_ocr.success is True
+            assert processed_ocr.has_pdf() is True
+            assert processed_ocr.has_mets_alto() is True
+
+    def test_process_batch_ocr_single_pass_alto_only(self, ocr_file):
+        processed_ocr = AviTesseractProcessor.process_batch_ocr(ocr_file, generate_searchable_pdf=False, single_pass=True)
+        assert processed_ocr.success is True
+        assert processed_ocr.has_pdf() is False
+        assert processed_ocr.has_mets_alto() is True
+
+    def test_process_batch_ocr_incremental(self, ocr_file):
+        first_run = AviTesseractProcessor.process_batch_ocr(ocr_file, incremental=True)
+        assert first_run.success is True
+        assert 'skipped' not in first_run.result
+        assert first_run.derivative_sidecar('pdf').is_current() is True
+        assert first_run.derivative_sidecar('alto').is_current() is True
+
+        second_run = AviTesseractProcessor.process_batch_ocr(ocr_file, incremental=True)
+        assert second_run.result['skipped'] is True
+        assert second_run.result_message == f'OCR files for {ocr_file} are up to date. Skipped'
+
+        two_pass = AviTesseractProcessor(ocr_file, single_pass=False, incremental=True)
+        assert two_pass.should_generate_pdf() is True
+        assert two_pass.should_generate_mets_alto() is True
@@ -108,3 +108,16 @@ class TestAviVideoData:
             assert bool(audio_stream) is True
             assert isinstance(audio_stream, dict)
         assert isinstance(mp4_video_data.ss_time(), int)
+
+    def test_lazy_mov_video_data(self):
+        lazy_video_data = AviVideoData(file_fixtures.MOV_VIDEO, use_cache=False, lazy=True)
+
+        assert isinstance(lazy_video_data.ffprobe_entries, dict)
+        assert 'duration' in lazy_video_data.ffprobe_format.keys()
+        assert bool(lazy_video_data.video_stream) is True
+        assert set(lazy_video_data.video_stream.keys()).issubset({'index', 'codec_type', 'codec_name', 'width', 'height', 'disposition', 'tags'})
+        assert lazy_video_data.ss_time() == get_video_data(file_fixtures.MOV_VIDEO).ss_time()
+
+        for key in ['format', 'streams']:
+            assert key in lazy_video_data.ffmpeg_probe.keys()
+        assert lazy_video_data.ffprobe_entries is lazy_video_data.ffmpeg_probe
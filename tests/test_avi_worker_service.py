@@ -0,0 +1,107 @@
+import logging
+import sys
+import os
+import time
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+import pytest
+from PIL import Image
+
+from avi_py.avi_worker_service import AviWorkerService, AviWorkerServiceError
+from avi_py.avi_worker_client import AviWorkerClient
+from avi_py import constants as avi_const
+from avi_py.entry_points import run_entry_point
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+def _fake_job_runner(command: str, args: list, kdu_num_threads: int=None) -> dict:
+    parser = ArgumentParser(prog=command)
+    parser.add_argument('src_file_path')
+    parser.add_argument('--sleep', type=float, default=0)
+    parser.add_argument('--fail', action='store_true')
+    parsed = parser.parse_args(args)
+    time.sleep(parsed.sleep)
+    if parsed.fail:
+        raise RuntimeError(f'{parsed.src_file_path} is not an image')
+    return { 'success': True, 'message': f'{command} {parsed.src_file_path}', 'pid': os.getpid(), 'kdu_num_threads': kdu_num_threads }
+
+@pytest.fixture(scope='module', name='worker_service')
+def fixture_worker_service():
+    with TemporaryDirectory(prefix='avi_test_service', dir='/tmp') as temp_dir:
+        worker_service = AviWorkerService(_fake_job_runner, f'{temp_dir}/avi_py.sock', max_jobs=2)
+        service_thread = threading.Thread(target=worker_service.serve_forever, daemon=True)
+        service_thread.start()
+        for _ in range(100):
+            if worker_service.socket_path.exists():
+                break
+            time.sleep(0.1)
+        yield worker_service
+        worker_service.shutdown()
+        service_thread.join(timeout=10)
+
+class TestAviWorkerService:
+    """
+    Tests for the AviWorkerService and AviWorkerClient classes
+    """
+    def test_client_round_trip(self, worker_service):
+        client = AviWorkerClient(worker_service.socket_path, timeout=30)
+        result = client.run('avi_jp2_convert', ['/tmp/src.tif'])
+
+        assert result['success'] is True
+        assert result['message'] == 'avi_jp2_convert /tmp/src.tif'
+        assert result['pid'] != os.getpid()
+
+    def test_usage_and_command_errors(self, worker_service):
+        client = AviWorkerClient(worker_service.socket_path, timeout=30)
+
+        usage_result = client.run('avi_ocr', [])
+        assert usage_result['success'] is False
+        assert 'usage: avi_ocr' in usage_result['message']
+
+        assert client.run('rm', ['-rf', '/'])['success'] is False
+        assert worker_service.run('avi_ocr', [1, 2])['success'] is False
+
+    def test_unhandled_job_errors(self, worker_service):
+        client = AviWorkerClient(worker_service.socket_path, timeout=30)
+        # the processor's exception comes back as a failed result instead of closing the connection
+        assert client.run('avi_jp2_convert', ['/tmp/src.txt', '--fail']) == {
+            'success': False, 'message': 'RuntimeError /tmp/src.txt is not an image' }
+        assert client.run('avi_jp2_convert', ['/tmp/src.tif'])['success'] is True
+
+    def test_concurrent_jobs(self, worker_service):
+        client = AviWorkerClient(worker_service.socket_path, timeout=30)
+        with ThreadPoolExecutor(max_workers=4) as client_threads:
+            results = list(client_threads.map(lambda page: client.run('avi_ocr', [f'/tmp/page_{page}.tif', '--sleep', '0.5']), range(4)))
+
+        assert all(result['success'] for result in results)
+        assert len({result['pid'] for result in results}) <= worker_service.max_jobs
+
+    def test_missing_service(self):
+        with pytest.raises(OSError):
+            AviWorkerClient('/tmp/avi_py_missing_service.sock').run('avi_ocr', ['/tmp/page.tif'])
+
+        with pytest.raises(AviWorkerServiceError):
+            AviWorkerService(_fake_job_runner, max_jobs=0)
+
+    def test_run_entry_point(self):
+        result = run_entry_point('avi_ffmpeg_mp3', ['/tmp/avi_py_missing_audio.wav', '/tmp/avi_py_missing_audio.mp3'])
+        assert result['success'] is False
+        assert 'avi_py_missing_audio.wav' in result['message']
+
+        assert run_entry_point('avi_ocr', ['--batch', '/tmp'])['success'] is False
+        assert run_entry_point('avi_unknown', [])['success'] is False
+
+    def test_run_entry_point_jp2_profile(self, monkeypatch, tmp_path):
+        # a bad AVI_JP2_PROFILE is the conversion's failure, not the worker's
+        monkeypatch.setattr(avi_const, 'JP2_PROFILE', 'fastest')
+        result = run_entry_point('avi_jp2_convert', ['/tmp/avi_py_missing_image.tif', '/tmp/avi_py_missing_image.jp2'])
+        assert result['success'] is False
+        assert result['message'].startswith('Unknown jp2 profile fastest')
+
+        monkeypatch.setattr(avi_const, 'JP2_PROFILE', 'archival')
+        Image.new('L', (400, 300)).save(tmp_path / 'page.tif')
+        result = run_entry_point('avi_jp2_convert', ['--target_bytes', '-1', str(tmp_path / 'page.tif'), str(tmp_path / 'page.jp2')])
+        assert result == { 'success': False, 'message': 'target_bytes must be 0 or more not -1' }
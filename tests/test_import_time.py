@@ -0,0 +1,91 @@
+import re
+import sys
+import subprocess
+from pathlib import Path
+from typing import Tuple, Set
+
+import pytest
+
+from avi_py import constants as avi_const
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+# Budgets are for the imports a script makes after interpreter start up, in milliseconds. They are a few times the
+# measured cost so only a real regression (eg. a heavy module imported at the top of entry_points) trips them
+SCRIPT_IMPORT_BUDGETS_MS = {
+    'avi_client_main': 60,
+    'ffmpeg_mp3_main': 250,
+    'ffmpeg_thumbnail_main': 250,
+    'convert_jp2_main': 400,
+    'tesseract_ocr_main': 600,
+}
+# the default run only fails on imports this many times over budget, loose enough for slow and cold CI machines
+LOOSE_BUDGET_FACTOR = 5
+SCRIPT_ARGS = {
+    'avi_client_main': ['--socket', '/tmp/avi_py_missing_service.sock', 'avi_ocr', '/tmp/avi_py_missing_page.tif'],
+    'ffmpeg_mp3_main': ['/tmp/avi_py_missing_audio.wav', '/tmp/avi_py_missing_audio.mp3'],
+    'ffmpeg_thumbnail_main': ['/tmp/avi_py_missing_video.mov', '/tmp/avi_py_missing_video.jpg'],
+    'convert_jp2_main': ['/tmp/avi_py_missing_image.tif', '/tmp/avi_py_missing_image.jp2'],
+    'tesseract_ocr_main': ['/tmp/avi_py_missing_page.tif'],
+}
+HEAVY_MODULES = {'cv2', 'numpy', 'pytesseract', 'image_processing', 'dill'}
+SCRIPT_FORBIDDEN_MODULES = {
+    'avi_client_main': HEAVY_MODULES | {'PIL', 'ffmpeg', 'multiprocessing'},
+    'ffmpeg_mp3_main': HEAVY_MODULES,
+    'ffmpeg_thumbnail_main': HEAVY_MODULES,
+    'convert_jp2_main': HEAVY_MODULES - {'image_processing'},
+}
+
+def _import_times(code: str) -> Tuple[dict, Set[str]]:
+    """
+    Top level import -> cumulative import time in microseconds and every module imported for python -X importtime -c code
+    """
+    import_run = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=str(avi_const.PROJECT_ROOT),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    import_times, imported = {}, set()
+    for line in import_run.stderr.decode('utf-8').splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        imported.add(match.group(4))
+        if not match.group(3):
+            import_times[match.group(4)] = import_times.get(match.group(4), 0) + int(match.group(2))
+    return import_times, imported
+
+def _script_import_times(script_main: str, log_file: Path) -> Tuple[dict, Set[str]]:
+    argv = ['avi_py'] + SCRIPT_ARGS[script_main]
+    if script_main != 'avi_client_main':
+        argv += ['-Lf', str(log_file)]
+    _, startup_modules = _import_times('pass')
+    # run the script until it fails on the missing source so every import it needs for real work has happened
+    script_times, imported = _import_times(f'import sys; sys.argv = {argv!r}\nfrom avi_py import {script_main}\n'
+                                 f'try:\n    {script_main}()\nexcept SystemExit:\n    pass')
+    return { module: usec for module, usec in script_times.items() if module not in startup_modules }, imported - startup_modules
+
+class TestImportTime:
+    """
+    Start up budget for each of the bin scripts
+    """
+    def test_package_import_is_lazy(self):
+        _, imported = _import_times('import avi_py')
+        assert 'avi_py' in imported
+        assert not any(module.startswith('avi_py.') for module in imported)
+
+    @pytest.mark.parametrize('script_main', sorted(SCRIPT_ARGS))
+    def test_script_imports(self, script_main, tmp_path):
+        import_times, imported = _script_import_times(script_main, tmp_path / 'avi_py.log')
+
+        assert 'avi_py.entry_points' in imported
+        assert not {module.split('.')[0] for module in imported} & SCRIPT_FORBIDDEN_MODULES.get(script_main, set())
+        total_ms = sum(import_times.values()) / 1000
+        assert total_ms <= LOOSE_BUDGET_FACTOR * SCRIPT_IMPORT_BUDGETS_MS[script_main], f'{script_main} imports took {total_ms:.0f}ms: {import_times}'
+
+    # the exact wall clock budgets depend on the machine and its caches, so they only run with pytest -m benchmark
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize('script_main', sorted(SCRIPT_IMPORT_BUDGETS_MS))
+    def test_script_import_budget(self, script_main, tmp_path):
+        import_times, _ = _script_import_times(script_main, tmp_path / 'avi_py.log')
+
+        total_ms = sum(import_times.values()) / 1000
+        print(f'{script_main} imports took {total_ms:.0f}ms')
+        assert total_ms <= SCRIPT_IMPORT_BUDGETS_MS[script_main], f'{script_main} imports took {total_ms:.0f}ms: {import_times}'